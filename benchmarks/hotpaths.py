@@ -0,0 +1,200 @@
+"""
+Micro-benchmarks for hot paths. Runs offline: docstring extraction is stubbed,
+so no LLM is called.
+
+Run from repo root & compare with a previous run:
+```
+(.venv) llm_tool % python benchmarks/hotpaths.py --output bench.json
+(.venv) llm_tool % python benchmarks/hotpaths.py --compare bench.json
+```
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from datetime import datetime
+from docextractor import DocExtractor
+from llmclient import LLMClient
+from llmtoolutil import _LLMToolUtil
+from tracing import tracer
+
+
+class StubDocExtractor(DocExtractor):
+    """
+    Extract summary & args from `arg -- description` docstrings, without
+    calling the LLM.
+    """
+    def get_func_details(self, doc:str) -> dict:
+        (summary, _, rest) = doc.partition('\n\n')
+        args = dict(re.findall(r'^(\w+) -- (.*)$', rest, re.MULTILINE))
+        args.pop('returns', None)
+        return { 'summary': summary, 'args': args }
+
+
+def make_tool(i:int) -> callable:
+    """
+    Create uniquely named tool with a few typed & documented arguments.
+    """
+    namespace = {}
+    exec(f'''
+def tool_{i}(city:str, days:int, metric:bool = True) -> dict:
+    """
+    Returns the forecast #{i} for a city.
+
+    city -- Name of the city. ex: London
+    days -- Number of days to forecast
+    metric -- Use metric units (default True)
+    """
+    return {{ 'city': city, 'days': days, 'metric': metric }}
+''', namespace)
+    return namespace[f'tool_{i}']
+
+
+def make_registry(n:int) -> _LLMToolUtil:
+    """
+    Registry with `n` tools.
+    """
+    registry = _LLMToolUtil(StubDocExtractor())
+    for i in range(n):
+        registry.llm_tool(make_tool(i))
+    return registry
+
+
+def make_client(history:int) -> LLMClient:
+    """
+    LLM client with `history` messages, alternating user & assistant.
+    """
+    client = LLMClient(url='', model='llama-3.1-70b-versatile', system_message='x' * 2000,
+                       model_options={ 'temperature': 0.1 }, addn_headers={ 'Authorization': 'Bearer x' })
+    for i in range(history):
+        client.messages.append({ 'role': 'user' if i % 2 == 0 else 'assistant', 'content': f'Message {i} ' * 20 })
+    return client
+
+
+def benchmarks() -> dict:
+    """
+    Benchmarks by name. Each is a function to time, per call.
+    """
+    tool_call = '{"name": "tool_0", "parameters": {"city": "London", "days": "3", "metric": "true"}}'
+    fenced = f'```json\n{tool_call}\n```'
+    prose = f'Let me look that up for you. {tool_call} One moment.'
+    answer = 'George Washington was the first president of the United States. ' * 20
+
+    registry_1 = make_registry(1)
+    registry_100 = make_registry(100)
+    tools_100 = [make_tool(i) for i in range(100)]
+
+    benches = {}
+
+    def register_100():
+        registry = _LLMToolUtil(registry_1._doc_extraction)
+        for tool in tools_100:
+            registry.llm_tool(tool)
+    benches['llm_tool register (100 tools)'] = register_100
+
+    for n in (10, 100, 1000):
+        registry = make_registry(n)
+        benches[f'generate_tool_markup ({n} tools)'] = registry.generate_tool_markup
+        benches[f'render_tool_markup compact ({n} tools)'] = lambda registry=registry: registry.render_tool_markup('compact')
+
+    for (name, response) in [('json', tool_call), ('fenced', fenced), ('prose', prose), ('answer', answer)]:
+        benches[f'is_tool_call ({name})'] = lambda response=response: registry_100.is_tool_call(response)
+    benches['can_handle_tool_call (100 tools)'] = lambda: registry_100.can_handle_tool_call(tool_call)
+    benches['handle_tool_call dispatch (100 tools)'] = lambda: registry_100.handle_tool_call(tool_call)
+
+    for (value, to) in [('42', int), ('3.14', float), ('true', bool), ('2024-09-16', datetime)]:
+        benches[f'_convert_type ({to.__name__})'] = lambda value=value, to=to: registry_1._convert_type(value, to)
+
+    for history in (10, 100, 1000):
+        client = make_client(history)
+        benches[f'LLMClient request payload ({history} messages)'] = lambda client=client: json.dumps(client._request_payload()[1])
+
+    def disabled_span():
+        with tracer.span('tool.call', tool='tool_0'):
+            pass
+    benches['tracer.span (disabled)'] = disabled_span
+
+    return benches
+
+
+def measure(func:callable, repeat:int, min_time:float) -> dict:
+    """
+    Time function. The number of calls per sample is chosen so that each
+    sample takes at least `min_time` seconds.
+
+    returns -- Dictionary of per call statistics in microseconds
+    """
+    timer = timeit.Timer(func)
+    (number, _) = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    samples = [t / number * 1e6 for t in timer.repeat(repeat=repeat, number=number)]
+
+    return {
+        'calls_per_sample': number,
+        'samples': repeat,
+        'min_us': min(samples),
+        'median_us': statistics.median(samples),
+        'mean_us': statistics.fmean(samples),
+        'stdev_us': statistics.stdev(samples) if repeat > 1 else 0.0,
+    }
+
+
+def git_commit() -> str | None:
+    """
+    Current git commit, if available.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        return None
+
+
+
+#######
+# Run #
+#######
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run hot path micro-benchmarks.')
+    parser.add_argument('--repeat', type=int, default=7, help='Samples per benchmark')
+    parser.add_argument('--min-time', type=float, default=0.05, help='Minimum seconds per sample')
+    parser.add_argument('--filter', default='', help='Only run benchmarks containing this text')
+    parser.add_argument('--output', help='Write results as JSON to file')
+    parser.add_argument('--compare', help='Previous results JSON to compare medians against')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+    results = {}
+    for (name, func) in benchmarks().items():
+        if args.filter not in name:
+            continue
+
+        results[name] = stats = measure(func, args.repeat, args.min_time)
+        line = f"{name:<48} {stats['median_us']:>12.2f} us ± {stats['stdev_us']:.2f}"
+        if name in baseline:
+            line += f"   x{stats['median_us'] / baseline[name]['median_us']:.2f} vs baseline"
+        print(line)
+
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': datetime.now().isoformat(),
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -1,81 +1,533 @@
+import argparse
 import json
 import logging
 import re
+import requests
+import sys
 from datetime import datetime
+from time import monotonic
 
-from dotenv import load_dotenv
 from os import getenv
-from os.path import abspath, dirname
+from os.path import dirname
 
 # Uncomment following line to see debug logs
 # logging.getLogger().setLevel(logging.DEBUG)
 
-from llmclient import LLMClient
-from llmtoolutil import llm_tool_util
+from startupprofiler import startup_profiler
 
-from tools import *
+with startup_profiler.stage('import llmtoolutil'):
+    from llmclient import LLMClient, load_environment, load_prompt
+    from llmtoolutil import _LLMToolUtil, llm_tool_util
 
-### Initialize
-load_dotenv()
+import tools
+from resultpolicy import ResultStore, compact_result, load_policies
+from sessionstore import SessionStore
+from metrics import metrics
+from toolcallscanner import count_invalid_json
+from tokenprofiler import RequestProfiler
+from toolloader import import_report
+from tracing import tracer
+
+with startup_profiler.stage('register tools'):
+    tools.register_lazy(llm_tool_util)
 
+### Initialize
 no_func_regex = r'^no.(function|tool).*.available'
 
+final_answer_prompt = 'Do not call any more tools. Respond now with a final answer, using the tool responses so far.'
+budget_exceeded_response = 'Sorry, I was unable to answer in time. Please try again.'
+# responses when the model keeps calling tools, instead of a final answer, by stop reason
+stopped_responses = {
+    'budget': budget_exceeded_response,
+    'repeated_call': 'Sorry, I was unable to answer, the tools did not return what was needed. Please try rephrasing.',
+    'max_tool_rounds': 'Sorry, I was unable to answer within the tool calls allowed. Please try a simpler question.',
+}
+
+# seconds allowed for an LLM request, even if budget is nearly exhausted
+min_llm_timeout = 1.0
+
+turn_seconds = metrics.histogram('assistant_turn_seconds', 'Time to answer each message', ('stop_reason',))
+fallback_reprompts = metrics.counter('assistant_fallback_reprompts_total',
+                                     'Prompts to use training data, when the model found no tool or called an unknown tool',
+                                     ('reason',))
+parse_failures = metrics.counter('tool_call_parse_failures_total', 'Model responses with JSON that failed to decode')
+compacted_results = metrics.counter('tool_results_compacted_total', 'Tool responses compacted by a result policy', ('tool',))
+history_messages = metrics.histogram('assistant_history_messages', 'Messages in session history, after each turn',
+                                     buckets=(2, 4, 8, 16, 32, 64, 128, 256, 512))
+
 
 class Assistant:
-    def __init__(self) -> None:
+    def __init__(self,
+                 tool_format:str = 'json',
+                 tool_util:_LLMToolUtil = llm_tool_util,
+                 system_message:str | None = None,
+                 session:requests.Session | None = None,
+                 budget:float | None = None,
+                 max_tool_rounds:int = 5,
+                 session_id:str | None = None,
+                 store:SessionStore | None = None,
+                 token_budgets:dict | None = None,
+                 result_policies:dict | None = None) -> None:
         """
         Initialize Assistant.
+
+        tool_format -- Format of tool markup included in the system prompt,
+        `json` or `compact`. See `llm_tool_util.render_tool_markup`. Or
+        `native` to send tools in the request's `tools` field & read the
+        model's structured tool calls, with no tools in the system prompt (default json)
+        tool_util -- Registry of tools available to the assistant. ex:
+        `llm_tool_util.scoped()` (default llm_tool_util)
+        system_message -- Prebuilt system prompt, shared between assistants.
+        See @build_system_message (default None)
+        session -- HTTP session for LLM requests. ex: `pooled_session()` (default None)
+        budget -- Default seconds to answer each message. See @handle (default None)
+        max_tool_rounds -- Default maximum tool rounds per message. See @handle (default 5)
+        session_id -- ID of conversation to save to, and restore from, `store` (default None)
+        store -- Store to persist conversation in. ex: `SessionStore('sessions.db')` (default None)
+        token_budgets -- Estimated tokens allowed per request, by component. ex:
+        `{ 'total': 6000, 'tool_response': 1000 }`. See `RequestProfiler` (default None)
+        result_policies -- How each tool's responses are compacted before
+        they are sent to the model, by tool name, or `*` for any tool. Full
+        responses retained by a policy are in `results`. See `ResultPolicy` (default None)
         """
-        system_prompt = open(f'{dirname(abspath(__file__))}/prompts/assistant.md').read()
-        system_message = system_prompt.format(date=datetime.today().strftime('%Y-%m-%d'),
-                                              tools=json.dumps(llm_tool_util.generate_tool_markup()))
-        logging.debug(system_message)
+        self._tool_util = tool_util
+        self.tool_format = tool_format
+        self.budget = budget
+        self.max_tool_rounds = max_tool_rounds
+        self.last_turn = None
+        self.last_tool_trace = None
+        self.result_policies = result_policies or {}
+        self.results = ResultStore()
+
+        if system_message is None:
+            system_message = Assistant.build_system_message(tool_format, tool_util)
 
         # initialize llm client. Use `llama-3.1-70b-versatile` model
+        load_environment()
         self._client = LLMClient(url='https://api.groq.com/openai/v1/chat/completions',
                                  model='llama-3.1-70b-versatile',
                                  system_message=system_message,
                                  model_options={ "temperature": 0.1 },
-                                 addn_headers={ 'Authorization': f'Bearer {getenv("GROQ_API_KEY")}' })
+                                 addn_headers={ 'Authorization': f'Bearer {getenv("GROQ_API_KEY")}' },
+                                 session=session,
+                                 profiler=RequestProfiler(tool_util, tool_format, token_budgets)
+                                          if token_budgets is not None else None,
+                                 tools=tool_util.generate_openai_tool_markup() if tool_format == 'native' else None)
+
+        self.session_id = session_id
+        self._store = store
+        self._stored = 0
+        self._offloaded = False
+        if store is not None and session_id is not None:
+            self.restore()
+
+
+    @staticmethod
+    def build_system_message(tool_format:str = 'json',
+                             tool_util:_LLMToolUtil = llm_tool_util) -> str:
+        """
+        Build system prompt, with today's date & the registered tools.
+
+        tool_format -- Format of tool markup. See @__init__ (default json)
+        tool_util -- Registry of tools (default llm_tool_util)
+        returns -- System prompt
+        """
+        if tool_format == 'native':
+            # tools are sent in each request's `tools` field instead
+            system_prompt = load_prompt('assistant_native.md')
+            tools = ''
+        else:
+            system_prompt = load_prompt('assistant.md')
+            with startup_profiler.stage('generate_tool_markup'):
+                tools = tool_util.render_tool_markup(tool_format)
+        system_message = system_prompt.format(date=datetime.today().strftime('%Y-%m-%d'),
+                                              tools=tools)
+        logging.debug(system_message)
+        return system_message
+
+
+    def reload_tools(self) -> None:
+        """
+        Send the tools registered now with the next request, ex: after tools
+        are reloaded by `ToolWatcher`. The system prompt is rebuilt, and
+        for `native` tool format, the request's `tools` too.
+        """
+        self._client.messages[0]['content'] = Assistant.build_system_message(self.tool_format, self._tool_util)
+        if self.tool_format == 'native':
+            self._client.tools = self._tool_util.generate_openai_tool_markup()
 
 
-    def handle(self, user_message:str) -> str:
+    def handle(self,
+               user_message:str,
+               budget:float | None = None,
+               max_tool_rounds:int | None = None) -> str:
         """
         Once `LLMClient` returns a response:
-        - Check if `llm_tool_util.can_handle_tool_call` can handle response
-        - If so, call `llm_tool_util.handle_tool_call`. The function 
+        - Check if the assistant's tool registry (`llm_tool_util` by default)
+        can handle response, using `can_handle_tool_call`
+        - If so, call `handle_tool_call`. The function 
         invokes the tool and returns the tool's response, else returns None
         - If a tool response is returned, call the LLM with the result as JSON
         - A new, response at this point will be returned, based on the tool
         response
+
+        In `native` tool format, tool calls are read from the structured
+        `tool_calls` of the LLM response, and each tool response is sent back
+        as a `tool` message with the ID of its call. In the other formats, the
+        model can respond with a plan of tool calls that use each other's
+        responses. The plan is invoked in one round, with independent calls in
+        parallel, and the responses are sent back together, by step ID.
+
+        The tool loop stops when the model calls the same tools with the same
+        arguments again, after `max_tool_rounds` rounds, or when the `budget`
+        runs out. The model is then asked for a final answer. How the time was
+        spent is reported in `last_turn`, and the tools called, with the
+        responses sent to the model, in `last_tool_trace`.
+
+        user_message -- Message from user
+        budget -- Seconds to answer, across LLM & tool calls (default None,
+        `budget` of assistant)
+        max_tool_rounds -- Maximum rounds of tool calls (default None,
+        `max_tool_rounds` of assistant)
+        returns -- Assistant response
         """
+        if self._offloaded:
+            self.restore()
 
-        response = self._client.request(user_message)
-        logging.debug(f"response = {response}")
+        budget = self.budget if budget is None else budget
+        max_tool_rounds = self.max_tool_rounds if max_tool_rounds is None else max_tool_rounds
+
+        turn = {
+            'llm_seconds': 0.0,
+            'tool_seconds': 0.0,
+            'llm_calls': 0,
+            'tool_rounds': 0,
+            'stop_reason': 'answered',
+        }
+        self.last_turn = turn
+        self.last_tool_trace = []
+        start = monotonic()
+        deadline = start + budget if budget is not None else None
+
+        with tracer.span('assistant.handle', session_id=self.session_id) as span:
+            try:
+                response = self._request(user_message, turn, deadline, 'user')
 
-        # if model responds that there is 'no function/tool to answer' OR calls a
-        # non-existent tool, force it use training data
-        if (re.search(no_func_regex, response, re.IGNORECASE) != None
-            or (llm_tool_util.is_tool_call(response)
-                and not llm_tool_util.can_handle_tool_call(response))):
-            response = self._client.request('Use your training data to respond.')
+                # if model responds that there is 'no function/tool to answer' OR calls a
+                # non-existent tool, force it use training data. Tool calls are
+                # parsed, & repaired, once per response
+                calls = self._tool_calls(response)
+                if re.search(no_func_regex, response, re.IGNORECASE) != None:
+                    fallback_reprompts.inc(reason='no_tool')
+                    response = self._request('Use your training data to respond.', turn, deadline, 'fallback')
+                    calls = self._tool_calls(response)
+                elif len(calls) > 0 and not self._tool_util.can_handle_tool_calls(calls):
+                    fallback_reprompts.inc(reason='unknown_tool')
+                    response = self._reply(calls, 'Use your training data to respond.', turn, deadline, 'fallback')
+                    calls = self._tool_calls(response)
 
-        # check llm_tool_util, for tools that can handle response
-        while llm_tool_util.can_handle_tool_call(response) == True:
-            tool_response = llm_tool_util.handle_tool_call(response)
-            logging.debug(f"tool_response = {tool_response}")
-            response = self._client.request(json.dumps(tool_response))
-            logging.debug(f"response = {response}")
+                # check tool registry, for tools that can handle response
+                seen_calls = set()
+                while self._tool_util.can_handle_tool_calls(calls):
+                    call_key = json.dumps([{ 'name': c['name'], 'parameters': c['parameters'] } for c in calls], sort_keys=True)
+                    if call_key in seen_calls:
+                        turn['stop_reason'] = 'repeated_call'
+                    elif turn['tool_rounds'] >= max_tool_rounds:
+                        turn['stop_reason'] = 'max_tool_rounds'
+                    elif deadline is not None and monotonic() >= deadline:
+                        turn['stop_reason'] = 'budget'
+
+                    if turn['stop_reason'] != 'answered':
+                        logging.warning(f"Tool loop stopped ({turn['stop_reason']}) after {turn['tool_rounds']} rounds")
+                        response = self._reply(calls, final_answer_prompt, turn, deadline, 'final_answer')
+                        if len(self._tool_calls(response)) > 0:
+                            response = stopped_responses[turn['stop_reason']]
+                        break
+
+                    seen_calls.add(call_key)
+                    tool_start = monotonic()
+                    tool_responses = [self._compact(call, tool_response) for (call, tool_response)
+                                      in zip(calls, self._invoke(calls))]
+                    turn['tool_seconds'] += monotonic() - tool_start
+                    turn['tool_rounds'] += 1
+                    self.last_tool_trace.extend({ 'round': turn['tool_rounds'], 'name': call['name'],
+                                                  'parameters': call['parameters'], 'response': tool_response }
+                                                for (call, tool_response) in zip(calls, tool_responses))
+                    logging.debug(f"tool_responses = {tool_responses}")
+
+                    if self.tool_format == 'native':
+                        response = self._request([json.dumps(r) for r in tool_responses], turn, deadline, 'tool_response', calls)
+                    elif _is_plan(calls):
+                        # responses of all steps are sent back together, by step ID
+                        tool_response = { call['id']: r for (call, r) in zip(calls, tool_responses) }
+                        response = self._request(json.dumps(tool_response), turn, deadline, 'tool_response')
+                    else:
+                        tool_response = tool_responses[0] if len(tool_responses) == 1 else tool_responses
+                        response = self._request(json.dumps(tool_response), turn, deadline, 'tool_response')
+                    calls = self._tool_calls(response)
+            except requests.Timeout as te:
+                logging.warning(te)
+                turn['stop_reason'] = 'budget'
+                response = budget_exceeded_response
+            finally:
+                turn['total_seconds'] = monotonic() - start
+                span.set(**turn)
+                turn_seconds.observe(turn['total_seconds'], stop_reason=turn['stop_reason'])
+                history_messages.observe(len(self._client.messages))
+                self.save()
 
         return response
 
 
+    def save(self) -> None:
+        """
+        Append messages not yet stored to the session store, if any. An
+        offloaded conversation is already stored.
+        """
+        if self._store is None or self.session_id is None or self._offloaded:
+            return
+
+        # skip system message, it is shared by all sessions
+        messages = self._client.messages[1 + self._stored:]
+        if len(messages) > 0:
+            self._store.append(self.session_id, self._stored, messages)
+            self._stored += len(messages)
+
+
+    def offload(self) -> None:
+        """
+        Save conversation & release its messages from memory. The
+        conversation is restored by @restore, or by @handle when next used.
+        """
+        self.save()
+        del self._client.messages[1:]
+        self._stored = 0
+        self._offloaded = True
+
+
+    def restore(self) -> None:
+        """
+        Load conversation from session store, replacing messages in memory.
+        """
+        messages = self._store.load(self.session_id)
+        # tool calls that were never answered, ex: turn stopped by a limit,
+        # are dropped so the history stays valid. See `LLMClient.request`
+        for (i, message) in enumerate(messages[:-1]):
+            if message.get('tool_calls') and messages[i + 1]['role'] != 'tool':
+                messages[i] = { k: v for (k, v) in message.items() if k != 'tool_calls' }
+        self._client.messages[1:] = messages
+        self._stored = len(messages)
+        self._offloaded = False
+
+
+    def _tool_calls(self, response:str) -> list:
+        """
+        Tool calls of the last LLM response, structured (`native` format) or
+        parsed from its content.
+
+        response -- Content of LLM response
+        returns -- List of tool call dictionaries with `name` & `parameters`,
+        or the steps of a plan. See `llm_tool_util.parse_tool_plan`
+        """
+        if self.tool_format == 'native':
+            return self._tool_util.parse_native_tool_calls(self._client.last_tool_calls)
+        plan = self._tool_util.parse_tool_plan(response)
+        if plan is not None:
+            return plan
+        return self._tool_util.parse_tool_calls(response)
+
+
+    def _invoke(self, calls:list) -> list:
+        """
+        Invoke tool calls in order, or the steps of a plan as a DAG. See
+        `llm_tool_util.invoke_tool_plan`
+
+        returns -- List of tool responses, in order of calls
+        """
+        if _is_plan(calls):
+            return self._tool_util.invoke_tool_plan(calls)
+        return self._tool_util.invoke_tool_calls(calls)
+
+
+    def _compact(self, call:dict, tool_response:any) -> any:
+        """
+        Apply result policy of the called tool to its response. See `ResultPolicy`
+        """
+        policy = self.result_policies.get(call['name'], self.result_policies.get('*'))
+        compacted = compact_result(tool_response, policy, self.results)
+        if compacted is not tool_response:
+            compacted_results.inc(tool=call['name'])
+        return compacted
+
+
+    def _reply(self, calls:list, prompt:str, turn:dict, deadline:float | None, purpose:str) -> str:
+        """
+        Reply to tool calls with instructions instead of tool responses, ex: to
+        stop calling tools. In `native` format, every call must be answered,
+        so the instructions are the result of each call.
+        """
+        if self.tool_format == 'native':
+            return self._request([prompt] * len(calls), turn, deadline, purpose, calls)
+        return self._request(prompt, turn, deadline, purpose)
+
+
+    def _request(self,
+                 prompt:str | list,
+                 turn:dict,
+                 deadline:float | None,
+                 purpose:str = 'user',
+                 calls:list | None = None) -> str:
+        """
+        Send prompt to LLM, limited to the time remaining until deadline.
+
+        prompt -- Prompt to send, or list of results of `calls`
+        turn -- Timings of current turn. See @handle
+        deadline -- `monotonic()` time by which to respond, or None
+        purpose -- Why the prompt is sent, for tracing. `user`, `fallback`,
+        `tool_response` or `final_answer` (default user)
+        calls -- Structured tool calls, answered by results in `prompt` as
+        `tool` messages (default None)
+        returns -- LLM response
+        """
+        timeout = None
+        if deadline is not None:
+            timeout = max(deadline - monotonic(), min_llm_timeout)
+
+        llm_start = monotonic()
+        try:
+            with tracer.span('assistant.request', purpose=purpose):
+                if calls is not None:
+                    response = self._client.request_tool_results([(call['id'], result) for (call, result) in zip(calls, prompt)],
+                                                                 timeout=timeout)
+                else:
+                    response = self._client.request(prompt, timeout=timeout)
+        finally:
+            turn['llm_seconds'] += monotonic() - llm_start
+            turn['llm_calls'] += 1
+
+        if count_invalid_json(response) > 0:
+            parse_failures.inc()
+
+        logging.debug(f"response = {response}")
+        return response
+
+
+def _is_plan(calls:list) -> bool:
+    """
+    Whether tool calls are the steps of a plan, with dependencies between them.
+    """
+    return any('depends_on' in call for call in calls)
+
+
 
 #################
 # Run Assistant #
 #################
 if __name__ == "__main__":
-    assistant = Assistant()
+    parser = argparse.ArgumentParser(description='Chat with the assistant.')
+    parser.add_argument('--tool-format', default='json', choices=['json', 'compact', 'native'],
+                        help='Format of tool markup in system prompt, or native to send tools in the request')
+    parser.add_argument('--budget', type=float,
+                        help='Seconds to answer each message, across LLM & tool calls')
+    parser.add_argument('--max-tool-rounds', type=int, default=5,
+                        help='Maximum rounds of tool calls for each message')
+    parser.add_argument('--profile-startup', nargs='?', const='-', metavar='PATH',
+                        help='Write startup timing report as JSON to PATH (or stdout) & exit')
+    parser.add_argument('--serve', action='store_true',
+                        help='Serve chat sessions over HTTP, instead of the input prompt')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--max-concurrency', type=int, default=32,
+                        help='Maximum concurrent LLM turns when serving')
+    parser.add_argument('--idle-timeout', type=float, default=900,
+                        help='Seconds after which idle sessions are evicted when serving')
+    parser.add_argument('--max-sessions', type=int, default=10000,
+                        help='Maximum sessions in memory when serving')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of pre-forked worker processes when serving')
+    parser.add_argument('--session-db', metavar='PATH',
+                        help='SQLite file to persist conversations in')
+    parser.add_argument('--session', metavar='ID',
+                        help='ID of conversation to resume, or start, with --session-db')
+    parser.add_argument('--trace', metavar='PATH',
+                        help='Append spans of turns, LLM requests & tool calls to JSONL file')
+    parser.add_argument('--metrics', metavar='PATH',
+                        help='Write Prometheus text metrics to file after each message')
+    parser.add_argument('--result-policies', metavar='PATH',
+                        help='JSON file of how each tool\'s responses are compacted. See resultpolicy.py')
+    parser.add_argument('--watch', action='store_true',
+                        help='Reload tools changed in src/tools, without restarting')
+    parser.add_argument('--token-budget', action='append', default=[], metavar='COMPONENT=TOKENS',
+                        help='Warn when estimated tokens of a request component exceed budget. ex: total=6000')
+    args = parser.parse_args()
+
+    if args.trace:
+        tracer.enable(args.trace)
+
+    if args.watch and args.serve and args.workers > 1:
+        parser.error('--watch is not supported with --workers')
+
+    watcher = None
+    if args.watch:
+        from toolwatcher import ToolWatcher
+        watcher = ToolWatcher(dirname(tools.__file__), tools.__name__, llm_tool_util)
+
+    if args.serve and args.workers > 1:
+        from prefork import PreforkLauncher
+
+        logging.getLogger().setLevel(logging.INFO)
+        launcher = PreforkLauncher(workers=args.workers,
+                                   host=args.host,
+                                   port=args.port,
+                                   tool_format=args.tool_format,
+                                   assistant_class=Assistant,
+                                   store_path=args.session_db,
+                                   max_concurrency=args.max_concurrency,
+                                   idle_timeout=args.idle_timeout,
+                                   max_sessions=args.max_sessions)
+        launcher.run()
+        sys.exit(0)
+    elif args.serve:
+        from assistantserver import AssistantServer
+
+        server = AssistantServer(host=args.host,
+                                 port=args.port,
+                                 tool_format=args.tool_format,
+                                 assistant_class=Assistant,
+                                 store=SessionStore(args.session_db) if args.session_db else None,
+                                 max_concurrency=args.max_concurrency,
+                                 idle_timeout=args.idle_timeout,
+                                 max_sessions=args.max_sessions)
+        if watcher is not None:
+            watcher.on_change = lambda changes: server.reload_system_message()
+            watcher.start()
+        startup_profiler.finish()
+        server.run()
+        sys.exit(0)
+
+    with startup_profiler.stage('Assistant'):
+        assistant = Assistant(tool_format=args.tool_format,
+                              budget=args.budget,
+                              max_tool_rounds=args.max_tool_rounds,
+                              session_id=args.session or 'default',
+                              store=SessionStore(args.session_db) if args.session_db else None,
+                              token_budgets={ component: int(tokens) for (component, tokens)
+                                              in (budget.split('=', 1) for budget in args.token_budget) }
+                                            if args.token_budget else None,
+                              result_policies=load_policies(args.result_policies) if args.result_policies else None)
+
+    if args.profile_startup is not None:
+        if args.profile_startup == '-':
+            print(startup_profiler.to_json())
+        else:
+            with open(args.profile_startup, 'w') as f:
+                f.write(startup_profiler.to_json())
+        sys.exit(0)
+    startup_profiler.finish()
+
+    if watcher is not None:
+        # messages are handled one at a time, so tools are reloaded between them
+        watcher.on_change = lambda changes: assistant.reload_tools()
 
     while True:
         try:
@@ -83,7 +535,14 @@ if __name__ == "__main__":
             if len(msg.strip()) == 0:
                 break
 
+            if watcher is not None:
+                watcher.poll()
+
             print(assistant.handle(msg))
+            if args.metrics:
+                metrics.write(args.metrics)
+            logging.debug(f"turn = {assistant.last_turn}")
+            logging.debug(f"tool module import costs = {import_report()}")
         except KeyboardInterrupt as ki:
             break
         except Exception as e:
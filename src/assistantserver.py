@@ -0,0 +1,542 @@
+import asyncio
+import json
+import logging
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from http import HTTPStatus
+from time import monotonic
+
+from llmclient import pooled_session
+from llmtoolutil import _LLMToolUtil, llm_tool_util
+from metrics import metrics
+from sessionstore import SessionStore
+
+sessions_gauge = metrics.gauge('assistant_sessions', 'Sessions in memory')
+rejected_turns = metrics.counter('assistant_rejected_turns_total', 'Messages rejected when the server is at capacity')
+
+max_body_size = 1024 * 1024
+
+
+def session_worker(session_id:str, workers:int) -> int:
+    """
+    Index of the worker that owns a session, in pre-fork mode. See `AssistantServer`.
+    """
+    return zlib.crc32(session_id.encode()) % workers
+
+
+class _Session:
+    """
+    Chat session. Messages within a session are handled one at a time.
+    """
+
+    def __init__(self, session_id:str, assistant) -> None:
+        self.session_id = session_id
+        self.assistant = assistant
+        self.lock = asyncio.Lock()
+        self.last_used = monotonic()
+
+
+
+class AssistantServer:
+    """
+    HTTP server exposing chat sessions, each backed by an `Assistant`.
+
+    * `POST /sessions` -- Create session. Returns `{"session_id": ...}`
+    * `POST /sessions/<session_id>/messages` -- Send `{"message": ...}` & return
+    `{"session_id": ..., "response": ...}`
+    * `DELETE /sessions/<session_id>` -- End session
+    * `GET /health` -- Number of sessions & turns in progress
+    * `GET /metrics` -- Metrics in the Prometheus text format. See `metrics`
+
+    Connections are handled on an event loop. `Assistant.handle` blocks on the
+    LLM & tools, so turns run in a thread pool, limited to `max_concurrency`
+    at a time. When all are busy, new turns wait up to `queue_timeout` seconds
+    and are then rejected with `503 Service Unavailable`.
+
+    All sessions share one system prompt, and one pool of HTTP connections to
+    the LLM. The prompt has today's date, so it is rebuilt for new sessions
+    when the date changes. At most `max_sessions` sessions are kept in
+    memory, after which new sessions are rejected with `503 Service
+    Unavailable`. Sessions idle for more than `idle_timeout` seconds
+    are evicted. With a `store`, conversations are persisted after each turn,
+    and evicted sessions are restored from the store when next used, ex:
+    after a restart. The least recently used idle session is then evicted
+    to make room, instead of rejecting new or restored sessions. Sessions
+    are saved, restored & created in the thread pool, like turns, so the
+    event loop never waits on the store.
+
+    In pre-fork mode, workers accept connections on one shared socket, so a
+    session's messages can arrive at any worker. Each session is owned by
+    one worker, `session_worker(session_id, len(peers))`, which alone keeps
+    it in memory & appends to its stored conversation. Requests for another
+    worker's session are forwarded to that worker's own socket in `peers`.
+    """
+
+    def __init__(self,
+                 host:str = '127.0.0.1',
+                 port:int = 8080,
+                 tool_format:str = 'json',
+                 tool_util:_LLMToolUtil = llm_tool_util,
+                 max_concurrency:int = 32,
+                 queue_timeout:float = 5.0,
+                 idle_timeout:float = 900.0,
+                 max_sessions:int = 10000,
+                 system_message:str | None = None,
+                 assistant_class:type = None,
+                 store:SessionStore | None = None,
+                 assistant_factory:callable = None,
+                 worker:int = 0,
+                 peers:list | None = None) -> None:
+        """
+        Initialize server.
+
+        host -- Interface to listen on (default 127.0.0.1)
+        port -- Port to listen on (default 8080)
+        tool_format -- Format of tool markup. See `Assistant` (default json)
+        tool_util -- Registry of tools (default llm_tool_util)
+        max_concurrency -- Maximum turns handled at a time (default 32)
+        queue_timeout -- Seconds a turn waits for capacity before it is rejected (default 5)
+        idle_timeout -- Seconds after which an idle session is evicted (default 900)
+        max_sessions -- Maximum sessions in memory (default 10000)
+        system_message -- System prompt prebuilt today, ex: by `PreforkLauncher`.
+        See `Assistant.build_system_message` (default None, built from
+        `tool_format` & `tool_util`)
+        assistant_class -- Assistant class, ex: when run from `assistant.py`
+        (default None, `assistant.Assistant`)
+        store -- Store to persist conversations in (default None)
+        assistant_factory -- Function returning a new assistant for a session
+        ID (default None, creates `Assistant` with shared system prompt &
+        connections)
+        worker -- Index of this worker, in pre-fork mode (default 0)
+        peers -- Addresses `(host, port)` of every worker's own socket, by
+        worker index, in pre-fork mode. See @start (default None, single process)
+        """
+        self.host = host
+        self.port = port
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self.store = store
+        self.worker = worker
+        self.peers = peers or []
+
+        self._tool_format = tool_format
+        self._tool_util = tool_util
+        self._system_message = system_message
+        self._system_date = date.today()
+        self._assistant_class = assistant_class
+        self._assistant_factory = assistant_factory or self._default_assistant_factory()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='assistant')
+        self._capacity = None
+        self._in_flight = 0
+        self._opening = 0
+        self._saving = {}
+        self._server = None
+        self._peer_server = None
+
+
+    def _assistant(self) -> type:
+        """
+        Assistant class, `assistant_class` or `assistant.Assistant`.
+        """
+        if self._assistant_class is not None:
+            return self._assistant_class
+
+        from assistant import Assistant
+        return Assistant
+
+
+    def _default_assistant_factory(self) -> callable:
+        """
+        Create factory for assistants sharing one system prompt & HTTP
+        connection pool.
+        """
+        Assistant = self._assistant()
+        if self._system_message is None:
+            self._system_message = Assistant.build_system_message(self._tool_format, self._tool_util)
+        session = pooled_session(self.max_concurrency)
+
+        # system prompt is read when each session is created, so sessions keep
+        # the prompt they started with when it is reloaded
+        def new_assistant(session_id):
+            if date.today() != self._system_date:
+                self.reload_system_message()
+            return Assistant(tool_format=self._tool_format,
+                             tool_util=self._tool_util,
+                             system_message=self._system_message,
+                             session=session,
+                             session_id=session_id,
+                             store=self.store)
+        return new_assistant
+
+
+    def reload_system_message(self, system_message:str | None = None) -> None:
+        """
+        Replace system prompt of new sessions, ex: after tools are reloaded by
+        `ToolWatcher`, or when the date changes. Existing sessions, & turns
+        in progress, are not affected.
+
+        system_message -- New system prompt (default None, built from
+        `tool_format` & `tool_util`)
+        """
+        self._system_message = system_message or self._assistant().build_system_message(self._tool_format, self._tool_util)
+        self._system_date = date.today()
+        logging.info('Reloaded system prompt for new sessions')
+
+
+    async def start(self, sock=None, peer_sock=None) -> None:
+        """
+        Start listening & evicting idle sessions.
+
+        sock -- Already bound socket to accept connections on, instead of
+        `host` & `port` (default None)
+        peer_sock -- Already bound socket of this worker, that other workers
+        forward requests for its sessions to. See `peers` (default None)
+        """
+        self._capacity = asyncio.Semaphore(self.max_concurrency)
+
+        if sock is not None:
+            self._server = await asyncio.start_server(self._handle_connection, sock=sock)
+        else:
+            self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        if peer_sock is not None:
+            self._peer_server = await asyncio.start_server(self._handle_connection, sock=peer_sock)
+
+        self._evictor = asyncio.create_task(self._evict_idle_sessions())
+        logging.info(f'Serving assistant on {self.host}:{self.port}')
+
+
+    async def stop(self) -> None:
+        """
+        Stop listening & evicting, & wait for evicted sessions to be saved.
+        """
+        self._evictor.cancel()
+        for server in (self._server, self._peer_server):
+            if server is not None:
+                server.close()
+                await server.wait_closed()
+        await asyncio.gather(*self._saving.values())
+
+
+    def run(self, sock=None, peer_sock=None) -> None:
+        """
+        Start server & serve until interrupted.
+
+        sock -- See @start
+        peer_sock -- See @start
+        """
+        async def serve():
+            await self.start(sock, peer_sock)
+            async with self._server:
+                await self._server.serve_forever()
+
+        try:
+            asyncio.run(serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+    async def _evict_idle_sessions(self) -> None:
+        """
+        Periodically remove sessions idle for longer than `idle_timeout`.
+        """
+        while True:
+            await asyncio.sleep(max(self.idle_timeout / 4, 0.01))
+            now = monotonic()
+            for (session_id, session) in list(self.sessions.items()):
+                if now - session.last_used > self.idle_timeout and not session.lock.locked():
+                    self._evict_session(session)
+
+
+    def _evict_session(self, session:_Session) -> None:
+        """
+        Remove session. If stored, it is saved in the thread pool, & restored
+        when next used.
+        """
+        del self.sessions[session.session_id]
+        if self.store is not None:
+            self._saving[session.session_id] = asyncio.create_task(self._save(session))
+        logging.debug(f'Evicted idle session `{session.session_id}`')
+
+
+    async def _save(self, session:_Session) -> None:
+        """
+        Save evicted session. See @_evict_session
+        """
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, session.assistant.save)
+        except Exception as e:
+            logging.error(f'Unable to save session `{session.session_id}`: {e}')
+        finally:
+            del self._saving[session.session_id]
+
+
+    def _make_room(self) -> bool:
+        """
+        Evict the least recently used idle session, if `max_sessions` are in
+        memory. Only stored sessions are evicted, as they can be restored.
+
+        returns -- Whether another session can be kept in memory
+        """
+        if len(self.sessions) + self._opening < self.max_sessions:
+            return True
+
+        idle = [s for s in self.sessions.values() if not s.lock.locked()]
+        if self.store is None or len(idle) == 0:
+            logging.warning(f'Rejected session, {len(self.sessions)} sessions in memory')
+            return False
+        self._evict_session(min(idle, key=lambda s: s.last_used))
+        return True
+
+
+    def _new_session(self, session_id:str | None = None) -> _Session:
+        """
+        Create session with its own assistant, not yet kept in memory. A new
+        session ID is owned by this worker. See `session_worker`.
+
+        session_id -- ID of stored session to restore (default None, new session)
+        """
+        if session_id is None:
+            session_id = uuid.uuid4().hex
+            while not self._owns(session_id):
+                session_id = uuid.uuid4().hex
+            if self.store is not None:
+                self.store.create(session_id)
+
+        return _Session(session_id, self._assistant_factory(session_id))
+
+
+    def create_session(self) -> _Session:
+        """
+        Create new session with its own assistant.
+        """
+        session = self._new_session()
+        self.sessions[session.session_id] = session
+        return session
+
+
+    async def _open_session(self, session_id:str | None = None) -> _Session:
+        """
+        Create, or restore, session in the thread pool, & keep it in memory.
+        Room must have been made by @_make_room.
+
+        session_id -- See @_new_session
+        """
+        self._opening += 1
+        try:
+            session = await asyncio.get_running_loop().run_in_executor(self._executor, self._new_session, session_id)
+        finally:
+            self._opening -= 1
+
+        # restored meanwhile by another request
+        if session_id is not None and session_id in self.sessions:
+            return self.sessions[session_id]
+        self.sessions[session.session_id] = session
+        return session
+
+
+    def _owns(self, session_id:str) -> bool:
+        """
+        Whether session is owned by this worker. See `session_worker`.
+        """
+        return len(self.peers) == 0 or session_worker(session_id, len(self.peers)) == self.worker
+
+
+    async def _stored(self, session_id:str) -> bool:
+        """
+        Whether session is in the store, once saved if it is being evicted.
+        """
+        if self.store is None:
+            return False
+        if session_id in self._saving:
+            await asyncio.shield(self._saving[session_id])
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.store.exists, session_id)
+
+
+    async def _get_session(self, session_id:str) -> tuple:
+        """
+        Return session, restoring it from the store if evicted.
+
+        returns -- Tuple of session & None, or None & HTTP status & response
+        dictionary, if unknown or there is no room to restore it
+        """
+        session = self.sessions.get(session_id)
+        if session is not None:
+            return (session, None)
+
+        if not await self._stored(session_id):
+            return (None, (HTTPStatus.NOT_FOUND, { 'error': f'Unknown session `{session_id}`' }))
+        # restored meanwhile by another request
+        if session_id in self.sessions:
+            return (self.sessions[session_id], None)
+        if not self._make_room():
+            return (None, (HTTPStatus.SERVICE_UNAVAILABLE, { 'error': 'Too many sessions, retry later.' }))
+
+        session = await self._open_session(session_id)
+        logging.debug(f'Restored session `{session_id}`')
+        return (session, None)
+
+
+    async def handle_message(self, session:_Session, message:str) -> tuple:
+        """
+        Handle user message within session.
+
+        session -- Chat session
+        message -- User message
+        returns -- Tuple of HTTP status & response dictionary
+        """
+        async with session.lock:
+            try:
+                await asyncio.wait_for(self._capacity.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                rejected_turns.inc()
+                return (HTTPStatus.SERVICE_UNAVAILABLE, { 'error': 'Server is at capacity, retry later.' })
+
+            self._in_flight += 1
+            try:
+                loop = asyncio.get_running_loop()
+                response = await loop.run_in_executor(self._executor, session.assistant.handle, message)
+            finally:
+                self._in_flight -= 1
+                self._capacity.release()
+                session.last_used = monotonic()
+
+        result = { 'session_id': session.session_id, 'response': response }
+        turn = getattr(session.assistant, 'last_turn', None)
+        if turn is not None:
+            result['turn'] = turn
+
+        return (HTTPStatus.OK, result)
+
+
+    async def _route(self, method:str, path:str, body:dict) -> tuple:
+        """
+        Route request to handler.
+
+        returns -- Tuple of HTTP status & response dictionary
+        """
+        parts = [p for p in path.split('?')[0].split('/') if len(p) > 0]
+
+        match (method, parts):
+            case ('GET', ['health']):
+                return (HTTPStatus.OK, { 'sessions': len(self.sessions), 'in_flight': self._in_flight })
+            case ('GET', ['metrics']):
+                sessions_gauge.set(len(self.sessions))
+                return (HTTPStatus.OK, metrics.to_prometheus())
+            case ('POST', ['sessions']):
+                if not self._make_room():
+                    return (HTTPStatus.SERVICE_UNAVAILABLE, { 'error': 'Too many sessions, retry later.' })
+                return (HTTPStatus.CREATED, { 'session_id': (await self._open_session()).session_id })
+            case (_, ['sessions', session_id, *_]) if not self._owns(session_id):
+                return await self._forward(session_id, method, path, body)
+            case ('POST', ['sessions', session_id, 'messages']):
+                (session, error) = await self._get_session(session_id)
+                if session is None:
+                    return error
+                message = body.get('message') if isinstance(body, dict) else None
+                if not isinstance(message, str) or len(message.strip()) == 0:
+                    return (HTTPStatus.BAD_REQUEST, { 'error': 'Missing `message`' })
+                return await self.handle_message(session, message)
+            case ('DELETE', ['sessions', session_id]):
+                # evicted sessions are deleted from the store, without restoring them
+                session = self.sessions.pop(session_id, None)
+                if session is None and not await self._stored(session_id):
+                    return (HTTPStatus.NOT_FOUND, { 'error': f'Unknown session `{session_id}`' })
+                if self.store is not None:
+                    await asyncio.get_running_loop().run_in_executor(self._executor, self.store.delete, session_id)
+                return (HTTPStatus.OK, { 'session_id': session_id })
+
+        return (HTTPStatus.NOT_FOUND, { 'error': f'No route for {method} {path}' })
+
+
+    async def _forward(self, session_id:str, method:str, path:str, body:dict) -> tuple:
+        """
+        Forward request to the worker that owns session.
+
+        returns -- Tuple of HTTP status & response dictionary of the worker
+        """
+        (host, port) = self.peers[session_worker(session_id, len(self.peers))]
+        data = json.dumps(body).encode()
+        (reader, writer) = await asyncio.open_connection(host, port)
+        try:
+            writer.write(f'{method} {path} HTTP/1.1\r\n'
+                         f'Host: {host}:{port}\r\n'
+                         f'Content-Type: application/json\r\n'
+                         f'Content-Length: {len(data)}\r\n'
+                         f'Connection: close\r\n\r\n'.encode('latin-1') + data)
+            await writer.drain()
+            (head, _, payload) = (await reader.read()).partition(b'\r\n\r\n')
+        finally:
+            writer.close()
+
+        return (HTTPStatus(int(head.split()[1])), json.loads(payload))
+
+
+    async def _handle_connection(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter) -> None:
+        """
+        Handle HTTP/1.1 requests on a connection, until closed.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if len(request_line) == 0:
+                    break
+
+                (method, path, version) = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    (key, _, value) = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                if length > max_body_size:
+                    await self._respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, { 'error': 'Request too large' }, False)
+                    break
+
+                try:
+                    body = json.loads(await reader.readexactly(length)) if length > 0 else {}
+                    (status, response) = await self._route(method.upper(), path, body)
+                except ValueError:
+                    (status, response) = (HTTPStatus.BAD_REQUEST, { 'error': 'Invalid JSON' })
+                except Exception as e:
+                    logging.critical(e)
+                    (status, response) = (HTTPStatus.INTERNAL_SERVER_ERROR, { 'error': str(e) })
+
+                keep_alive = (headers.get('connection', '').lower() != 'close'
+                              and version.upper() == 'HTTP/1.1')
+                await self._respond(writer, status, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            logging.debug(e)
+        finally:
+            writer.close()
+
+
+    async def _respond(self, writer:asyncio.StreamWriter, status:HTTPStatus, response:dict, keep_alive:bool) -> None:
+        """
+        Write JSON response, or text response, ex: metrics.
+        """
+        if isinstance(response, str):
+            (body, content_type) = (response.encode(), 'text/plain; version=0.0.4')
+        else:
+            (body, content_type) = (json.dumps(response).encode(), 'application/json')
+        head = (f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+                f'Content-Type: {content_type}\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                f'Connection: {"keep-alive" if keep_alive else "close"}\r\n')
+        if status == HTTPStatus.SERVICE_UNAVAILABLE:
+            head += 'Retry-After: 1\r\n'
+
+        writer.write(head.encode('latin-1') + b'\r\n' + body)
+        await writer.drain()
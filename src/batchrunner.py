@@ -0,0 +1,316 @@
+import argparse
+import json
+import logging
+import os
+import sys
+from threading import Event, Lock, Thread
+from time import perf_counter
+
+from llmclient import pooled_session
+from loadgen import percentiles
+
+
+
+class BatchRunner:
+    """
+    Run conversations from a JSONL file, ex: a nightly evaluation, with
+    `concurrency` conversations in flight, streaming a result per conversation
+    to an output JSONL file.
+
+    Each input line is a list of user messages, or an object with `messages`,
+    an optional `id` (default line number) & other fields, which are copied
+    to the result as `metadata`. Each result has the `id`, every turn's
+    `message`, `response`, timings & `tool_calls`, the conversation's
+    `seconds`, and its `error`, if any.
+
+    The output file is the checkpoint: results are flushed to disk as each
+    conversation finishes, and conversations with a result are skipped when
+    run again, so an interrupted run resumes where it stopped. Conversations
+    that failed are run again with `retry_errors`, and the last result of an
+    ID is the one that counts.
+
+    Conversations are created by `new_conversation()`, which returns a
+    `send(message)` function. `send` returns a dictionary with the
+    `response`, timings & `tool_calls` of the turn. ex: `assistant_conversations()`
+
+    Usage in code
+    ```
+    runner = BatchRunner(assistant_conversations('json'), 'results.jsonl', concurrency=8)
+    summary = runner.run(load_conversations('prompts.jsonl'))
+    ```
+    """
+
+    def __init__(self,
+                 new_conversation:callable,
+                 output_path:str,
+                 concurrency:int = 4,
+                 retry_errors:bool = False) -> None:
+        """
+        Initialize batch runner.
+
+        new_conversation -- Function returning a new conversation's `send` function
+        output_path -- JSONL file results are appended to, & resumed from
+        concurrency -- Conversations in flight at a time (default 4)
+        retry_errors -- Run conversations again whose result is an error (default False)
+        """
+        self.new_conversation = new_conversation
+        self.output_path = output_path
+        self.concurrency = concurrency
+        self.retry_errors = retry_errors
+
+        self._lock = Lock()
+        self._stop = Event()
+        self._pending = None
+        self._output = None
+        self._results = []
+
+
+    def completed(self) -> set:
+        """
+        IDs of conversations with a result in the output file. A partially
+        written last line, ex: of a killed run, is removed from the file.
+
+        returns -- Set of IDs, excluding errors if `retry_errors`
+        """
+        if not os.path.exists(self.output_path):
+            return set()
+
+        with open(self.output_path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                logging.warning(f'Removing partial result at end of `{self.output_path}`')
+                f.truncate(end)
+
+        latest = {}
+        for line in data[:end].decode().splitlines():
+            try:
+                result = json.loads(line)
+                latest[result['id']] = result
+            except (ValueError, KeyError, TypeError):
+                logging.warning(f'Skipping invalid result in `{self.output_path}`: {line[:80]}')
+        return { id for (id, result) in latest.items() if not (self.retry_errors and 'error' in result) }
+
+
+    def _next_conversation(self) -> dict | None:
+        """
+        Next conversation to run, or None when done.
+        """
+        with self._lock:
+            if self._stop.is_set():
+                return None
+            return next(self._pending, None)
+
+
+    def _run_conversation(self, conversation:dict) -> dict:
+        """
+        Send conversation's messages in order. An error ends the conversation,
+        keeping the turns so far.
+
+        returns -- Result of conversation
+        """
+        result = { 'id': conversation['id'], 'turns': [] }
+        if len(conversation['metadata']) > 0:
+            result['metadata'] = conversation['metadata']
+
+        start = perf_counter()
+        try:
+            send = self.new_conversation()
+            for message in conversation['messages']:
+                turn_start = perf_counter()
+                turn = send(message)
+                result['turns'].append({ 'message': message, 'seconds': perf_counter() - turn_start, **turn })
+        except Exception as e:
+            logging.debug(f'Batch conversation {conversation["id"]} failed: {e}')
+            result['error'] = f'{type(e).__name__}: {e}'
+        result['seconds'] = perf_counter() - start
+        return result
+
+
+    def _write(self, result:dict) -> None:
+        """
+        Append result to output file, & flush it to disk.
+        """
+        line = json.dumps(result, default=str) + '\n'
+        with self._lock:
+            self._output.write(line)
+            self._output.flush()
+            os.fsync(self._output.fileno())
+            self._results.append(result)
+
+
+    def run(self, conversations:list) -> dict:
+        """
+        Run conversations without a result yet. Interrupting stops starting
+        conversations, and waits for those in flight to be written.
+
+        conversations -- List of conversation dictionaries with `id`,
+        `messages` & `metadata`. See `load_conversations`
+        returns -- Summary dictionary. See @summary
+        """
+        done = self.completed()
+        pending = [c for c in conversations if c['id'] not in done]
+        skipped = len(conversations) - len(pending)
+        if skipped > 0:
+            logging.info(f'Resuming: {skipped} of {len(conversations)} conversations already have results')
+
+        self._pending = iter(pending)
+        self._stop.clear()
+        self._results = []
+        start = perf_counter()
+
+        def worker():
+            while (conversation := self._next_conversation()) is not None:
+                self._write(self._run_conversation(conversation))
+
+        with open(self.output_path, 'a') as self._output:
+            workers = [Thread(target=worker, daemon=True) for _ in range(min(self.concurrency, max(len(pending), 1)))]
+            for w in workers:
+                w.start()
+            try:
+                for w in workers:
+                    w.join()
+            except KeyboardInterrupt:
+                self._stop.set()
+                for w in workers:
+                    w.join()
+
+        return self.summary(perf_counter() - start, skipped, len(pending))
+
+
+    def summary(self, elapsed:float, skipped:int, pending:int) -> dict:
+        """
+        Summarize results of this run.
+
+        elapsed -- Seconds the run took
+        skipped -- Conversations skipped, with a result from a previous run
+        pending -- Conversations to run
+        returns -- Dictionary of conversations run, skipped & remaining,
+        errors & latency percentiles
+        """
+        with self._lock:
+            results = list(self._results)
+        ok = [r for r in results if 'error' not in r]
+        turns = [t for r in ok for t in r['turns']]
+
+        return {
+            'seconds': elapsed,
+            'conversations': len(results),
+            'skipped': skipped,
+            'remaining': pending - len(results),
+            'errors': len(results) - len(ok),
+            'latency': {
+                'conversation': percentiles([r['seconds'] for r in ok]),
+                'turn': percentiles([t['seconds'] for t in turns]),
+                'llm': percentiles([t['llm_seconds'] for t in turns if t.get('llm_seconds') is not None]),
+                'tool': percentiles([t['tool_seconds'] for t in turns if t.get('tool_seconds') is not None]),
+            },
+        }
+
+
+def load_conversations(path:str) -> list:
+    """
+    Load conversations from JSONL file, one conversation per line, either a
+    list of messages or `{"id": ..., "messages": [...], ...}`.
+
+    path -- Path to JSONL file
+    returns -- List of dictionaries with `id`, `messages` & `metadata`
+    """
+    conversations = []
+    ids = set()
+    with open(path) as f:
+        for (number, line) in enumerate(f, 1):
+            if not line.strip():
+                continue
+            conversation = json.loads(line)
+            if not isinstance(conversation, dict):
+                conversation = { 'messages': conversation }
+
+            metadata = { k: v for (k, v) in conversation.items() if k not in ('id', 'messages') }
+            id = str(conversation.get('id', number))
+            if id in ids:
+                raise ValueError(f'Duplicate conversation ID `{id}` on line {number} of `{path}`')
+            ids.add(id)
+            conversations.append({ 'id': id, 'messages': conversation['messages'], 'metadata': metadata })
+    return conversations
+
+
+def assistant_conversations(tool_format:str = 'json',
+                            llm_url:str | None = None,
+                            pool_size:int = 10,
+                            **options) -> callable:
+    """
+    Conversations with in-process assistants, sharing the system prompt &
+    a pool of LLM connections. Each turn returns the response, `last_turn`
+    timings & `last_tool_trace`.
+
+    tool_format -- Tool markup format (default json)
+    llm_url -- LLM endpoint, ex: a local mock server (default None, Groq)
+    pool_size -- Connections kept open to the LLM (default 10)
+    options -- Other options of each `Assistant`, ex: `budget`
+    returns -- Function returning a new conversation. See `BatchRunner`
+    """
+    from assistant import Assistant
+
+    system_message = Assistant.build_system_message(tool_format)
+    session = pooled_session(pool_size)
+
+    def new_conversation():
+        assistant = Assistant(tool_format=tool_format, system_message=system_message, session=session, **options)
+        if llm_url is not None:
+            assistant._client.url = llm_url
+
+        def send(message):
+            response = assistant.handle(message)
+            return { 'response': response, **assistant.last_turn, 'tool_calls': assistant.last_tool_trace }
+        return send
+
+    return new_conversation
+
+
+def print_summary(summary:dict) -> None:
+    """
+    Print summary of run.
+    """
+    print(f"{summary['conversations']} conversations in {summary['seconds']:.1f}s, "
+          f"{summary['errors']} errors, {summary['skipped']} skipped, {summary['remaining']} remaining")
+    for (phase, stats) in summary['latency'].items():
+        if stats['count'] > 0:
+            print(f"{phase:<12} p50 {stats['p50']:.3f}s  p95 {stats['p95']:.3f}s  max {stats['max']:.3f}s")
+
+
+
+#######
+# Run #
+#######
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run conversations from a JSONL file, resuming interrupted runs.')
+    parser.add_argument('input', help='JSONL file of conversations')
+    parser.add_argument('output', help='JSONL file to append results to, & resume from')
+    parser.add_argument('--concurrency', type=int, default=4, help='Conversations in flight at a time')
+    parser.add_argument('--retry-errors', action='store_true', help='Run conversations that failed again')
+    parser.add_argument('--limit', type=int, help='Run at most this many conversations of the input')
+    parser.add_argument('--tool-format', default='json', choices=['json', 'compact', 'native'])
+    parser.add_argument('--budget', type=float, help='Seconds to answer each message')
+    parser.add_argument('--max-tool-rounds', type=int, default=5, help='Maximum rounds of tool calls for each message')
+    parser.add_argument('--result-policies', metavar='PATH',
+                        help='JSON file of how each tool\'s responses are compacted. See resultpolicy.py')
+    parser.add_argument('--llm-url', help='LLM endpoint (default Groq)')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO)
+    conversations = load_conversations(args.input)[:args.limit]
+
+    from resultpolicy import load_policies
+    new_conversation = assistant_conversations(args.tool_format,
+                                               args.llm_url,
+                                               pool_size=max(args.concurrency, 10),
+                                               budget=args.budget,
+                                               max_tool_rounds=args.max_tool_rounds,
+                                               result_policies=load_policies(args.result_policies)
+                                                               if args.result_policies else None)
+    runner = BatchRunner(new_conversation, args.output, concurrency=args.concurrency, retry_errors=args.retry_errors)
+    summary = runner.run(conversations)
+
+    print_summary(summary)
+    sys.exit(1 if summary['conversations'] > 0 and summary['errors'] == summary['conversations'] else 0)
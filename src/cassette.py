@@ -0,0 +1,232 @@
+import base64
+import json
+import logging
+import os
+import re
+import requests
+from datetime import timedelta
+from threading import Lock
+from time import perf_counter, sleep
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+# headers that no longer apply to the stored, already decoded, body
+_dropped_headers = { 'content-encoding', 'content-length', 'transfer-encoding', 'connection' }
+
+
+class CassetteMiss(requests.ConnectionError):
+    """
+    Raised when replaying a request that was not recorded.
+    """
+
+
+class Cassette:
+    """
+    Record & replay HTTP traffic sent with `requests`, ex: LLM requests from
+    `LLMClient` & tool calls to weather APIs, so that they can be re-run
+    without the network.
+
+    Requests are keyed by method, URL (with sorted query parameters) & body
+    (JSON re-encoded with sorted keys). Headers are not part of the key, and
+    are not stored, so API keys do not end up in cassettes. Repeated requests
+    with the same key are replayed in the order recorded.
+
+    Usage in code
+    ```
+    with Cassette('cassettes/weather.json', mode='auto'):
+        get_weather_forecast(37.7749, -122.4194, '2024-07-29')
+    ```
+
+    Modes:
+    - `replay`, only replay. Requests not recorded raise `CassetteMiss`
+    - `record`, send every request & record it, replacing recorded ones
+    - `auto`, replay recorded requests, send & record the rest
+    - `off`, send every request, nothing is recorded
+    """
+
+    modes = ('replay', 'record', 'auto', 'off')
+
+    def __init__(self,
+                 path:str,
+                 mode:str = 'auto',
+                 replay_timing:bool = False,
+                 scrub:list = [],
+                 passthrough_hosts:tuple = ('127.0.0.1', 'localhost')) -> None:
+        """
+        Initialize cassette, loading recorded requests, if any.
+
+        path -- JSON file requests are recorded in
+        mode -- One of `modes` (default auto)
+        replay_timing -- Delay replayed responses by the time the recorded
+        request took, ex: for end-to-end latency checks (default False)
+        scrub -- Regular expressions replaced in URL & body before keying,
+        ex: dates that change between runs (default [])
+        passthrough_hosts -- Hosts always sent to, & never recorded (default
+        127.0.0.1 & localhost)
+        """
+        if mode not in Cassette.modes:
+            raise ValueError(f'Unknown cassette mode: {mode}')
+
+        self.path = path
+        self.mode = mode
+        self.replay_timing = replay_timing
+        self.scrub = [re.compile(pattern) for pattern in scrub]
+        self.passthrough_hosts = passthrough_hosts
+        self.replayed = 0
+        self.recorded = 0
+        self._interactions = {}
+        self._played = {}
+        self._lock = Lock()
+        self._send = None
+
+        if mode in ('replay', 'auto') and os.path.exists(path):
+            with open(path) as f:
+                for interaction in json.load(f)['interactions']:
+                    self._interactions.setdefault(interaction['key'], []).append(interaction)
+
+
+    def key(self, request:requests.PreparedRequest) -> str:
+        """
+        Normalized request, used to match replayed requests.
+
+        request -- Prepared request
+        returns -- Key, ex: `GET https://api.open-meteo.com/v1/forecast?latitude=37.7749&...`
+        """
+        parts = urlsplit(request.url)
+        query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+        url = urlunsplit((parts.scheme, parts.netloc, parts.path, query, ''))
+
+        body = request.body or ''
+        if isinstance(body, bytes):
+            body = body.decode(errors='replace')
+        try:
+            body = json.dumps(json.loads(body), sort_keys=True, separators=(',', ':'))
+        except ValueError:
+            pass
+
+        key = f'{request.method} {url} {body}'.rstrip()
+        for pattern in self.scrub:
+            key = pattern.sub('<scrubbed>', key)
+        return key
+
+
+    def __enter__(self) -> 'Cassette':
+        """
+        Intercept requests sent by every `requests` session & module function.
+        """
+        if self.mode == 'off':
+            return self
+
+        cassette = self
+        send = HTTPAdapter.send
+
+        def intercepted_send(adapter, request, **kwargs):
+            return cassette._handle(send, adapter, request, **kwargs)
+
+        self._send = send
+        HTTPAdapter.send = intercepted_send
+        return self
+
+
+    def __exit__(self, *exc) -> None:
+        """
+        Stop intercepting & save newly recorded requests.
+        """
+        if self._send is not None:
+            HTTPAdapter.send = self._send
+            self._send = None
+        if self.recorded > 0:
+            self.save()
+
+
+    def _handle(self, send:callable, adapter:HTTPAdapter, request:requests.PreparedRequest, **kwargs) -> requests.Response:
+        """
+        Replay, or send & record, request.
+        """
+        if urlsplit(request.url).hostname in self.passthrough_hosts:
+            return send(adapter, request, **kwargs)
+
+        key = self.key(request)
+
+        if self.mode in ('replay', 'auto'):
+            with self._lock:
+                recorded = self._interactions.get(key)
+                if recorded:
+                    index = self._played.get(key, 0)
+                    self._played[key] = index + 1
+                    interaction = recorded[min(index, len(recorded) - 1)]
+                    self.replayed += 1
+
+            if recorded:
+                logging.debug(f'Replaying {request.method} {request.url}')
+                return self._replay(interaction, request)
+
+            if self.mode == 'replay':
+                raise CassetteMiss(f'Request not recorded in {self.path}: {key[:200]}', request=request)
+
+        start = perf_counter()
+        response = send(adapter, request, **kwargs)
+        content = response.content
+        elapsed = perf_counter() - start
+
+        try:
+            body = { 'text': content.decode() }
+        except UnicodeDecodeError:
+            body = { 'base64': base64.b64encode(content).decode() }
+
+        interaction = {
+            'key': key,
+            'request': { 'method': request.method, 'url': request.url },
+            'response': {
+                'status': response.status_code,
+                'reason': response.reason,
+                'headers': { k: v for (k, v) in response.headers.items() if k.lower() not in _dropped_headers },
+                'body': body,
+            },
+            'elapsed': elapsed,
+        }
+
+        with self._lock:
+            self._played[key] = self._played.get(key, 0) + 1
+            self._interactions.setdefault(key, []).append(interaction)
+            self.recorded += 1
+
+        return response
+
+
+    def _replay(self, interaction:dict, request:requests.PreparedRequest) -> requests.Response:
+        """
+        Build response from recorded interaction.
+        """
+        if self.replay_timing:
+            sleep(interaction['elapsed'])
+
+        recorded = interaction['response']
+        response = requests.Response()
+        response.status_code = recorded['status']
+        response.reason = recorded['reason']
+        response.headers = CaseInsensitiveDict(recorded['headers'])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.elapsed = timedelta(seconds=interaction['elapsed'])
+
+        body = recorded['body']
+        response._content = body['text'].encode() if 'text' in body else base64.b64decode(body['base64'])
+        return response
+
+
+    def save(self) -> None:
+        """
+        Write recorded requests to cassette file.
+        """
+        with self._lock:
+            interactions = [i for recorded in self._interactions.values() for i in recorded]
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump({ 'interactions': interactions }, f, indent=2)
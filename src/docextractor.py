@@ -1,13 +1,13 @@
 from inspect import getdoc, cleandoc
 import json
 import logging
-from llmclient import LLMClient
-from dotenv import load_dotenv
+import requests
+from threading import Lock
+from llmclient import LLMClient, load_environment, load_prompt
 from os import getenv
-from os.path import abspath, dirname
+from toolcallscanner import find_json_objects
 
 # Groq + llama3.1 (preferred) - Consistent responses, with 0 test failures
-load_dotenv()
 
 class DocExtractor:
     """
@@ -16,14 +16,26 @@ class DocExtractor:
     @TODO: Add support for additional Python docstring formats
     """
 
-    def __init__(self) -> None:
+    def __init__(self, json_mode:bool = True, max_repairs:int = 2) -> None:
         """
         Initialize tool and configure to use LLMClient
+
+        json_mode -- Request a JSON object response format, so replies are
+        never wrapped in fences or prose (default True)
+        max_repairs -- Maximum times an invalid reply is sent back to be
+        corrected, per docstring (default 2)
         """
+        model_options = { "temperature": 0.1 }
+        if json_mode:
+            model_options['response_format'] = { 'type': 'json_object' }
+
+        load_environment()
+        self.max_repairs = max_repairs
+        self._lock = Lock()
         self._client = LLMClient(url='https://api.groq.com/openai/v1/chat/completions',
                                  model='llama-3.1-8b-instant',
-                                 system_message=open(f'{dirname(abspath(__file__))}/prompts/doc_extractor.md').read(),
-                                 model_options={ "temperature": 0.1 },
+                                 system_message=load_prompt('doc_extractor.md'),
+                                 model_options=model_options,
                                  addn_headers={ 'Authorization': f'Bearer {getenv("GROQ_API_KEY")}' })
 
 
@@ -41,7 +53,7 @@ class DocExtractor:
         return doc
 
 
-    def get_func_details(self, doc:str) -> dict:
+    def get_func_details(self, doc:str) -> dict | None:
         """
         Function to extract the tool details. This is based on the documented in code.
 
@@ -64,23 +76,63 @@ class DocExtractor:
             num: Some number (defaults to -1)
             \"\"\"
         
+        Replies that are not a `{ summary, args }` object are sent back to be
+        corrected, up to `max_repairs` times. Extractions share one
+        conversation, so are made one at a time, ex: when tools are registered
+        from several threads.
+
         doc -- docstring for function
-        returns -- dictionary with summary & args
+        returns -- dictionary with summary & args, or None if extraction failed
         """
-        # fetch function details using LLM
-        str_res = self._client.request(doc)
-        if "```json" in str_res:
-            str_res = str_res[len("```json"):]
-            if "```" in str_res:
-                str_res = str_res[:str_res.index("```")]
-        logging.debug(str_res)
-
-        # delete 'returns' as we only need function args
-        res_dict = json.loads(str_res)
-        if 'returns' in res_dict['args']:
-            del res_dict['args']['returns']
-        
-        return res_dict
+        with self._lock:
+            # each docstring is extracted in a new conversation, so the prompt
+            # does not grow with every registered tool
+            del self._client.messages[1:]
+
+            prompt = doc
+            for attempt in range(self.max_repairs + 1):
+                try:
+                    str_res = self._client.request(prompt)
+                except requests.RequestException as e:
+                    logging.warning(f'Unable to extract function details: {e}')
+                    return None
+                logging.debug(str_res)
+
+                (res_dict, error) = self._parse_details(str_res)
+                if error is None:
+                    # delete 'returns' as we only need function args
+                    res_dict['args'].pop('returns', None)
+                    return res_dict
+
+                logging.warning(f'Invalid function details ({error}), attempt {attempt + 1} of {self.max_repairs + 1}')
+                prompt = f'The response is invalid: {error}. Respond only with a JSON object with `summary` & `args`.'
+
+            return None
+
+
+    def _parse_details(self, str_res:str) -> tuple:
+        """
+        Parse & validate reply against the `{ summary, args }` schema.
+
+        str_res -- Reply of LLM. ex: JSON object, or JSON in a ```json fence
+        returns -- Tuple of dictionary & None, or None & reason reply is invalid
+        """
+        objects = find_json_objects(str_res)
+        if len(objects) == 0:
+            return (None, 'no JSON object')
+
+        res_dict = objects[0]
+        if not isinstance(res_dict.get('summary'), str):
+            return (None, '`summary` must be a string')
+        if not isinstance(res_dict.get('args'), dict):
+            return (None, '`args` must be an object')
+        if not all(isinstance(desc, str) for desc in res_dict['args'].values()):
+            return (None, 'each of `args` must be a string description')
+        unexpected = set(res_dict) - { 'summary', 'args' }
+        if unexpected:
+            return (None, f'unexpected keys {sorted(unexpected)}')
+
+        return (res_dict, None)
 
 
 
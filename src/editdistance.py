@@ -0,0 +1,18 @@
+def edit_distance(a:str, b:str, max_distance:int) -> int:
+    """
+    Levenshtein distance between strings, computed only up to `max_distance`.
+
+    returns -- Distance, or `max_distance + 1` if larger
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous = list(range(len(b) + 1))
+    for (i, ca) in enumerate(a, 1):
+        current = [i]
+        for (j, cb) in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return min(previous[-1], max_distance + 1)
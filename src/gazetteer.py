@@ -0,0 +1,339 @@
+import argparse
+import json
+import mmap
+import string
+import struct
+import sys
+import unicodedata
+from array import array
+from bisect import bisect_left
+
+from editdistance import edit_distance
+
+"""
+Index file layout, all integers little-endian:
+- header: magic & number of records
+- offsets: offset of each record, from the start of the records section
+- records: `key\tgeonameid\tname\tcountry\tadmin1\tlat\tlon\tpopulation\n`,
+sorted by key, then by population, largest first
+"""
+_magic = b'GAZ1'
+_header = struct.Struct('<4sI')
+_offset = struct.Struct('<I')
+
+
+def normalize(name:str) -> str:
+    """
+    Normalize place name for lookup. Accents are removed, case is folded &
+    whitespace collapsed. ex: `Zürich ` -> `zurich`
+
+    name -- Place name
+    returns -- Normalized name
+    """
+    decomposed = unicodedata.normalize('NFKD', name)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.casefold().split())
+
+
+def read_geonames(path:str, min_population:int = 0):
+    """
+    Read places from a GeoNames dump, ex: `cities15000.txt` from
+    https://download.geonames.org/export/dump/
+
+    path -- Tab separated GeoNames file
+    min_population -- Skip places with fewer people (default 0)
+    returns -- Iterator of place dictionaries, with `names` to index each by
+    """
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 15:
+                continue
+
+            population = int(fields[14] or 0)
+            if population < min_population:
+                continue
+
+            yield {
+                'geonameid': int(fields[0]),
+                'name': fields[1],
+                'names': { fields[1], fields[2] },
+                'country': fields[8],
+                'admin1': fields[10],
+                'lat': float(fields[4]),
+                'lon': float(fields[5]),
+                'population': population,
+            }
+
+
+def build_index(places, path:str) -> int:
+    """
+    Write index of places, keyed by each of their normalized names.
+
+    places -- Iterable of place dictionaries. See @read_geonames
+    path -- Index file to write
+    returns -- Number of records, i.e. (place, name) pairs
+    """
+    records = []
+    for place in places:
+        fields = '\t'.join(str(place[k]).replace('\t', ' ')
+                           for k in ('geonameid', 'name', 'country', 'admin1', 'lat', 'lon', 'population'))
+        for key in { normalize(name) for name in place['names'] if name.strip() }:
+            records.append((key.encode(), -place['population'], f'{key}\t{fields}\n'.encode()))
+    records.sort(key=lambda r: (r[0], r[1]))
+
+    with open(path, 'wb') as f:
+        f.write(_header.pack(_magic, len(records)))
+        offset = 0
+        for (_, _, record) in records:
+            f.write(_offset.pack(offset))
+            offset += len(record)
+        for (_, _, record) in records:
+            f.write(record)
+
+    return len(records)
+
+
+
+class Gazetteer:
+    """
+    Place name index, memory-mapped from a file built by @build_index. The
+    file is not read into memory; lookups binary search the sorted keys, so
+    exact & prefix lookups touch a few pages.
+
+    Usage in code
+    ```
+    gazetteer = Gazetteer('data/gazetteer.idx')
+    gazetteer.search('london')     # exact, else prefix, else fuzzy
+    gazetteer.prefix('san fr')
+    gazetteer.fuzzy('lodnon')
+    ```
+
+    Results are place dictionaries with `geonameid`, `name`, `country`,
+    `admin1`, `lat`, `lon` & `population`, largest first.
+    """
+
+    def __init__(self, path:str) -> None:
+        """
+        Open index.
+
+        path -- Index file. See @build_index
+        """
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, self._count) = _header.unpack_from(self._map, 0)
+        if magic != _magic:
+            self._map.close()
+            raise ValueError(f'Not a gazetteer index: {path}')
+
+        # views must be released before the map is closed
+        self._view = memoryview(self._map)
+        self._records = _header.size + self._count * _offset.size
+        if sys.byteorder == 'little':
+            # offsets are read in place, in the file's byte order
+            self._offsets = self._view[_header.size:self._records].cast('I')
+        else:
+            self._offsets = memoryview(array('I', struct.unpack_from(f'<{self._count}I', self._map, _header.size)))
+
+
+    def __len__(self) -> int:
+        return self._count
+
+
+    def close(self) -> None:
+        """
+        Unmap index.
+        """
+        self._offsets.release()
+        self._view.release()
+        self._map.close()
+
+
+    def _key(self, i:int) -> bytes:
+        start = self._records + self._offsets[i]
+        return self._map[start:self._map.find(b'\t', start)]
+
+
+    def _place(self, i:int) -> dict:
+        start = self._records + self._offsets[i]
+        fields = self._map[start:self._map.find(b'\n', start)].decode().split('\t')
+        return {
+            'geonameid': int(fields[1]),
+            'name': fields[2],
+            'country': fields[3],
+            'admin1': fields[4],
+            'lat': float(fields[5]),
+            'lon': float(fields[6]),
+            'population': int(fields[7]),
+        }
+
+
+    def _lower_bound(self, key:bytes) -> int:
+        """
+        Index of first record with key >= `key`.
+        """
+        return bisect_left(range(self._count), key, key=self._key)
+
+
+    def _collect(self, indices, country:str | None, limit:int, admin1:str | None = None) -> list:
+        """
+        Places for record indices, de-duplicated & filtered by country &
+        region, largest first.
+        """
+        places = {}
+        for i in indices:
+            place = self._place(i)
+            if (country is None or place['country'] == country) and (admin1 is None or place['admin1'] == admin1):
+                places.setdefault(place['geonameid'], place)
+        return sorted(places.values(), key=lambda p: -p['population'])[:limit]
+
+
+    def lookup(self, name:str, country:str | None = None, limit:int = 5, admin1:str | None = None) -> list:
+        """
+        Places named exactly `name`, after normalization.
+
+        name -- Place name. ex: `London`
+        country -- ISO country code to filter by. ex: `GB` (default None)
+        limit -- Maximum places returned (default 5)
+        admin1 -- Region code to filter by, ex: `IL` for Illinois (default None)
+        returns -- List of places
+        """
+        key = normalize(name).encode()
+        i = self._lower_bound(key)
+        end = i
+        while end < self._count and self._key(end) == key:
+            end += 1
+        return self._collect(range(i, end), country, limit, admin1)
+
+
+    def prefix(self,
+               prefix:str,
+               country:str | None = None,
+               limit:int = 5,
+               scan_limit:int = 2000,
+               admin1:str | None = None) -> list:
+        """
+        Places with a name starting with `prefix`, after normalization.
+
+        prefix -- Start of place name. ex: `San Fr`
+        country -- ISO country code to filter by (default None)
+        limit -- Maximum places returned (default 5)
+        scan_limit -- Maximum matching records ranked by population (default 2000)
+        admin1 -- Region code to filter by (default None)
+        returns -- List of places
+        """
+        key = normalize(prefix).encode()
+        if len(key) == 0:
+            return []
+
+        i = self._lower_bound(key)
+        end = i
+        while end < self._count and end - i < scan_limit and self._key(end).startswith(key):
+            end += 1
+        return self._collect(range(i, end), country, limit, admin1)
+
+
+    def _fuzzy_matches(self, start:bytes, target:str, max_distance:int) -> list:
+        """
+        Records with a key starting with `start`, within `max_distance` edits
+        of `target`.
+
+        returns -- List of (distance, record index) tuples
+        """
+        letters = set(target)
+        i = self._lower_bound(start)
+        matches = []
+        while i < self._count:
+            key = self._key(i)
+            if not key.startswith(start):
+                break
+            if abs(len(key) - len(target)) <= max_distance:
+                name = key.decode()
+                # each edit adds or removes at most 2 distinct letters, so
+                # names with many different letters are skipped cheaply
+                if len(letters.symmetric_difference(name)) > 2 * max_distance:
+                    i += 1
+                    continue
+                distance = edit_distance(target, name, max_distance)
+                if distance <= max_distance:
+                    matches.append((distance, i))
+            i += 1
+        return matches
+
+
+    def fuzzy(self,
+              name:str,
+              country:str | None = None,
+              limit:int = 5,
+              max_distance:int = 2,
+              admin1:str | None = None) -> list:
+        """
+        Places with a name within `max_distance` edits of `name`, ex: typos.
+        Names starting with the same 2 letters are searched first, then names
+        starting with the same letter, then names with a typo in the first
+        letter, ex: `Kondon`, `Ondon` or `Xlondon`.
+
+        name -- Place name. ex: `Lodnon`
+        country -- ISO country code to filter by (default None)
+        limit -- Maximum places returned (default 5)
+        max_distance -- Maximum edit distance (default 2)
+        admin1 -- Region code to filter by (default None)
+        returns -- List of places, closest first
+        """
+        target = normalize(name)
+        if len(target) == 0:
+            return []
+
+        passes = [[target[:2]], [target[:1]]]
+        if len(target) >= 3:
+            # first letter replaced, ex: `Kondon`, removed, ex: `Ondon`, or
+            # added, ex: `Xlondon`. Names starting with the first letter were
+            # searched already
+            starts = ({ c + target[1] for c in string.ascii_lowercase }
+                      | { c + target[0] for c in string.ascii_lowercase }
+                      | { target[1:3] })
+            passes.append(sorted(start for start in starts if start[0] != target[0]))
+
+        for starts in passes:
+            matches = [m for start in starts for m in self._fuzzy_matches(start.encode(), target, max_distance)]
+            if len(matches) > 0:
+                best = min(distance for (distance, _) in matches)
+                return self._collect([i for (distance, i) in matches if distance == best], country, limit, admin1)
+
+        return []
+
+
+    def search(self, query:str, country:str | None = None, limit:int = 5, admin1:str | None = None) -> list:
+        """
+        Exact lookup, else prefix, else fuzzy. See @lookup, @prefix & @fuzzy
+        """
+        return (self.lookup(query, country, limit, admin1)
+                or self.prefix(query, country, limit, admin1=admin1)
+                or self.fuzzy(query, country, limit, admin1=admin1))
+
+
+
+#######
+# Run #
+#######
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build, or search, the offline gazetteer index.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='Build index from a GeoNames dump, ex: cities15000.txt')
+    build.add_argument('dump')
+    build.add_argument('index')
+    build.add_argument('--min-population', type=int, default=0)
+    search = commands.add_parser('search', help='Search index')
+    search.add_argument('index')
+    search.add_argument('query')
+    search.add_argument('--country')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        count = build_index(read_geonames(args.dump, args.min_population), args.index)
+        print(f'Indexed {count} names in {args.index}')
+    else:
+        gazetteer = Gazetteer(args.index)
+        json.dump(gazetteer.search(args.query, args.country), sys.stdout, indent=2, ensure_ascii=False)
+        print()
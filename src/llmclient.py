@@ -1,6 +1,58 @@
 import requests
 import json
 import logging
+from functools import lru_cache
+from os.path import abspath, dirname, join
+from time import perf_counter
+
+from metrics import metrics
+from startupprofiler import startup_profiler
+from tracing import tracer
+
+llm_request_seconds = metrics.histogram('llm_request_seconds', 'Latency of LLM requests', ('model',))
+llm_request_errors = metrics.counter('llm_request_errors_total', 'LLM requests that failed, or returned no message', ('model',))
+llm_tokens = metrics.counter('llm_tokens_total', 'Tokens used by LLM requests', ('model', 'type'))
+llm_budget_exceeded = metrics.counter('llm_token_budget_exceeded_total', 'LLM requests exceeding a token budget', ('component',))
+
+prompts_dir = join(dirname(abspath(__file__)), 'prompts')
+
+@lru_cache(maxsize=None)
+def load_environment() -> None:
+    """
+    Load `.env` into the environment, once, when the first client is
+    configured rather than on import.
+    """
+    from dotenv import load_dotenv
+    with startup_profiler.stage('load_dotenv'):
+        load_dotenv()
+
+
+@lru_cache(maxsize=None)
+def load_prompt(name:str) -> str:
+    """
+    Prompt template from `prompts`, read once & cached.
+
+    name -- File name of template. ex: `assistant.md`
+    returns -- Template
+    """
+    with open(join(prompts_dir, name)) as f:
+        return f.read()
+
+
+def pooled_session(pool_size:int = 10) -> requests.Session:
+    """
+    Create HTTP session with a pool of keep-alive connections, that can be
+    shared by multiple `LLMClient`s to avoid a new connection per request.
+
+    pool_size -- Maximum connections kept open per host (default 10)
+    returns -- requests.Session
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
 
 class LLMClient():
     """
@@ -17,7 +69,11 @@ class LLMClient():
                  model:str,
                  system_message:str,
                  model_options:dict = {},
-                 addn_headers:dict = {}) -> None:
+                 addn_headers:dict = {},
+                 session:requests.Session | None = None,
+                 timeout:float = 60,
+                 profiler = None,
+                 tools:list | None = None) -> None:
         """
         Initialize LLMClient
 
@@ -26,15 +82,65 @@ class LLMClient():
         system_message -- System prompt for initializing messages
         model_options -- Configuration options for model. ex: { 'temperature': 0.1 } (default {})
         addn_headers -- Additional HTTP headers. ex: { 'Authorization': 'Bearer <GROQ_API_KEY>' } } (default {})
+        session -- HTTP session to send requests with. ex: `pooled_session()` (default None)
+        timeout -- Seconds to wait for the LLM to respond (default 60)
+        profiler -- Estimates tokens of each request, by component. See `RequestProfiler` (default None)
+        tools -- Tools sent in the `tools` field of each request, ex:
+        `llm_tool_util.generate_openai_tool_markup()`. Tool calls of the model
+        are then in `last_tool_calls`, see @request_tool_results (default None)
         """
         self.url = url
         self.model = model
         self.messages = [{ 'role': 'system', 'content': system_message }]
         self.options = model_options
         self.additional_headers = addn_headers
+        self.last_usage = None
+        self._http = session or requests
+        self.timeout = timeout
+        self.profiler = profiler
+        self.last_profile = None
+        self.tools = tools
+        self.last_tool_calls = []
 
 
-    def request(self, prompt:str) -> str:
+    def _request_payload(self) -> tuple:
+        """
+        Build headers & JSON body for a request with the current messages.
+
+        returns -- Tuple of headers & data dictionaries
+        """
+        headers = {
+            "Content-Type": "application/json",
+        }
+        headers.update(self.additional_headers)
+
+        data = {
+            "model": self.model,
+            "messages": self.messages,
+            "stream": False,
+        }
+        if self.tools:
+            data["tools"] = self.tools
+        data.update(self.options)
+
+        return (headers, data)
+
+
+    def _profile(self, span) -> None:
+        """
+        Estimate tokens of the request about to be sent, & warn about
+        components exceeding budgets.
+        """
+        self.last_profile = self.profiler.profile(self.messages, self.tools)
+        span.set(estimated_tokens=self.last_profile['total'])
+        for component in self.last_profile['exceeded']:
+            llm_budget_exceeded.inc(component=component)
+        if self.last_profile['exceeded']:
+            logging.warning(f"LLM request exceeds token budget of {', '.join(self.last_profile['exceeded'])}: "
+                            f"{json.dumps({ k: v for (k, v) in self.last_profile.items() if k != 'tool_schemas' })}")
+
+
+    def request(self, prompt:str, timeout:float | None = None) -> str:
         """
         Send request to endpoint and return assistant response content as
         string.
@@ -46,33 +152,77 @@ class LLMClient():
         set `logging.getLogger().setLevel(logging.DEBUG)` to see debug logs
 
         prompt -- User prompt to send to LLM.
+        timeout -- Seconds to wait for response, instead of client timeout (default None)
         returns -- string response
         """
-        self.messages.append({ 'role': 'user', 'content': prompt })
+        # tool calls of the previous response that were never answered, ex:
+        # turn ended by a timeout, are dropped so the history stays valid
+        if self.messages[-1].get('tool_calls'):
+            self.messages[-1] = { k: v for (k, v) in self.messages[-1].items() if k != 'tool_calls' }
 
-        headers = {
-            "Content-Type": "application/json",
-        }
-        headers.update(self.additional_headers)
+        return self._send([{ 'role': 'user', 'content': prompt }], timeout)
 
-        data = {
-            "model": self.model,
-            "messages": self.messages,
-            "stream": False,
-        }
-        data.update(self.options)
 
-        response = requests.post(self.url, headers=headers, json=data)
+    def request_tool_results(self, results:list, timeout:float | None = None) -> str:
+        """
+        Send results of the tool calls in `last_tool_calls` as `tool`
+        messages, & return assistant response content as string. See @request
 
-        try:
-            res_json = response.json()
-            logging.debug(json.dumps(res_json))
+        results -- List of (tool call ID, result content) tuples
+        timeout -- Seconds to wait for response, instead of client timeout (default None)
+        returns -- string response
+        """
+        return self._send([{ 'role': 'tool', 'tool_call_id': tool_call_id, 'content': content }
+                           for (tool_call_id, content) in results], timeout)
 
-            # If multiple choices returned, return first
-            content = res_json['choices'][0]["message"]["content"] if 'choices' in res_json else res_json["message"]["content"]
-            self.messages.append({'role': 'assistant', 'content': content})
 
-            return content
-        except Exception as e:
-            logging.critical(e)
-            return response.text
+    def _send(self, messages:list, timeout:float | None) -> str:
+        """
+        Append messages to history, send request & return assistant response
+        content. See @request
+        """
+        with tracer.span('llm.request', model=self.model, messages=len(self.messages) + len(messages)) as span:
+            self.messages.extend(messages)
+            self.last_tool_calls = []
+            (headers, data) = self._request_payload()
+            if self.profiler is not None:
+                self._profile(span)
+
+            start = perf_counter()
+            try:
+                response = self._http.post(self.url, headers=headers, json=data,
+                                           timeout=timeout if timeout is not None else self.timeout)
+            except requests.RequestException:
+                # unanswered messages are not kept in history
+                del self.messages[-len(messages):]
+                llm_request_errors.inc(model=self.model)
+                raise
+            finally:
+                llm_request_seconds.observe(perf_counter() - start, model=self.model)
+
+            span.set(status=response.status_code)
+            try:
+                res_json = response.json()
+                logging.debug(json.dumps(res_json))
+                self.last_usage = res_json.get('usage')
+                if self.last_usage:
+                    llm_tokens.inc(self.last_usage.get('prompt_tokens', 0), model=self.model, type='prompt')
+                    llm_tokens.inc(self.last_usage.get('completion_tokens', 0), model=self.model, type='completion')
+                    span.set(prompt_tokens=self.last_usage.get('prompt_tokens'),
+                             completion_tokens=self.last_usage.get('completion_tokens'))
+
+                # If multiple choices returned, return first
+                message = res_json['choices'][0]["message"] if 'choices' in res_json else res_json["message"]
+                content = message["content"]
+                if message.get('tool_calls'):
+                    self.last_tool_calls = message['tool_calls']
+                    span.set(tool_calls=len(self.last_tool_calls))
+                    self.messages.append({'role': 'assistant', 'content': content, 'tool_calls': self.last_tool_calls})
+                else:
+                    self.messages.append({'role': 'assistant', 'content': content})
+
+                return content or ''
+            except Exception as e:
+                logging.critical(e)
+                llm_request_errors.inc(model=self.model)
+                return response.text
@@ -1,9 +1,54 @@
 import logging
 import json
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
 from datetime import datetime
+from threading import Lock
+from time import perf_counter
+from types import MappingProxyType
 
 from inspect import Parameter, getfullargspec, signature
-from docextractor import DocExtractor
+from metrics import metrics
+from startupprofiler import startup_profiler
+from toolcallscanner import find_json_objects, find_tool_calls, is_tool_call_json
+from toolloader import LazyTool, claim_lazy_tool
+from toolrepair import ToolCallRepairer
+from tracing import tracer
+
+tool_call_seconds = metrics.histogram('tool_call_seconds', 'Latency of tool calls', ('tool',))
+tool_call_errors = metrics.counter('tool_call_errors_total', 'Tool calls that failed', ('tool', 'reason'))
+# `tool` label of calls to tools that are not registered, so names the model
+# invents do not each add a time series
+unknown_tool_label = '<unknown>'
+
+# JSON schema type & format, by type name in tool markup. See `_map_type_to_name`
+json_schema_types = {
+    'string': ('string', None),
+    'integer': ('integer', None),
+    'float': ('number', None),
+    'boolean': ('boolean', None),
+    'array': ('array', None),
+    'dictionary': ('object', None),
+    'datetime': ('string', 'date'),
+}
+
+# DocExtractor shared by registries, constructed on first use. See `_default_doc_extractor`
+_shared_doc_extractor = None
+_shared_doc_extractor_lock = Lock()
+
+def _default_doc_extractor() -> 'DocExtractor':
+    """
+    DocExtractor shared by registries that were not given one. It is
+    constructed when the first tool is registered, not on import, so processes
+    that only dispatch tool calls don't load `.env` or build an LLM client.
+    """
+    global _shared_doc_extractor
+    with _shared_doc_extractor_lock:
+        if _shared_doc_extractor is None:
+            from docextractor import DocExtractor
+            with startup_profiler.stage('DocExtractor'):
+                _shared_doc_extractor = DocExtractor()
+        return _shared_doc_extractor
 
 
 class _LLMToolUtil:
@@ -35,15 +80,102 @@ class _LLMToolUtil:
         tool_response = llm_tool_util.handle_tool_call(model_response)
         model_response = client.request(tool_response)
     ```
+
+    Isolated registries, ex: for different tenants in the same process, are
+    created from the singleton & used the same way
+    ```
+    tenant_tools = llm_tool_util.scoped()
+
+    @tenant_tools.llm_tool
+    def tenant_only_func(some_param:string) -> dict:
+        ...
+    ```
+
+    Registered tools are held in an immutable snapshot, which is replaced (not
+    mutated) on every registration. Readers never lock & always see a
+    consistent set of tools, while writers are serialized. Each tool's markup
+    is generated once, when it is registered, and kept in the snapshot.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, doc_extraction:'DocExtractor | None' = None) -> None:
+        """
+        DO NOT USE. Use the `llm_tool_util` instance or `llm_tool_util.scoped()`.
+
+        doc_extraction -- DocExtractor to share between registries (default
+        None, shared DocExtractor constructed on first use)
+        """
+        self._doc_extractor = doc_extraction
+        self._write_lock = Lock()
+        self._tools = (MappingProxyType({}), MappingProxyType({}), MappingProxyType({}))
+        self._repairer = (None, None)
+
+
+    @property
+    def _doc_extraction(self) -> 'DocExtractor':
+        """
+        DocExtractor of registry, constructed on first use.
+        """
+        if self._doc_extractor is None:
+            self._doc_extractor = _default_doc_extractor()
+        return self._doc_extractor
+
+
+    @property
+    def _tool_funcs(self) -> MappingProxyType:
+        """
+        Read-only snapshot of registered tool functions by name.
         """
-        DO NOT USE. Use the `llm_tool_util` instance.
+        return self._tools[0]
+
+
+    @property
+    def _tool_docs(self) -> MappingProxyType:
+        """
+        Read-only snapshot of registered tool details by name.
+        """
+        return self._tools[1]
+
+
+    def scoped(self, inherit:bool = True) -> '_LLMToolUtil':
+        """
+        Create a new, isolated registry. Tools registered with the new registry
+        are not visible to this registry and vice versa.
+
+        inherit -- Start with the tools currently registered (default True)
+        returns -- New registry, sharing this registry's DocExtractor
+        """
+        registry = _LLMToolUtil(self._doc_extractor)
+        if inherit:
+            registry._tools = self._tools
+        return registry
+
+
+    def _add_tool(self, name:str, func:callable, doc:dict) -> None:
+        """
+        Copy-on-write addition, or replacement, of tool in registry.
+        """
+        markup = self._tool_markup(name, func, doc)
+        with self._write_lock:
+            (funcs, docs, markups) = self._tools
+            self._tools = (MappingProxyType({**funcs, name: func}),
+                           MappingProxyType({**docs, name: doc}),
+                           MappingProxyType({**markups, name: markup}))
+
+
+    def unregister(self, name:str) -> bool:
+        """
+        Remove tool from registry.
+
+        name -- Name of tool
+        returns -- True if tool was registered & removed
         """
-        self._doc_extraction = DocExtractor()
-        self._tool_funcs = {}
-        self._tool_docs = {}
+        with self._write_lock:
+            if name not in self._tools[0]:
+                return False
+
+            self._tools = tuple(MappingProxyType({k: v for (k, v) in snapshot.items() if k != name})
+                                for snapshot in self._tools)
+            return True
 
 
     def llm_tool(self, func:callable) -> callable:
@@ -55,43 +187,57 @@ class _LLMToolUtil:
 
         func: Function to be made available
         """
+        # module of a lazily registered tool is being imported, the function
+        # is bound to the registered `LazyTool` instead
+        if claim_lazy_tool(func):
+            return func
+
         name = func.__name__
         spec = getfullargspec(func)
-        doc = self._doc_extraction.get_func_doc(func)
+        with startup_profiler.tool_stage(name, 'doc'):
+            doc = self._doc_extraction.get_func_doc(func)
 
         warnings = []
+        doc_json = None
 
-        # raise warning if return is not specified
-        if 'return' not in spec.annotations:
-            warnings.append('Missing return type. All llm tool functions should return a value, to be subsequently used by the llm.\n')
+        with startup_profiler.tool_stage(name, 'validation'):
+            # raise warning if return is not specified
+            if 'return' not in spec.annotations:
+                warnings.append('Missing return type. All llm tool functions should return a value, to be subsequently used by the llm.\n')
 
-        # raise warning if types are not specified for each argument
-        if len(spec.args) != len(spec.annotations) + (-1 if 'return' in spec.annotations else 0):
-            missing_types = [arg for arg in spec.args if arg not in spec.annotations]
-            warnings.append(f'Missing argument type{"s" if len(missing_types) > 1 else ""} for: `{", ".join(missing_types)}`\n')
+            # raise warning if types are not specified for each argument
+            if len(spec.args) != len(spec.annotations) + (-1 if 'return' in spec.annotations else 0):
+                missing_types = [arg for arg in spec.args if arg not in spec.annotations]
+                warnings.append(f'Missing argument type{"s" if len(missing_types) > 1 else ""} for: `{", ".join(missing_types)}`\n')
 
         # raise warning if no doc
         if doc is None or len(doc.strip()) == 0:
             warnings.append('Missing documentation.\n')
         else:
             # raise warning if docs missing for function or params
-            doc_json = self._doc_extraction.get_func_details(doc)
-            summary = doc_json.get("summary")
-            args = doc_json.get("args")
+            with startup_profiler.tool_stage(name, 'extraction'):
+                doc_json = self._doc_extraction.get_func_details(doc)
+
+            if doc_json is None:
+                warnings.append('Unable to extract function details from documentation.\n')
 
-            if summary is None or len(summary.strip()) == 0:
-                warnings.append(f'Missing or invalid function summary.\n')
-            elif summary not in doc:
-                warnings.append(f'Function summary does not match input: `{summary}`\n')
+        if doc_json is not None:
+            with startup_profiler.tool_stage(name, 'validation'):
+                summary = doc_json.get("summary")
+                args = doc_json.get("args")
 
-            missing_params = [arg for arg in spec.args if arg not in args]
-            if len(missing_params) > 0:
-                warnings.append(f'Missing argument summary{"s" if len(missing_params) > 1 else ""} for: `{", ".join(missing_params)}`\n')
+                if summary is None or len(summary.strip()) == 0:
+                    warnings.append(f'Missing or invalid function summary.\n')
+                elif summary not in doc:
+                    warnings.append(f'Function summary does not match input: `{summary}`\n')
+
+                missing_params = [arg for arg in spec.args if arg not in args]
+                if len(missing_params) > 0:
+                    warnings.append(f'Missing argument summary{"s" if len(missing_params) > 1 else ""} for: `{", ".join(missing_params)}`\n')
 
         # if no warnings, add function to collection
         if len(warnings) == 0:
-            self._tool_funcs[name] = func
-            self._tool_docs[name] = doc_json
+            self._add_tool(name, func, doc_json)
 
             logging.info(f'✅ Function `{name}` passes all checks.\n')
         else:
@@ -104,8 +250,8 @@ class _LLMToolUtil:
         """
         Clear all current tools. Used primarily for testing.
         """
-        self._tool_funcs = {}
-        self._tool_docs = {}
+        with self._write_lock:
+            self._tools = (MappingProxyType({}), MappingProxyType({}), MappingProxyType({}))
 
 
     def _map_type_to_name(self, t:type) -> str:
@@ -167,90 +313,356 @@ class _LLMToolUtil:
         prompt = f'...\n{llm_tool_util.generate_tool_markup()}'
         ```
 
-        returns -- List of tools that can be used by LLM
+        returns -- List of tools that can be used by LLM. Each tool's markup is
+        shared, and must not be modified.
+        """
+        return list(self._tools[2].values())
+
+
+    def generate_openai_tool_markup(self) -> list:
+        """
+        Tool markup for the `tools` field of an OpenAI compatible chat
+        completion request. Unlike @generate_tool_markup, parameters are
+        always a JSON schema object, with JSON schema types. ex: `float` is a
+        `number` & `datetime` a `string` in `date` format.
 
-        @TODO: Add support for tool markup for OpenAI
-        """
-        docs = self._tool_docs
-        markup = []
-        
-        for (name, doc) in docs.items():
-            func = self._tool_funcs[name]
-
-            desc = doc.get("summary")
-            args = doc.get('args')
-            
-            spec = getfullargspec(func)
-            annos = spec.annotations
-            sigs = signature(func)
-
-            parameters = None
-
-            if len(args) > 0:
-                parameters = {
-                    'type': 'object',
-                    'properties': {
-                        key: {
-                            'type': self._map_type_to_name(annos[key]),
-                            'description': args[key]
-                            }
-                        for key in args },
-                    'required': [k for (k,v) in sigs.parameters.items() if v.default == Parameter.empty],
-                }
-
-            tool = {
+        Usage in request
+        ```
+        client = LLMClient(..., tools=llm_tool_util.generate_openai_tool_markup())
+        ```
+
+        returns -- List of tools that can be used by LLM
+        """
+        tools = []
+        for tool in self.generate_tool_markup():
+            func = tool['function']
+            params = func['parameters'] or { 'properties': {}, 'required': [] }
+
+            properties = {}
+            for (key, prop) in params['properties'].items():
+                (json_type, json_format) = json_schema_types.get(prop['type'], ('string', None))
+                properties[key] = { 'type': json_type, 'description': prop['description'] }
+                if json_format is not None:
+                    properties[key]['format'] = json_format
+
+            tools.append({
                 'type': 'function',
                 'function': {
-                    'name': name,
-                    'description': desc,
-                    'parameters': parameters,                
+                    'name': func['name'],
+                    'description': func['description'],
+                    'parameters': {
+                        'type': 'object',
+                        'properties': properties,
+                        'required': params['required'],
+                    },
                 },
+            })
+
+        return tools
+
+
+    def _tool_markup(self, name:str, func:callable, doc:dict) -> dict:
+        """
+        Generate markup of a single tool. See @generate_tool_markup
+
+        name -- Name of tool
+        func -- Tool function
+        doc -- Tool details. ex: `{ 'summary': ..., 'args': { ... } }`
+        returns -- Tool markup dictionary
+        """
+        desc = doc.get("summary")
+        args = doc.get('args')
+
+        spec = getfullargspec(func)
+        annos = spec.annotations
+        sigs = signature(func)
+
+        parameters = None
+
+        if len(args) > 0:
+            parameters = {
+                'type': 'object',
+                'properties': {
+                    key: {
+                        'type': self._map_type_to_name(annos[key]),
+                        'description': args[key]
+                        }
+                    for key in args },
+                'required': [k for (k,v) in sigs.parameters.items() if v.default == Parameter.empty],
             }
 
-            markup.append(tool)
+        return {
+            'type': 'function',
+            'function': {
+                'name': name,
+                'description': desc,
+                'parameters': parameters,
+            },
+        }
+
+
+    def generate_compact_tool_markup(self) -> str:
+        """
+        Token-minimized alternative to `generate_tool_markup`. Carries the same
+        information (name, description, argument types, descriptions and
+        whether an argument is required), one tool per block:
+        ```
+        get_weather_forecast(lat:float, lon:float, date:datetime) - Returns the weather...
+         lat: Latitude for the location. ex: 37.7749
+        ```
+        Optional arguments are suffixed with `?`.
+
+        returns -- String of tools that can be used by LLM
+        """
+        blocks = []
+
+        for tool in self.generate_tool_markup():
+            func = tool['function']
+            params = func['parameters'] or { 'properties': {}, 'required': [] }
+            props = params['properties']
+            required = params['required']
+
+            sig = ', '.join(f'{key}{"" if key in required else "?"}:{prop["type"]}'
+                            for (key, prop) in props.items())
+            lines = [f'{func["name"]}({sig}) - {func["description"]}']
+            lines.extend(f' {key}: {prop["description"]}' for (key, prop) in props.items())
+
+            blocks.append('\n'.join(lines))
+
+        return '\n'.join(blocks)
+
 
-        return markup
+    def render_tool_markup(self, tool_format:str = 'json') -> str:
+        """
+        Render tool markup as a string to be embedded in a prompt.
+
+        tool_format -- `json` for `generate_tool_markup` as JSON, or `compact`
+        for `generate_compact_tool_markup` (default json)
+        returns -- String of tools that can be used by LLM
+        """
+        match tool_format:
+            case 'json':
+                return json.dumps(self.generate_tool_markup())
+            case 'compact':
+                return self.generate_compact_tool_markup()
+
+        raise ValueError(f'Unknown tool format: `{tool_format}`')
+
+
+    def parse_tool_calls(self, llm_response:str) -> list:
+        """
+        Find all tool calls in the response. Tool calls can be the entire
+        response, wrapped in a ```json fence or surrounded by prose.
+
+        llm_response -- Response returned by model
+        returns -- List of tool call dictionaries with `name` & `parameters`.
+        See @repair_tool_calls
+        """
+        return self.repair_tool_calls(find_tool_calls(llm_response))
+
+
+    def parse_native_tool_calls(self, tool_calls:list) -> list:
+        """
+        Convert structured tool calls of an OpenAI compatible response, see
+        `LLMClient.last_tool_calls`, to tool call dictionaries.
+
+        tool_calls -- List of `{ 'id': ..., 'function': { 'name': ..., 'arguments': ... } }`,
+        with arguments as a JSON string
+        returns -- List of tool call dictionaries with `id`, `name` & `parameters`
+        """
+        calls = []
+        for tool_call in tool_calls:
+            func = tool_call.get('function') or {}
+            arguments = func.get('arguments') or {}
+            if isinstance(arguments, str):
+                try:
+                    arguments = json.loads(arguments) if arguments.strip() else {}
+                except json.JSONDecodeError as e:
+                    logging.debug(f'Invalid arguments of tool call `{func.get("name")}`: {e}')
+                    arguments = {}
+            calls.append({ 'id': tool_call.get('id'), 'name': func.get('name'), 'parameters': arguments })
+        return self.repair_tool_calls(calls)
+
+
+    def repair_tool_calls(self, tool_calls:list) -> list:
+        """
+        Repair near-miss tool calls, ex: a misspelled tool name, or a
+        misspelled or extra parameter, when the repair is unambiguous. See
+        `ToolCallRepairer`
+
+        tool_calls -- List of tool call dictionaries with `name` & `parameters`
+        returns -- List of repaired tool calls
+        """
+        (tools, repairer) = self._repairer
+        if tools is not self._tools:
+            # index names of current snapshot, once
+            tools = self._tools
+            repairer = ToolCallRepairer(tools[0])
+            self._repairer = (tools, repairer)
+        return [repairer.repair(tool_json) for tool_json in tool_calls]
+
+
+    def can_handle_tool_calls(self, tool_calls:list) -> bool:
+        """
+        Checks whether all parsed tool calls can be invoked. See @can_handle_tool_call
+
+        tool_calls -- List of tool call dictionaries with `name` & `parameters`
+        """
+        funcs = self._tool_funcs
+        return len(tool_calls) > 0 and all(tool_json['name'] in funcs for tool_json in tool_calls)
+
+
+    def invoke_tool_calls(self, tool_calls:list) -> list:
+        """
+        Invoke parsed tool calls, in order. See @handle_tool_calls
+
+        tool_calls -- List of tool call dictionaries with `name` & `parameters`
+        returns -- List of tool responses
+        """
+        return [self._invoke_tool(tool_json) for tool_json in tool_calls]
+
+
+    def parse_tool_plan(self, llm_response:str) -> list | None:
+        """
+        Find a plan of tool calls in the response, where calls can use the
+        responses of other calls, ex:
+        ```
+        {"plan": [
+            {"id": "london", "name": "geocode", "parameters": {"place": "London, GB"}},
+            {"id": "weather", "name": "get_current_weather",
+             "parameters": {"lat": "$london.places.0.lat", "lon": "$london.places.0.lon"}}
+        ]}
+        ```
+        A parameter value `$<id>` refers to the response of the step with the
+        ID, and `$<id>.<path>` to a field of it, with list items by index.
+        Steps without an `id` are numbered from 1.
+
+        llm_response -- Response returned by model
+        returns -- List of step dictionaries with `id`, `name`, `parameters` &
+        the IDs of steps it `depends_on`, or None if there is no valid plan
+        """
+        for obj in find_json_objects(llm_response):
+            plan = obj.get('plan')
+            if (not isinstance(plan, list) or len(plan) == 0
+                    or not all(isinstance(step, dict) and is_tool_call_json(step)
+                               and isinstance(step['parameters'], dict) for step in plan)):
+                continue
+
+            ids = [str(step.get('id', i)) for (i, step) in enumerate(plan, 1)]
+            if len(set(ids)) != len(ids):
+                logging.warning(f'Ignoring plan with duplicate step IDs: {ids}')
+                continue
+
+            plan = self.repair_tool_calls(plan)
+            return [{ 'id': id,
+                      'name': step['name'],
+                      'parameters': step['parameters'],
+                      'depends_on': sorted(_plan_references(step['parameters'], set(ids))) }
+                    for (id, step) in zip(ids, plan)]
+        return None
+
+
+    def invoke_tool_plan(self, steps:list, max_workers:int = 4) -> list:
+        """
+        Invoke the steps of a plan, see @parse_tool_plan, as a DAG. Each step
+        is invoked as soon as the steps it depends on have responded, so
+        independent steps run in parallel.
+
+        A step that raises responds with an `error`, and steps that depend on
+        a failed step, refer to a missing field, or depend on each other in a
+        cycle, are not invoked & respond with an `error` instead.
+
+        steps -- List of step dictionaries. See @parse_tool_plan
+        max_workers -- Maximum steps invoked at a time (default 4)
+        returns -- List of tool responses, in order of steps
+        """
+        results = {}
+        failed = set()
+        pending = { step['id']: step for step in steps }
+        running = {}
+
+        with tracer.span('tool.plan', steps=len(steps)), ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while len(pending) > 0 or len(running) > 0:
+                ready = [step for step in pending.values() if all(id in results for id in step['depends_on'])]
+                for step in ready:
+                    del pending[step['id']]
+                    failed_dependencies = [id for id in step['depends_on'] if id in failed]
+                    try:
+                        if len(failed_dependencies) > 0:
+                            raise LookupError(f'Step `{failed_dependencies[0]}` failed')
+                        params = _resolve_plan_references(step['parameters'], results)
+                    except LookupError as le:
+                        logging.debug(f'Skipping plan step `{step["id"]}`: {le}')
+                        results[step['id']] = { 'error': f'Not invoked. {le}' }
+                        failed.add(step['id'])
+                        continue
+
+                    # tool spans are children of the plan span
+                    future = executor.submit(copy_context().run, self._invoke_plan_step, step, params)
+                    running[future] = step['id']
+
+                if len(running) == 0:
+                    if len(ready) == 0:
+                        for id in pending:
+                            results[id] = { 'error': 'Not invoked. Steps depend on each other in a cycle' }
+                            failed.add(id)
+                        break
+                    continue
+
+                (done, _) = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    id = running.pop(future)
+                    (results[id], ok) = future.result()
+                    if not ok:
+                        failed.add(id)
+
+        return [results[step['id']] for step in steps]
+
+
+    def _invoke_plan_step(self, step:dict, params:dict) -> tuple:
+        """
+        Invoke plan step with resolved parameters.
+
+        returns -- Tuple of tool response, & whether the step succeeded
+        """
+        try:
+            result = self._invoke_tool({ 'name': step['name'], 'parameters': params })
+            return (result, result is not None)
+        except Exception as e:
+            logging.warning(f'Plan step `{step["id"]}` ({step["name"]}) failed: {e}')
+            return ({ 'error': f'{type(e).__name__}: {e}' }, False)
 
 
     def is_tool_call(self, llm_response:str) -> bool:
         """
-        Checks whether the response is in JSON format and is a tool call.
+        Checks whether the response includes JSON that is a tool call.
         Returns bool if tool response. This method is different from
         @can_handle_tool_call, it does not check whether there is a custom
         tool registered to be called.
         """
-        try:
-            tool_json = json.loads(llm_response)
-            return 'name' in tool_json and 'parameters' in tool_json
-        except ValueError as ve:
-            return False
+        return len(self.parse_tool_calls(llm_response)) > 0
 
 
     def can_handle_tool_call(self, llm_response:str) -> bool:
         """
-        See @handle_tool_call. Returns bool if tool can be invoked.
+        See @handle_tool_call. Returns bool if all tool calls in the response
+        can be invoked.
         """
-        try:
-            tool_json = json.loads(llm_response)
-            if 'name' in tool_json and 'parameters' in tool_json:
-                return tool_json['name'] in self._tool_funcs
-        except ValueError as ve:
-            return False
-        else:
-            return False
+        return self.can_handle_tool_calls(self.parse_tool_calls(llm_response))
 
 
     def handle_tool_call(self, llm_response:str) -> dict | None:
         """
         If tool is available, invokes it and returns the response from the
-        tool.
+        tool. If the response includes multiple tool calls, only the first is
+        invoked. See @handle_tool_calls.
 
         llm_response - Response returned by model, which could include tool
         call.
 
         returns dictionary response from calling tool, else None. None is
         returned in the following cases:
-        1. `llm_response` was a string and not JSON
+        1. `llm_response` did not include JSON
         2. The JSON was not for custom tool call
         3. There was an exception parsing the JSON
         4. No tool with the `name` is available
@@ -258,27 +670,110 @@ class _LLMToolUtil:
 
         @TODO: Add tests
         """
-        try:
-            tool_json = json.loads(llm_response)
-            if 'name' in tool_json and 'parameters' in tool_json:
+        tool_calls = self.parse_tool_calls(llm_response)
+        if len(tool_calls) == 0:
+            return None
+
+        return self._invoke_tool(tool_calls[0])
+
+
+    def handle_tool_calls(self, llm_response:str) -> list:
+        """
+        Invoke every tool call in the response, in order.
+
+        llm_response - Response returned by model
+        returns -- List of tool responses. See @handle_tool_call
+        """
+        return self.invoke_tool_calls(self.parse_tool_calls(llm_response))
+
+
+    def _invoke_tool(self, tool_json:dict) -> dict | None:
+        """
+        Convert arguments to the annotated types & invoke tool.
+
+        tool_json -- Tool call with `name` & `parameters`
+        returns -- Response from tool, or None
+        """
+        name = tool_json.get('name')
+        tool_label = name if isinstance(name, str) and name in self._tool_funcs else unknown_tool_label
+        with tracer.span('tool.call', tool=name) as span:
+            try:
                 tool_name = tool_json['name']
 
                 # ensure argument is of correct type
-                func = self._tool_funcs[tool_name]
+                funcs = self._tool_funcs
+                func = funcs.get(tool_name)
+                if func is None:
+                    logging.debug(f'No tool named `{tool_name}`')
+                    tool_call_errors.inc(tool=unknown_tool_label, reason='unknown_tool')
+                    return None
+                if isinstance(func, LazyTool):
+                    span.set(cache_hit=func.is_loaded)
+                    func = func.load()
                 annos = getfullargspec(func).annotations
 
                 params:dict = tool_json['parameters']
+                try:
+                    signature(func).bind(**params)
+                except TypeError as te:
+                    raise ValueError(f'Invalid arguments of tool `{tool_name}`: {te}')
                 for key, value in params.items():
-                    params[key] = self._convert_type(value, annos[key])
+                    if key in annos:
+                        params[key] = self._convert_type(value, annos[key])
 
                 # invoke custom tool
-                if tool_name in self._tool_funcs:
-                    return func(**params)
-        except ValueError as ve:
-            logging.debug(ve)
-            return None
-        else:
-            return None
+                if tool_name in funcs:
+                    start = perf_counter()
+                    try:
+                        return func(**params)
+                    finally:
+                        tool_call_seconds.observe(perf_counter() - start, tool=tool_name)
+            except ValueError as ve:
+                logging.debug(ve)
+                span.set(invalid_arguments=str(ve))
+                tool_call_errors.inc(tool=tool_label, reason='invalid_arguments')
+                return None
+            except Exception:
+                tool_call_errors.inc(tool=tool_label, reason='exception')
+                raise
+            else:
+                return None
+
+
+def _plan_references(value:any, ids:set) -> set:
+    """
+    IDs of plan steps referred to in parameter value. See `_LLMToolUtil.parse_tool_plan`
+    """
+    if isinstance(value, str) and value.startswith('$') and value[1:].split('.')[0] in ids:
+        return { value[1:].split('.')[0] }
+    items = value.values() if isinstance(value, dict) else value if isinstance(value, list) else []
+    return set().union(*(_plan_references(item, ids) for item in items))
+
+
+def _resolve_plan_references(value:any, results:dict) -> any:
+    """
+    Replace references to plan steps in parameter value with their responses.
+
+    results -- Responses of steps by ID
+    returns -- Resolved value. Raises LookupError if a field is missing
+    """
+    if isinstance(value, str) and value.startswith('$') and value[1:].split('.')[0] in results:
+        (id, *path) = value[1:].split('.')
+        resolved = results[id]
+        for part in path:
+            try:
+                if isinstance(resolved, (list, tuple)):
+                    resolved = resolved[int(part)]
+                else:
+                    resolved = resolved[part]
+            except (LookupError, ValueError, TypeError):
+                raise LookupError(f'No field `{part}` in response of step `{id}`, for `{value}`')
+        return resolved
+    if isinstance(value, dict):
+        return { key: _resolve_plan_references(item, results) for (key, item) in value.items() }
+    if isinstance(value, list):
+        return [_resolve_plan_references(item, results) for item in value]
+    return value
 
 
 """
@@ -0,0 +1,429 @@
+import argparse
+import json
+import logging
+import random
+import statistics
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from itertools import count
+from threading import Event, Lock, Thread
+from time import perf_counter, sleep
+
+import requests
+
+from llmclient import pooled_session
+from prefork import memory_usage
+
+
+"""
+Multi-turn conversations replayed when no corpus is given. Each is a list of
+user messages, sent in order in one session.
+"""
+default_corpus = [
+    ['What will the temperature be in London, next Monday?', 'And in Paris?'],
+    ['Will it rain in San Francisco tomorrow?', 'What about the wind?', 'Thanks!'],
+    ['Who was the first president of the united states?'],
+    ['Who were the top 3 gold medal winning countries in the Tokyo olympics?', 'And in Paris 2024?'],
+]
+
+
+def load_corpus(path:str) -> list:
+    """
+    Load conversations from JSONL file, one conversation per line, either a
+    list of messages or `{"messages": [...]}`.
+
+    path -- Path to JSONL file
+    returns -- List of conversations
+    """
+    corpus = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                conversation = json.loads(line)
+                corpus.append(conversation['messages'] if isinstance(conversation, dict) else conversation)
+    return corpus
+
+
+def percentiles(values:list) -> dict:
+    """
+    Summarize latencies.
+
+    values -- List of seconds
+    returns -- Dictionary of count, mean, p50, p95, p99 & max seconds
+    """
+    if len(values) == 0:
+        return { 'count': 0 }
+    if len(values) == 1:
+        (p50, p95, p99) = (values[0],) * 3
+    else:
+        cuts = statistics.quantiles(values, n=100, method='inclusive')
+        (p50, p95, p99) = (cuts[49], cuts[94], cuts[98])
+
+    return {
+        'count': len(values),
+        'mean': statistics.fmean(values),
+        'p50': p50,
+        'p95': p95,
+        'p99': p99,
+        'max': max(values),
+    }
+
+
+def assistant_conversations(tool_format:str = 'json', llm_url:str | None = None, pool_size:int = 10) -> callable:
+    """
+    Conversations with in-process assistants, sharing the system prompt &
+    a pool of LLM connections. Phase timings are read from `last_turn`.
+
+    tool_format -- Tool markup format (default json)
+    llm_url -- LLM endpoint, ex: a local mock server (default None, Groq)
+    pool_size -- Connections kept open to the LLM (default 10)
+    returns -- Function returning a new conversation. See `LoadGenerator`
+    """
+    from assistant import Assistant
+
+    system_message = Assistant.build_system_message(tool_format)
+    session = pooled_session(pool_size)
+
+    def new_conversation():
+        assistant = Assistant(tool_format=tool_format, system_message=system_message, session=session)
+        if llm_url is not None:
+            assistant._client.url = llm_url
+
+        def send(message):
+            assistant.handle(message)
+            return assistant.last_turn
+        return send
+
+    return new_conversation
+
+
+def server_conversations(url:str, pool_size:int = 10, timeout:float = 120) -> callable:
+    """
+    Conversations with an assistant server. See `AssistantServer`
+
+    url -- Server URL, ex: http://127.0.0.1:8080
+    pool_size -- Connections kept open to the server (default 10)
+    timeout -- Seconds to wait for each response (default 120)
+    returns -- Function returning a new conversation. See `LoadGenerator`
+    """
+    session = pooled_session(pool_size)
+
+    def new_conversation():
+        response = session.post(f'{url}/sessions', timeout=timeout)
+        response.raise_for_status()
+        session_id = response.json()['session_id']
+
+        def send(message):
+            response = session.post(f'{url}/sessions/{session_id}/messages', json={ 'message': message }, timeout=timeout)
+            response.raise_for_status()
+            return response.json().get('turn')
+        return send
+
+    return new_conversation
+
+
+
+class LoadGenerator:
+    """
+    Replay a corpus of multi-turn conversations, either keeping `concurrency`
+    conversations in flight (closed loop), or starting new conversations at
+    `rate` per second regardless of how many are in flight (open loop).
+
+    Each message's latency is recorded, split into LLM & tool time when the
+    conversation reports them, along with errors. Memory of this process is
+    sampled every `sample_interval` seconds.
+
+    With `rate`, the first message's latency is measured from when its
+    conversation was scheduled to start, not when a worker picked it up, so
+    time queued for a worker under overload is included (see `queue`
+    latency), rather than omitted.
+
+    Conversations are created by `new_conversation()`, which returns a
+    `send(message)` function. `send` returns a dictionary with `llm_seconds`,
+    `tool_seconds` & `stop_reason` of the turn, or None. Turns that ran out
+    of time (`budget` stop reason) are errors. ex: `assistant_conversations()`
+    """
+
+    def __init__(self,
+                 new_conversation:callable,
+                 corpus:list = default_corpus,
+                 concurrency:int | None = None,
+                 rate:float | None = None,
+                 conversations:int | None = None,
+                 duration:float | None = None,
+                 max_in_flight:int = 1000,
+                 sample_interval:float = 1.0) -> None:
+        """
+        Initialize load generator.
+
+        new_conversation -- Function returning a new conversation's `send` function
+        corpus -- List of conversations, each a list of messages (default default_corpus)
+        concurrency -- Conversations in flight at a time (default None, 1 if
+        no `rate`)
+        rate -- Conversations started per second, with exponential
+        inter-arrival times (default None)
+        conversations -- Number of conversations to run (default None, one per
+        corpus entry if no `duration`)
+        duration -- Seconds to start conversations for (default None)
+        max_in_flight -- Maximum conversations in flight with `rate` (default 1000)
+        sample_interval -- Seconds between memory samples (default 1)
+        """
+        if concurrency is not None and rate is not None:
+            raise ValueError('Set either concurrency or rate, not both')
+        if conversations is None and duration is None:
+            conversations = len(corpus)
+
+        self.new_conversation = new_conversation
+        self.corpus = corpus
+        self.concurrency = concurrency if concurrency is not None or rate is not None else 1
+        self.rate = rate
+        self.conversations = conversations
+        self.duration = duration
+        self.max_in_flight = max_in_flight
+        self.sample_interval = sample_interval
+
+        self._records = []
+        self._memory = []
+        self._started = count()
+        self._lock = Lock()
+        self._stop = Event()
+        self._start = None
+
+
+    def _next_conversation(self) -> list | None:
+        """
+        Next conversation to run, or None when done.
+        """
+        i = next(self._started)
+        if self._stop.is_set() or (self.conversations is not None and i >= self.conversations):
+            return None
+        if self.duration is not None and perf_counter() - self._start >= self.duration:
+            return None
+        return self.corpus[i % len(self.corpus)]
+
+
+    def _run_conversation(self, messages:list, scheduled:float | None = None) -> None:
+        """
+        Send conversation's messages in order, recording each. An error ends
+        the conversation.
+
+        messages -- Messages of conversation
+        scheduled -- `perf_counter()` time the conversation was scheduled to
+        start, in open loop. The first message's latency is measured from it
+        (default None, when sent)
+        """
+        picked_up = perf_counter()
+        (start, queued) = (scheduled, picked_up - scheduled) if scheduled is not None else (picked_up, None)
+        try:
+            send = self.new_conversation()
+        except Exception as e:
+            self._record(start, None, e, queued)
+            return
+
+        for (i, message) in enumerate(messages):
+            if i > 0:
+                (start, queued) = (perf_counter(), None)
+            try:
+                turn = send(message)
+            except Exception as e:
+                self._record(start, None, e, queued)
+                return
+            self._record(start, turn, None, queued)
+
+
+    def _record(self, start:float, turn:dict | None, error:Exception | None, queue_seconds:float | None = None) -> None:
+        """
+        Record message latency & phase timings, or error.
+        """
+        record = { 'start': start - self._start, 'seconds': perf_counter() - start }
+        if queue_seconds is not None:
+            record['queue_seconds'] = queue_seconds
+        if turn is not None and turn.get('stop_reason') == 'budget':
+            # turn timed out, & answered with an apology
+            record['error'] = 'budget'
+        elif error is not None:
+            if isinstance(error, requests.HTTPError) and error.response is not None:
+                record['error'] = f'HTTP {error.response.status_code}'
+            else:
+                record['error'] = type(error).__name__
+            logging.debug(f'Load generator error: {error}')
+        elif turn is not None:
+            record['llm_seconds'] = turn.get('llm_seconds')
+            record['tool_seconds'] = turn.get('tool_seconds')
+
+        with self._lock:
+            self._records.append(record)
+
+
+    def _sample_memory(self) -> None:
+        """
+        Sample memory until stopped.
+        """
+        while True:
+            with self._lock:
+                completed = len(self._records)
+            self._memory.append({ 'seconds': perf_counter() - self._start,
+                                  'messages': completed,
+                                  **memory_usage() })
+            if self._stop.wait(self.sample_interval):
+                break
+
+
+    def _closed_loop(self) -> None:
+        """
+        Keep `concurrency` conversations in flight.
+        """
+        def worker():
+            while (messages := self._next_conversation()) is not None:
+                self._run_conversation(messages)
+
+        workers = [Thread(target=worker, daemon=True) for _ in range(self.concurrency)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+
+
+    def _open_loop(self) -> None:
+        """
+        Start conversations at `rate` per second.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            arrival = perf_counter()
+            while (messages := self._next_conversation()) is not None:
+                executor.submit(self._run_conversation, messages, arrival)
+                arrival += random.expovariate(self.rate)
+                sleep(max(arrival - perf_counter(), 0))
+
+
+    def run(self) -> dict:
+        """
+        Run load & report results. Interrupting stops starting conversations,
+        and waits for those in flight.
+
+        returns -- Report dictionary. See @report
+        """
+        self._start = perf_counter()
+        sampler = Thread(target=self._sample_memory, daemon=True)
+        sampler.start()
+
+        try:
+            if self.rate is not None:
+                self._open_loop()
+            else:
+                self._closed_loop()
+        except KeyboardInterrupt:
+            self._stop.set()
+        finally:
+            self._stop.set()
+            sampler.join()
+
+        return self.report(perf_counter() - self._start)
+
+
+    def report(self, elapsed:float) -> dict:
+        """
+        Summarize records.
+
+        elapsed -- Seconds the load ran for
+        returns -- Dictionary of throughput, latency percentiles per phase,
+        error rates & memory samples
+        """
+        with self._lock:
+            records = list(self._records)
+
+        errors = {}
+        for r in records:
+            if 'error' in r:
+                errors[r['error']] = errors.get(r['error'], 0) + 1
+        ok = [r for r in records if 'error' not in r]
+        n_errors = len(records) - len(ok)
+
+        return {
+            'mode': 'rate' if self.rate is not None else 'concurrency',
+            'concurrency': self.concurrency,
+            'rate': self.rate,
+            'seconds': elapsed,
+            'messages': len(records),
+            'messages_per_second': len(ok) / elapsed if elapsed > 0 else 0.0,
+            'errors': n_errors,
+            'error_rate': n_errors / len(records) if len(records) > 0 else 0.0,
+            'error_types': errors,
+            'latency': {
+                'total': percentiles([r['seconds'] for r in ok]),
+                'llm': percentiles([r['llm_seconds'] for r in ok if r.get('llm_seconds') is not None]),
+                'tool': percentiles([r['tool_seconds'] for r in ok if r.get('tool_seconds') is not None]),
+                'queue': percentiles([r['queue_seconds'] for r in records if r.get('queue_seconds') is not None]),
+            },
+            'memory': self._memory,
+        }
+
+
+def print_report(report:dict) -> None:
+    """
+    Print report summary.
+    """
+    print(f"{report['messages']} messages in {report['seconds']:.1f}s: "
+          f"{report['messages_per_second']:.2f} messages/s, "
+          f"{report['errors']} errors ({report['error_rate']:.1%}) {report['error_types'] or ''}")
+    for (phase, stats) in report['latency'].items():
+        if stats['count'] > 0:
+            print(f"{phase:<6} p50 {stats['p50']:.3f}s  p95 {stats['p95']:.3f}s  p99 {stats['p99']:.3f}s  max {stats['max']:.3f}s")
+
+    rss = [m['rss'] for m in report['memory'] if 'rss' in m]
+    if len(rss) > 1:
+        print(f'memory rss {rss[0]} kB -> {rss[-1]} kB ({rss[-1] - rss[0]:+} kB)')
+
+
+
+#######
+# Run #
+#######
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay conversations against the assistant under load.')
+    parser.add_argument('--corpus', help='JSONL file of conversations (default built-in corpus)')
+    parser.add_argument('--server', metavar='URL',
+                        help='Assistant server to load, ex: http://127.0.0.1:8080 (default in-process assistants)')
+    parser.add_argument('--llm-url', help='LLM endpoint for in-process assistants (default Groq)')
+    parser.add_argument('--cassette', metavar='PATH',
+                        help='Replay recorded LLM & tool traffic, with recorded latencies, for in-process assistants')
+    parser.add_argument('--tool-format', default='json', choices=['json', 'compact', 'native'])
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument('--concurrency', type=int, help='Conversations in flight at a time (default 1)')
+    load.add_argument('--rate', type=float, help='Conversations started per second')
+    parser.add_argument('--conversations', type=int, help='Number of conversations (default corpus size)')
+    parser.add_argument('--duration', type=float, help='Seconds to start conversations for')
+    parser.add_argument('--sample-interval', type=float, default=1.0, help='Seconds between memory samples')
+    parser.add_argument('--output', help='Write report as JSON to file')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else default_corpus
+    pool_size = max(args.concurrency or 10, 10)
+
+    if args.cassette and not args.server:
+        from cassette import Cassette
+        recorded = Cassette(args.cassette, mode='replay', replay_timing=True)
+    else:
+        recorded = nullcontext()
+
+    with recorded:
+        if args.server:
+            new_conversation = server_conversations(args.server, pool_size=pool_size)
+        else:
+            new_conversation = assistant_conversations(args.tool_format, args.llm_url, pool_size=pool_size)
+
+        generator = LoadGenerator(new_conversation,
+                                  corpus=corpus,
+                                  concurrency=args.concurrency,
+                                  rate=args.rate,
+                                  conversations=args.conversations,
+                                  duration=args.duration,
+                                  sample_interval=args.sample_interval)
+        report = generator.run()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    sys.exit(1 if report['messages'] > 0 and report['errors'] == report['messages'] else 0)
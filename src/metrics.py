@@ -0,0 +1,240 @@
+import os
+from bisect import bisect_left
+from threading import Lock
+
+# seconds, from fast tool calls to slow LLM requests
+default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names:tuple, values:tuple, extra:str = '') -> str:
+    """
+    Prometheus label set. ex: `{model="llama-3.1-70b-versatile"}`
+    """
+    pairs = [f'{name}="{_escape(str(value))}"' for (name, value) in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value:str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value:float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+
+class Metric:
+    """
+    Metric with values per set of label values. See `MetricsRegistry`
+    """
+
+    type = None
+
+    def __init__(self, name:str, help:str, labels:tuple = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = Lock()
+
+
+    def _key(self, labels:dict) -> tuple:
+        """
+        Label values, in order of label names.
+        """
+        if labels.keys() != set(self.labels):
+            raise ValueError(f'{self.name} expects labels {self.labels}, got {tuple(labels)}')
+        return tuple(labels[name] for name in self.labels)
+
+
+    def value(self, **labels) -> float | None:
+        """
+        Current value for labels, or None if never updated.
+        """
+        with self._lock:
+            return self._values.get(self._key(labels))
+
+
+    def samples(self) -> list:
+        """
+        Prometheus text lines of all values.
+        """
+        with self._lock:
+            return [f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}'
+                    for (key, value) in self._values.items()]
+
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing count. ex: tool errors
+    """
+
+    type = 'counter'
+
+    def inc(self, amount:float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+
+class Gauge(Metric):
+    """
+    Value that goes up & down. ex: sessions in memory
+    """
+
+    type = 'gauge'
+
+    def set(self, value:float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values, counted in cumulative buckets. ex: LLM
+    latency
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name:str, help:str, labels:tuple = (), buckets:tuple = default_buckets) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+
+    def observe(self, value:float, **labels) -> None:
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # count per bucket (last is +Inf), sum & count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+
+    def value(self, **labels) -> dict | None:
+        """
+        Count & sum of observations for labels, or None if never observed.
+        """
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return { 'count': state[2], 'sum': state[1] } if state is not None else None
+
+
+    def samples(self) -> list:
+        lines = []
+        with self._lock:
+            for (key, (counts, total, count)) in self._values.items():
+                cumulative = 0
+                for (bound, n) in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += n
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(f'{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}')
+                lines.append(f'{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}')
+                lines.append(f'{self.name}_count{_format_labels(self.labels, key)} {count}')
+        return lines
+
+
+
+class MetricsRegistry:
+    """
+    In-process metrics updated by `LLMClient`, `_LLMToolUtil` & `Assistant`,
+    exported in the Prometheus text format, ex: from `GET /metrics` of
+    `AssistantServer`, or to a file scraped by a node exporter.
+
+    Usage in code
+    ```
+    from metrics import metrics
+
+    llm_seconds = metrics.histogram('llm_request_seconds', 'LLM request latency', ('model',))
+    llm_seconds.observe(0.42, model='llama-3.1-70b-versatile')
+
+    print(metrics.to_prometheus())
+    ```
+
+    Metrics are created once, on first use, and returned by later calls
+    with the same name.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialize empty registry.
+        """
+        self._metrics = {}
+        self._lock = Lock()
+
+
+    def _get(self, cls:type, name:str, help:str, labels:tuple, **kwargs) -> Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labels, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f'Metric {name} is a {metric.type}')
+            return metric
+
+
+    def counter(self, name:str, help:str, labels:tuple = ()) -> Counter:
+        """
+        Get, or create, counter. ex: `tool_call_errors_total`
+        """
+        return self._get(Counter, name, help, labels)
+
+
+    def gauge(self, name:str, help:str, labels:tuple = ()) -> Gauge:
+        """
+        Get, or create, gauge. ex: `assistant_sessions`
+        """
+        return self._get(Gauge, name, help, labels)
+
+
+    def histogram(self, name:str, help:str, labels:tuple = (), buckets:tuple = default_buckets) -> Histogram:
+        """
+        Get, or create, histogram. ex: `llm_request_seconds`
+        """
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+
+    def to_prometheus(self) -> str:
+        """
+        Snapshot of all metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+    def write(self, path:str) -> None:
+        """
+        Write snapshot to file. The file is replaced atomically, so it is
+        never read half written.
+
+        path -- File to write. ex: `metrics.prom`
+        """
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+
+"""
+Singleton instance of MetricsRegistry, that must be updated.
+"""
+metrics = MetricsRegistry()
@@ -0,0 +1,263 @@
+import gc
+import json
+import logging
+import os
+import signal
+import socket
+from threading import Thread
+from time import perf_counter
+
+from assistantserver import AssistantServer
+from llmtoolutil import _LLMToolUtil, llm_tool_util
+from sessionstore import SessionStore
+from startupprofiler import startup_profiler
+from toolloader import LazyTool
+
+
+def memory_usage() -> dict:
+    """
+    Memory used by the current process, in kB. `pss` (proportional set size)
+    counts pages shared with other processes, ex: copy-on-write pages shared
+    with the parent after fork, divided by the number of processes sharing
+    them. Only `max_rss` is available on platforms without `/proc`.
+
+    returns -- Dictionary with `rss`, `pss`, `shared` & `max_rss`, if available
+    """
+    usage = {}
+
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    usage['rss'] = int(line.split()[1])
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                (key, _, value) = line.partition(':')
+                if key == 'Pss':
+                    usage['pss'] = int(value.split()[0])
+                elif key in ('Shared_Clean', 'Shared_Dirty'):
+                    usage['shared'] = usage.get('shared', 0) + int(value.split()[0])
+    except OSError:
+        pass
+
+    try:
+        import resource
+        usage['max_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:
+        pass
+
+    return usage
+
+
+
+class PreforkLauncher:
+    """
+    Serve the assistant from several worker processes, for CPU bound tool
+    workloads.
+
+    The parent process imports every tool module, builds the tool registry
+    & system prompt, and freezes them against garbage collection (see
+    `gc.freeze`), so that collections in the workers do not write to, and
+    copy, the pages shared with the parent. It then binds the listening
+    socket & forks workers, which each run an `AssistantServer` on the
+    shared socket.
+
+    Each session is owned by one worker, so its conversation is kept, &
+    stored, by one process only. Each worker also listens on its own local
+    socket, and requests for a session of another worker are forwarded to
+    it. See `AssistantServer`.
+
+    Each worker reports its startup time & memory usage, ex:
+    ```
+    {"worker": 1, "pid": 1234, "startup_seconds": 0.004, "memory": {"rss": 41000, "pss": 12000, ...}}
+    ```
+    """
+
+    def __init__(self,
+                 workers:int = 2,
+                 host:str = '127.0.0.1',
+                 port:int = 8080,
+                 tool_format:str = 'json',
+                 tool_util:_LLMToolUtil = llm_tool_util,
+                 assistant_class:type = None,
+                 store_path:str | None = None,
+                 **server_options) -> None:
+        """
+        Initialize launcher.
+
+        workers -- Number of worker processes (default 2)
+        host -- Interface to listen on (default 127.0.0.1)
+        port -- Port to listen on (default 8080)
+        tool_format -- Format of tool markup. See `Assistant` (default json)
+        tool_util -- Registry of tools (default llm_tool_util)
+        assistant_class -- Assistant class, ex: when run from `assistant.py`
+        (default None, `assistant.Assistant`)
+        store_path -- SQLite file to persist conversations in, opened by each
+        worker (default None)
+        server_options -- Additional `AssistantServer` options. ex: `max_concurrency`
+        """
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.tool_format = tool_format
+        self.tool_util = tool_util
+        self.assistant_class = assistant_class
+        self.store_path = store_path
+        self.server_options = server_options
+        self.reports = []
+        self._pids = []
+
+
+    def prepare(self) -> str:
+        """
+        Build, in the parent, everything workers share. Tool modules are
+        imported so their code & dependencies are shared too.
+
+        returns -- System prompt
+        """
+        if self.assistant_class is not None:
+            Assistant = self.assistant_class
+        else:
+            from assistant import Assistant
+
+        for func in self.tool_util._tool_funcs.values():
+            if isinstance(func, LazyTool):
+                func.load()
+
+        system_message = Assistant.build_system_message(self.tool_format, self.tool_util)
+        startup_profiler.finish()
+
+        # move everything allocated so far out of the collected generations
+        gc.collect()
+        gc.freeze()
+        logging.info(f'Frozen {gc.get_freeze_count()} objects before fork')
+
+        return system_message
+
+
+    def run(self) -> None:
+        """
+        Prepare, fork workers & wait for them to exit. Workers are terminated
+        when the parent is interrupted.
+        """
+        if not hasattr(os, 'fork'):
+            raise RuntimeError('Pre-fork workers require os.fork')
+
+        system_message = self.prepare()
+
+        sock = _listen(self.host, self.port)
+        # own socket of each worker, that other workers forward requests to
+        peer_socks = [_listen('127.0.0.1', 0) for _ in range(self.workers)]
+        peers = [s.getsockname()[:2] for s in peer_socks]
+
+        (read_fd, write_fd) = os.pipe()
+
+        for worker in range(self.workers):
+            forked = perf_counter()
+            pid = os.fork()
+            if pid == 0:
+                # the worker must never return into the parent's fork loop
+                try:
+                    os.close(read_fd)
+                    for (i, peer_sock) in enumerate(peer_socks):
+                        if i != worker:
+                            peer_sock.close()
+                    self._run_worker(worker, sock, peer_socks[worker], peers, system_message, write_fd, forked)
+                except KeyboardInterrupt:
+                    pass
+                except BaseException:
+                    logging.exception(f'Worker {worker} failed')
+                    os._exit(1)
+                finally:
+                    os._exit(0)
+            self._pids.append(pid)
+
+        os.close(write_fd)
+        for peer_sock in peer_socks:
+            peer_sock.close()
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        reader = Thread(target=self._read_reports, args=(read_fd,), daemon=True)
+        reader.start()
+
+        try:
+            for pid in self._pids:
+                (_, status) = os.waitpid(pid, 0)
+                if os.waitstatus_to_exitcode(status) not in (0, -signal.SIGTERM):
+                    logging.error(f'Worker {pid} exited with {os.waitstatus_to_exitcode(status)}')
+        except KeyboardInterrupt:
+            self.terminate()
+        finally:
+            sock.close()
+
+
+    def terminate(self) -> None:
+        """
+        Terminate workers & wait for them to exit.
+        """
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+        for pid in self._pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+
+
+    def _run_worker(self,
+                    worker:int,
+                    sock:socket.socket,
+                    peer_sock:socket.socket,
+                    peers:list,
+                    system_message:str,
+                    write_fd:int,
+                    forked:float) -> None:
+        """
+        Worker process. Runs server on shared socket until terminated.
+        """
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        server = AssistantServer(host=self.host,
+                                 port=self.port,
+                                 tool_format=self.tool_format,
+                                 tool_util=self.tool_util,
+                                 system_message=system_message,
+                                 assistant_class=self.assistant_class,
+                                 store=SessionStore(self.store_path) if self.store_path else None,
+                                 worker=worker,
+                                 peers=peers,
+                                 **self.server_options)
+
+        report = {
+            'worker': worker,
+            'pid': os.getpid(),
+            'startup_seconds': perf_counter() - forked,
+            'memory': memory_usage(),
+        }
+        os.write(write_fd, (json.dumps(report) + '\n').encode())
+        os.close(write_fd)
+
+        server.run(sock, peer_sock)
+
+
+    def _read_reports(self, read_fd:int) -> None:
+        """
+        Collect worker reports.
+        """
+        with os.fdopen(read_fd) as f:
+            for line in f:
+                report = json.loads(line)
+                self.reports.append(report)
+                logging.info(f'Worker ready: {line.strip()}')
+
+
+def _listen(host:str, port:int) -> socket.socket:
+    """
+    Bind non-blocking listening socket.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.setblocking(False)
+    return sock
@@ -0,0 +1,213 @@
+import json
+from collections import OrderedDict
+from itertools import count
+from threading import Lock
+
+
+
+class ResultPolicy:
+    """
+    How a tool's response is compacted before it is sent to the model. The
+    response stays in the conversation history, and is sent again with every
+    later request, so large responses are reduced by:
+    - `fields`, keeping only these fields of objects. Nested fields are
+    dotted, ex: `forecasts.days`, and apply to each object of a list
+    - `max_items`, keeping the first items of each longer list, followed by a
+    marker with the number of items left out
+    - `max_chars`, limiting the serialized response. Lists are shortened
+    further until it fits, else it is replaced by a truncated preview
+    - `retain`, keeping the full response outside the prompt, in a
+    `ResultStore`. The compacted response then includes its `result_id`
+
+    Usage in code
+    ```
+    policies = {
+        'get_weather_forecasts': ResultPolicy(max_items=7, max_chars=4000, retain=True),
+        '*': ResultPolicy(max_chars=8000),
+    }
+    assistant = Assistant(result_policies=policies)
+    ```
+    """
+
+    def __init__(self,
+                 max_chars:int | None = None,
+                 fields:list | None = None,
+                 max_items:int | None = None,
+                 retain:bool = False) -> None:
+        """
+        Initialize policy.
+
+        max_chars -- Maximum characters of the serialized response (default None)
+        fields -- Fields to keep, ex: `['format_hint', 'forecasts.days']` (default None, all)
+        max_items -- Maximum items kept of each list (default None, all)
+        retain -- Keep full response in a `ResultStore` (default False)
+        """
+        self.max_chars = max_chars
+        self.fields = _field_tree(fields) if fields else None
+        self.max_items = max_items
+        self.retain = retain
+
+
+    @staticmethod
+    def from_dict(config:dict) -> 'ResultPolicy':
+        """
+        Policy from configuration, ex: `{ "max_items": 7, "retain": true }`
+        """
+        return ResultPolicy(**config)
+
+
+    def apply(self, result:any) -> tuple:
+        """
+        Compact tool response.
+
+        result -- Tool response
+        returns -- Tuple of compacted response, & whether it was changed
+        """
+        compacted = result
+        if self.fields is not None:
+            compacted = _project(compacted, self.fields)
+        if self.max_items is not None:
+            compacted = _truncate_lists(compacted, self.max_items)
+
+        if self.max_chars is not None:
+            serialized = json.dumps(compacted, default=str)
+            max_items = self.max_items or _longest_list(compacted)
+            while len(serialized) > self.max_chars and max_items > 1:
+                max_items //= 2
+                compacted = _truncate_lists(compacted, max_items)
+                serialized = json.dumps(compacted, default=str)
+
+            if len(serialized) > self.max_chars:
+                compacted = {
+                    'truncated': f'{len(serialized) - self.max_chars} of {len(serialized)} characters left out',
+                    'preview': serialized[:self.max_chars],
+                }
+
+        return (compacted, compacted != result)
+
+
+
+class ResultStore:
+    """
+    Full tool responses, kept outside the prompt, by ID. The oldest are
+    evicted when more than `max_results` are kept.
+    """
+
+    def __init__(self, max_results:int = 100) -> None:
+        self.max_results = max_results
+        self._results = OrderedDict()
+        self._ids = count(1)
+        self._lock = Lock()
+
+
+    def put(self, result:any) -> str:
+        """
+        Keep response.
+
+        returns -- ID of response. ex: `result_1`
+        """
+        with self._lock:
+            result_id = f'result_{next(self._ids)}'
+            self._results[result_id] = result
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+            return result_id
+
+
+    def get(self, result_id:str) -> any:
+        """
+        Full response by ID, or None if unknown or evicted.
+        """
+        with self._lock:
+            return self._results.get(result_id)
+
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+
+
+def compact_result(result:any, policy:ResultPolicy | None, store:ResultStore | None = None) -> any:
+    """
+    Apply policy to tool response, keeping the full response in store if the
+    policy retains responses & the response was compacted.
+
+    result -- Tool response
+    policy -- Policy of tool, or None to send response in full
+    store -- Store for retained responses (default None)
+    returns -- Response to send to the model, `result` itself if unchanged
+    """
+    if policy is None:
+        return result
+
+    (compacted, changed) = policy.apply(result)
+    if not changed:
+        return result
+    if policy.retain and store is not None:
+        result_id = store.put(result)
+        if isinstance(compacted, dict):
+            compacted = { **compacted, 'result_id': result_id }
+        else:
+            compacted = { 'result': compacted, 'result_id': result_id }
+    return compacted
+
+
+def load_policies(path:str) -> dict:
+    """
+    Load policies by tool name from a JSON file, ex:
+    `{ "get_weather_forecasts": { "max_items": 7 }, "*": { "max_chars": 8000 } }`
+    """
+    with open(path) as f:
+        return { name: ResultPolicy.from_dict(config) for (name, config) in json.load(f).items() }
+
+
+def _field_tree(fields:list) -> dict:
+    """
+    Dotted fields as a tree. ex: `['a.b', 'c']` -> `{ 'a': { 'b': {} }, 'c': {} }`
+    """
+    tree = {}
+    for field in fields:
+        node = tree
+        for part in field.split('.'):
+            node = node.setdefault(part, {})
+    return tree
+
+
+def _project(value:any, tree:dict) -> any:
+    """
+    Keep fields in tree of objects, & of objects in lists. An empty tree
+    keeps the value in full.
+    """
+    if len(tree) == 0:
+        return value
+    if isinstance(value, dict):
+        return { key: _project(value[key], subtree) for (key, subtree) in tree.items() if key in value }
+    if isinstance(value, (list, tuple)):
+        return [_project(item, tree) for item in value]
+    return value
+
+
+def _truncate_lists(value:any, max_items:int) -> any:
+    """
+    Keep first `max_items` of each list, followed by a marker of how many
+    were left out.
+    """
+    if isinstance(value, dict):
+        return { key: _truncate_lists(item, max_items) for (key, item) in value.items() }
+    if isinstance(value, (list, tuple)):
+        items = [_truncate_lists(item, max_items) for item in value[:max_items]]
+        if len(value) > max_items:
+            items.append(f'... {len(value) - max_items} more items, {len(value)} in total')
+        return items
+    return value
+
+
+def _longest_list(value:any) -> int:
+    """
+    Length of longest list in value.
+    """
+    if isinstance(value, dict):
+        return max((_longest_list(item) for item in value.values()), default=0)
+    if isinstance(value, (list, tuple)):
+        return max([len(value)] + [_longest_list(item) for item in value])
+    return 0
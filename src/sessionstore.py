@@ -0,0 +1,187 @@
+import json
+import sqlite3
+import zlib
+from threading import Lock
+from time import time
+
+# encoding of stored message content
+_text = 0
+_json = 1
+_zlib = 2
+
+
+class SessionStore:
+    """
+    SQLite backed store of conversations. Each session is an append-only log
+    of messages, so saving a turn only writes the new messages.
+
+    Tool responses (JSON content) are stored re-encoded without whitespace,
+    and content larger than `compress_threshold` bytes is compressed. Other
+    keys of a message, ex: `tool_calls` & `tool_call_id` of `native` tool
+    calls, are stored as JSON, and content may be None.
+
+    Usage in code
+    ```
+    store = SessionStore('sessions.db')
+    store.append(session_id, 0, [{ 'role': 'user', 'content': 'Hi' }])
+    messages = store.load(session_id)
+    ```
+
+    The system message is not stored, as it is shared by all sessions.
+    """
+
+    def __init__(self, path:str = 'sessions.db', compress_threshold:int = 1024) -> None:
+        """
+        Open, or create, store.
+
+        path -- SQLite database file, or `:memory:` (default sessions.db)
+        compress_threshold -- Minimum bytes of content to compress (default 1024)
+        """
+        self.path = path
+        self.compress_threshold = compress_threshold
+        self._lock = Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+
+        with self._lock, self._db:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('''CREATE TABLE IF NOT EXISTS sessions (
+                                    session_id TEXT PRIMARY KEY,
+                                    created REAL,
+                                    updated REAL)''')
+            self._db.execute('''CREATE TABLE IF NOT EXISTS messages (
+                                    session_id TEXT,
+                                    seq INTEGER,
+                                    role TEXT,
+                                    encoding INTEGER,
+                                    content BLOB,
+                                    extra TEXT,
+                                    PRIMARY KEY (session_id, seq)) WITHOUT ROWID''')
+            # stores created before other message keys were stored
+            columns = [row[1] for row in self._db.execute('PRAGMA table_info(messages)')]
+            if 'extra' not in columns:
+                self._db.execute('ALTER TABLE messages ADD COLUMN extra TEXT')
+
+
+    def _encode(self, content:str | None) -> tuple:
+        """
+        Encode message content.
+
+        returns -- Tuple of encoding & bytes, or None if no content
+        """
+        encoding = _text
+        if content is None:
+            return (encoding, None)
+        if content[:1] in ('{', '['):
+            try:
+                content = json.dumps(json.loads(content), separators=(',', ':'))
+                encoding = _json
+            except ValueError:
+                pass
+
+        data = content.encode()
+        if len(data) >= self.compress_threshold:
+            return (encoding | _zlib, zlib.compress(data))
+        return (encoding, data)
+
+
+    def _decode(self, encoding:int, data:bytes | None) -> str | None:
+        """
+        Decode message content. See @_encode
+        """
+        if data is None:
+            return None
+        if encoding & _zlib:
+            data = zlib.decompress(data)
+        return data.decode()
+
+
+    def _encode_extra(self, message:dict) -> str | None:
+        """
+        Encode keys of message other than `role` & `content`.
+
+        returns -- JSON object, or None if no other keys
+        """
+        extra = { k: v for (k, v) in message.items() if k not in ('role', 'content') }
+        return json.dumps(extra, separators=(',', ':')) if extra else None
+
+
+    def create(self, session_id:str) -> None:
+        """
+        Record new, empty session.
+
+        session_id -- Session ID
+        """
+        now = time()
+        with self._lock, self._db:
+            self._db.execute('INSERT OR IGNORE INTO sessions VALUES (?, ?, ?)', (session_id, now, now))
+
+
+    def exists(self, session_id:str) -> bool:
+        """
+        Checks whether session is stored.
+        """
+        with self._lock:
+            row = self._db.execute('SELECT 1 FROM sessions WHERE session_id = ?', (session_id,)).fetchone()
+        return row is not None
+
+
+    def append(self, session_id:str, start:int, messages:list) -> None:
+        """
+        Append messages to session log.
+
+        session_id -- Session ID
+        start -- Sequence number of first message, i.e. number of messages
+        already stored
+        messages -- List of `{ 'role': ..., 'content': ... }` messages, with
+        any other keys, ex: `tool_calls`
+        """
+        rows = [(session_id, start + i, m['role'], *self._encode(m.get('content')), self._encode_extra(m))
+                for (i, m) in enumerate(messages)]
+        now = time()
+
+        with self._lock, self._db:
+            self._db.execute('INSERT OR IGNORE INTO sessions VALUES (?, ?, ?)', (session_id, now, now))
+            self._db.execute('UPDATE sessions SET updated = ? WHERE session_id = ?', (now, session_id))
+            self._db.executemany('INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+
+    def load(self, session_id:str) -> list:
+        """
+        Load session messages, in order.
+
+        session_id -- Session ID
+        returns -- List of `{ 'role': ..., 'content': ... }` messages, with
+        any other keys stored
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT role, encoding, content, extra FROM messages WHERE session_id = ? ORDER BY seq',
+                                    (session_id,)).fetchall()
+
+        return [{ 'role': role, 'content': self._decode(encoding, data), **(json.loads(extra) if extra else {}) }
+                for (role, encoding, data, extra) in rows]
+
+
+    def delete(self, session_id:str) -> None:
+        """
+        Delete session & its messages.
+        """
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM messages WHERE session_id = ?', (session_id,))
+            self._db.execute('DELETE FROM sessions WHERE session_id = ?', (session_id,))
+
+
+    def session_ids(self) -> list:
+        """
+        IDs of stored sessions, most recently updated first.
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT session_id FROM sessions ORDER BY updated DESC').fetchall()
+        return [row[0] for row in rows]
+
+
+    def close(self) -> None:
+        """
+        Close database.
+        """
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,140 @@
+import json
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+
+
+class StartupProfiler:
+    """
+    Records a timing breakdown of startup stages, ex: importing tools,
+    `load_dotenv`, `DocExtractor` construction, & of each stage of registering
+    each tool, ex: docstring extraction & validation.
+
+    Usage in code
+    ```
+    from startupprofiler import startup_profiler
+
+    with startup_profiler.stage('load_dotenv'):
+        load_dotenv()
+
+    with startup_profiler.tool_stage('get_weather_forecast', 'extraction'):
+        ...
+
+    print(startup_profiler.to_json())
+    ```
+
+    Call @finish when startup is done. Stages after, ex: tools registered or
+    reloaded while serving, are not recorded, so the profile does not grow
+    for the life of the process.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialize profiler. Time is measured from initialization.
+        """
+        self._start = perf_counter()
+        self._lock = Lock()
+        self._depth = 0
+        self._end = None
+        self.stages = []
+        self.tools = {}
+
+
+    @property
+    def finished(self) -> bool:
+        """
+        True, once startup is done. See @finish
+        """
+        return self._end is not None
+
+
+    def finish(self) -> None:
+        """
+        Stop recording, at the end of startup.
+        """
+        with self._lock:
+            if self._end is None:
+                self._end = perf_counter()
+
+
+    @contextmanager
+    def stage(self, name:str):
+        """
+        Context manager to time a startup stage. Stages can be nested.
+
+        name -- Name of stage. ex: `import tools`
+        """
+        if self.finished:
+            yield
+            return
+
+        start = perf_counter()
+        depth = self._depth
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            with self._lock:
+                self.stages.append({
+                    'stage': name,
+                    'depth': depth,
+                    'start_seconds': start - self._start,
+                    'seconds': perf_counter() - start,
+                })
+
+
+    @contextmanager
+    def tool_stage(self, tool:str, name:str):
+        """
+        Context manager to time a stage of registering a tool. Time for repeated
+        stages is summed.
+
+        tool -- Name of tool. ex: `get_weather_forecast`
+        name -- Name of stage. ex: `extraction`
+        """
+        if self.finished:
+            yield
+            return
+
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            seconds = perf_counter() - start
+            with self._lock:
+                stages = self.tools.setdefault(tool, {})
+                stages[name] = stages.get(name, 0.0) + seconds
+
+
+    def report(self) -> dict:
+        """
+        Structured timing report.
+
+        returns -- Dictionary with total, per stage & per tool timings in seconds
+        """
+        with self._lock:
+            stages = sorted(self.stages, key=lambda s: s['start_seconds'])
+            tools = {
+                tool: { **stages_, 'total': sum(stages_.values()) }
+                for (tool, stages_) in self.tools.items()
+            }
+
+        return {
+            'total_seconds': (self._end or perf_counter()) - self._start,
+            'stages': stages,
+            'tools': tools,
+        }
+
+
+    def to_json(self) -> str:
+        """
+        Report as JSON. See @report
+        """
+        return json.dumps(self.report(), indent=2)
+
+
+"""
+Singleton instance of StartupProfiler, started when first imported.
+"""
+startup_profiler = StartupProfiler()
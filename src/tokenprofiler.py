@@ -0,0 +1,234 @@
+import argparse
+import json
+import re
+from functools import lru_cache
+from threading import Lock
+
+"""
+Pre-tokenization, similar to the Llama 3 (& GPT-4) tokenizer: contractions,
+words with a leading space, numbers of up to 3 digits, punctuation runs &
+whitespace. Byte-pair merges then split each piece into 1 or more tokens.
+"""
+_pieces = re.compile(r"""'(?:[sdmt]|ll|ve|re)| ?[^\W\d_]+| ?\d{1,3}| ?(?:[^\s\w]|_)+|\s+""", re.IGNORECASE)
+
+# tokens added by the chat template around each message, ex: role headers
+message_overhead = 4
+
+# estimates of recent text, by text. The oldest are evicted once the text
+# kept exceeds `max_estimated_chars`, so long histories are not all kept in
+# memory. See `estimate_tokens`
+_estimates = {}
+_estimated_chars = 0
+_estimates_lock = Lock()
+max_estimated_chars = 1024 * 1024
+
+
+@lru_cache(maxsize=65536)
+def _piece_tokens(piece:str) -> int:
+    """
+    Approximate number of byte-pair tokens in a pre-tokenized piece. Common
+    English words are a single token; longer words, non-ASCII text &
+    punctuation runs are split into several.
+    """
+    stripped = piece.lstrip(' ')
+    if len(stripped) == 0 or stripped.isspace():
+        return 1
+    if not stripped.isascii():
+        return max(1, (len(stripped.encode()) + 1) // 2)
+    if stripped[0].isalpha():
+        return 1 + (len(stripped) - 1) // 7
+    if stripped[0].isdigit():
+        return 1
+    return (len(stripped) + 1) // 2
+
+
+def estimate_tokens(text:str) -> int:
+    """
+    Estimate tokens in text, without a tokenizer. Accurate to within ~10-15%
+    for English & JSON. Results are cached, so repeated text, ex: the system
+    prompt, is only estimated once.
+
+    text -- Text to estimate
+    returns -- Approximate number of tokens
+    """
+    global _estimated_chars
+
+    tokens = _estimates.get(text)
+    if tokens is None:
+        tokens = sum(_piece_tokens(piece) for piece in _pieces.findall(text))
+        if len(text) <= max_estimated_chars:
+            with _estimates_lock:
+                if text not in _estimates:
+                    _estimates[text] = tokens
+                    _estimated_chars += len(text)
+                # evict oldest estimates
+                while _estimated_chars > max_estimated_chars:
+                    oldest = next(iter(_estimates))
+                    _estimated_chars -= len(oldest)
+                    del _estimates[oldest]
+    return tokens
+
+
+
+class RequestProfiler:
+    """
+    Breaks down the estimated tokens of an LLM request by component:
+    - `template`, system prompt excluding tool markup
+    - `tools`, tool markup in the system prompt or `tools` field, & `tool_schemas`, per tool
+    - `history`, user & assistant messages
+    - `tool_responses`, tool responses sent back to the model, each listed in
+    `tool_response_sizes`
+    - `total`, including per-message template overhead
+
+    Components exceeding `budgets` are listed in `exceeded`. ex:
+    `RequestProfiler(llm_tool_util, budgets={ 'total': 6000, 'tool_response': 1000 })`
+    flags requests over 6000 tokens, & any single tool response over 1000.
+
+    Usage in code
+    ```
+    client = LLMClient(..., profiler=RequestProfiler(llm_tool_util, budgets={ 'total': 6000 }))
+    client.request(prompt)
+    client.last_profile
+    ```
+    """
+
+    def __init__(self, tool_util = None, tool_format:str = 'json', budgets:dict | None = None) -> None:
+        """
+        Initialize profiler.
+
+        tool_util -- Tool registry whose markup is in the system prompt (default None)
+        tool_format -- Format of tool markup, `json` or `compact` (default json)
+        budgets -- Maximum tokens, by component, or `tool_response` for each
+        tool response (default None)
+        """
+        self.tool_util = tool_util
+        self.tool_format = tool_format
+        self.budgets = budgets or {}
+        self._schemas = (None, None)
+
+
+    def _tool_schemas(self) -> tuple:
+        """
+        Tool markup, & each tool's part of it, rendered once per snapshot of
+        registered tools.
+
+        returns -- Tuple of markup & dictionary of tool name to markup
+        """
+        if self.tool_util is None:
+            return ('', {})
+
+        (snapshot, schemas) = self._schemas
+        if snapshot is not self.tool_util._tools:
+            snapshot = self.tool_util._tools
+            schemas = self._render_tool_schemas()
+            self._schemas = (snapshot, schemas)
+        return schemas
+
+
+    def _render_tool_schemas(self) -> tuple:
+        """
+        Render tool markup, & each tool's part of it. See @_tool_schemas
+        """
+        markup = self.tool_util.render_tool_markup(self.tool_format)
+        if self.tool_format == 'json':
+            schemas = { tool['function']['name']: json.dumps(tool, separators=(',', ':'))
+                        for tool in self.tool_util.generate_tool_markup() }
+        else:
+            # each tool is a block starting with its signature, followed by indented arguments
+            schemas = {}
+            for line in markup.splitlines():
+                if not line.startswith(' '):
+                    name = line.split('(', 1)[0]
+                    schemas[name] = line
+                else:
+                    schemas[name] += '\n' + line
+        return (markup, schemas)
+
+
+    def profile(self, messages:list, tools:list | None = None) -> dict:
+        """
+        Estimate tokens of request with messages.
+
+        messages -- List of `{ 'role': ..., 'content': ... }`, system message first
+        tools -- Tools sent in the request's `tools` field, instead of the
+        system prompt. See `LLMClient` (default None)
+        returns -- Dictionary of tokens by component, & components exceeding budgets
+        """
+        system = messages[0]['content'] if len(messages) > 0 and messages[0]['role'] == 'system' else ''
+        if tools:
+            schemas = { tool['function']['name']: json.dumps(tool, separators=(',', ':')) for tool in tools }
+            tools = sum(estimate_tokens(schema) for schema in schemas.values())
+            template = estimate_tokens(system)
+        else:
+            (markup, schemas) = self._tool_schemas()
+            tools = estimate_tokens(markup) if markup and markup in system else 0
+            template = estimate_tokens(system) - tools if system else 0
+
+        history = 0
+        tool_responses = []
+        for message in messages[1 if system else 0:]:
+            content = message['content'] or ''
+            tokens = estimate_tokens(content)
+            if message['role'] == 'tool' or (message['role'] == 'user' and _is_tool_response(content)):
+                tool_responses.append(tokens)
+            else:
+                history += tokens
+            if message.get('tool_calls'):
+                history += estimate_tokens(json.dumps(message['tool_calls'], separators=(',', ':')))
+
+        profile = {
+            'template': template,
+            'tools': tools,
+            'tool_schemas': { name: estimate_tokens(schema) for (name, schema) in schemas.items() } if tools else {},
+            'history': history,
+            'tool_responses': sum(tool_responses),
+            'tool_response_sizes': tool_responses,
+            'messages': len(messages),
+            'total': template + tools + history + sum(tool_responses) + message_overhead * len(messages),
+        }
+
+        exceeded = [component for (component, budget) in self.budgets.items()
+                    if component in profile and isinstance(profile[component], int) and profile[component] > budget]
+        if 'tool_response' in self.budgets and any(t > self.budgets['tool_response'] for t in tool_responses):
+            exceeded.append('tool_response')
+        profile['exceeded'] = exceeded
+
+        return profile
+
+
+def _is_tool_response(content:str) -> bool:
+    """
+    Checks whether a user message is a tool response, i.e. JSON sent by
+    `Assistant.handle`.
+    """
+    if content[:1] not in '{["-0123456789' and content not in ('null', 'true', 'false'):
+        return False
+    try:
+        json.loads(content)
+        return True
+    except ValueError:
+        return False
+
+
+
+###########
+# Profile #
+###########
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Estimate tokens of the assistant system prompt, by component.')
+    parser.add_argument('--tool-format', default='json', choices=['json', 'compact', 'native'])
+    parser.add_argument('--text', help='Estimate tokens of text instead')
+    args = parser.parse_args()
+
+    if args.text is not None:
+        print(estimate_tokens(args.text))
+    else:
+        import tools
+        from assistant import Assistant
+        from llmtoolutil import llm_tool_util
+
+        system_message = Assistant.build_system_message(args.tool_format)
+        openai_tools = llm_tool_util.generate_openai_tool_markup() if args.tool_format == 'native' else None
+        profile = RequestProfiler(llm_tool_util, args.tool_format).profile([{ 'role': 'system', 'content': system_message }],
+                                                                         openai_tools)
+        print(json.dumps(profile, indent=2))
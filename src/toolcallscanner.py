@@ -0,0 +1,192 @@
+import json
+import logging
+import re
+
+_specials = re.compile(r'[{}"\\\n]')
+_whitespace = ' \t\r\n'
+
+
+class ToolCallScanner:
+    """
+    Single pass scanner that finds JSON objects, and tool calls, anywhere in a
+    model response. Handles responses where the tool call is wrapped in a
+    ```json fence, or has prose before or after it.
+
+    Text can be scanned all at once, or incrementally as chunks are streamed
+    ```
+    scanner = ToolCallScanner()
+    for chunk in stream:
+        for tool_call in scanner.feed(chunk):
+            ...
+    ```
+
+    Each character is visited once. Braces are only tracked from a `{` that is
+    followed by a `"` (i.e. the start of a JSON object), so braces in prose do
+    not swallow the rest of the response. JSON strings cannot contain a line
+    break, so a candidate with an unterminated string, ex: `{"` in prose, is
+    dropped at the end of its line.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialize scanner.
+        """
+        self.objects = []
+        self.invalid = 0
+        self._parts = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._opening = False
+
+
+    def feed(self, chunk:str) -> list:
+        """
+        Scan next chunk of text.
+
+        chunk -- Text to scan, continuing from the previous chunk
+        returns -- List of tool calls completed in this chunk
+        """
+        objects = []
+        start = 0
+        i = 0
+        n = len(chunk)
+
+        while i < n:
+            # skip character escaped at the end of previous chunk
+            if self._escaped:
+                self._escaped = False
+                i += 1
+                continue
+
+            # outside of an object, jump to the next candidate
+            if self._depth == 0 and not self._opening:
+                i = chunk.find('{', i)
+                if i == -1:
+                    break
+                self._opening = True
+                self._parts = []
+                start = i
+                i += 1
+                continue
+
+            # only a `{` followed by a key (or whitespace) can start an object
+            if self._opening:
+                c = chunk[i]
+                if c in _whitespace:
+                    i += 1
+                    continue
+
+                self._opening = False
+                if c == '"':
+                    self._depth = 1
+                    self._in_string = True
+                    i += 1
+                else:
+                    self._parts = []
+                continue
+
+            match = _specials.search(chunk, i)
+            if match is None:
+                break
+            c = match.group()
+            i = match.end()
+
+            if self._in_string and c == '\n':
+                # unterminated string, scan again from the next line
+                self.invalid += 1
+                self._depth = 0
+                self._in_string = False
+                self._parts = []
+            elif self._in_string:
+                if c == '\\':
+                    if i < n:
+                        i += 1
+                    else:
+                        self._escaped = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c == '{':
+                self._depth += 1
+            elif c == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    obj = self._decode(''.join(self._parts) + chunk[start:i])
+                    self._parts = []
+                    if obj is not None:
+                        objects.append(obj)
+                    else:
+                        self.invalid += 1
+
+        # carry partial object over to next chunk
+        if self._depth > 0 or self._opening:
+            self._parts.append(chunk[start:])
+
+        self.objects.extend(objects)
+        return [obj for obj in objects if is_tool_call_json(obj)]
+
+
+    @property
+    def tool_calls(self) -> list:
+        """
+        All tool calls found so far.
+        """
+        return [obj for obj in self.objects if is_tool_call_json(obj)]
+
+
+    def _decode(self, text:str) -> dict | None:
+        """
+        Decode candidate object. Returns None if not a JSON object.
+        """
+        try:
+            obj = json.loads(text)
+            return obj if isinstance(obj, dict) else None
+        except ValueError as ve:
+            logging.debug(ve)
+            return None
+
+
+
+def is_tool_call_json(obj:dict) -> bool:
+    """
+    Checks whether JSON object is a tool call, i.e. has `name` & `parameters`.
+    """
+    return 'name' in obj and 'parameters' in obj
+
+
+def find_json_objects(text:str) -> list:
+    """
+    Find all top-level JSON objects in text.
+
+    text -- Text to scan
+    returns -- List of dictionaries
+    """
+    scanner = ToolCallScanner()
+    scanner.feed(text)
+    return scanner.objects
+
+
+def count_invalid_json(text:str) -> int:
+    """
+    Count candidate JSON objects in text that fail to decode, ex: a tool call
+    with a trailing comma.
+
+    text -- Text to scan. ex: model response
+    returns -- Number of invalid objects
+    """
+    scanner = ToolCallScanner()
+    scanner.feed(text)
+    return scanner.invalid
+
+
+def find_tool_calls(text:str) -> list:
+    """
+    Find all tool calls in text.
+
+    text -- Text to scan. ex: model response
+    returns -- List of tool call dictionaries with `name` & `parameters`
+    """
+    scanner = ToolCallScanner()
+    return scanner.feed(text)
@@ -0,0 +1,96 @@
+import argparse
+import json
+
+from assistant import Assistant
+from llmtoolutil import llm_tool_util
+
+
+"""
+Prompts used to compare tool formats. Each case is the user prompt and the name
+of the tool the model is expected to call, or None if the model should answer
+from training data.
+"""
+default_cases = [
+    ('What will the temperature be in London, next Monday?', 'get_weather_forecast'),
+    ('What will be the weather in San Francisco on Friday?', 'get_weather_forecast'),
+    ('Will it rain in Paris tomorrow?', 'get_weather_forecast'),
+    ('Who was the first president of the united states?', None),
+    ('Who were the top 3 gold medal winning countries in the Tokyo olympics?', None),
+]
+
+
+def evaluate_format(tool_format:str, cases:list) -> dict:
+    """
+    Send each prompt, in a new conversation, to the assistant model with tools
+    rendered in `tool_format` and check whether the model called the expected
+    tool.
+
+    tool_format -- Tool markup format. See `llm_tool_util.render_tool_markup`,
+    or `native` for tools in the request's `tools` field
+    cases -- List of (prompt, expected tool name or None)
+    returns -- Dictionary with markup size, prompt tokens & tool call accuracy
+    """
+    if tool_format == 'native':
+        markup = json.dumps(llm_tool_util.generate_openai_tool_markup(), separators=(',', ':'))
+    else:
+        markup = llm_tool_util.render_tool_markup(tool_format)
+    results = []
+
+    for (prompt, expected) in cases:
+        assistant = Assistant(tool_format=tool_format)
+        response = assistant._client.request(prompt)
+        usage = assistant._client.last_usage or {}
+
+        tool_calls = assistant._tool_calls(response)
+        called = tool_calls[0]['name'] if len(tool_calls) > 0 else None
+
+        results.append({
+            'prompt': prompt,
+            'expected': expected,
+            'called': called,
+            'correct': called == expected,
+            'prompt_tokens': usage.get('prompt_tokens'),
+        })
+
+    tokens = [r['prompt_tokens'] for r in results if r['prompt_tokens'] is not None]
+
+    return {
+        'format': tool_format,
+        'markup_chars': len(markup),
+        'avg_prompt_tokens': sum(tokens) / len(tokens) if len(tokens) > 0 else None,
+        'accuracy': sum(r['correct'] for r in results) / len(results) if len(results) > 0 else None,
+        'results': results,
+    }
+
+
+def load_cases(path:str) -> list:
+    """
+    Load cases from a JSONL file, with one `{"prompt": ..., "expected": ...}`
+    object per line.
+
+    path -- Path to JSONL file
+    returns -- List of (prompt, expected tool name or None)
+    """
+    with open(path) as f:
+        return [(case['prompt'], case.get('expected'))
+                for case in map(json.loads, filter(str.strip, f))]
+
+
+
+#######
+# Run #
+#######
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare prompt tokens & tool call accuracy between tool markup formats.')
+    parser.add_argument('--formats', nargs='+', default=['json', 'compact'])
+    parser.add_argument('--cases', help='JSONL file of `{"prompt": ..., "expected": ...}` cases')
+    args = parser.parse_args()
+
+    cases = load_cases(args.cases) if args.cases else default_cases
+    report = [evaluate_format(f, cases) for f in args.formats]
+
+    print(json.dumps(report, indent=2))
+    for r in report:
+        tokens = 'n/a' if r['avg_prompt_tokens'] is None else f"{r['avg_prompt_tokens']:.0f}"
+        accuracy = 'n/a' if r['accuracy'] is None else f"{r['accuracy']:.0%}"
+        print(f"{r['format']}: {r['markup_chars']} chars, {tokens} avg prompt tokens, {accuracy} accuracy")
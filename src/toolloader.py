@@ -0,0 +1,278 @@
+import ast
+import builtins
+import glob
+import importlib
+import logging
+from inspect import Parameter, Signature
+from os.path import basename, join
+from threading import Lock
+from time import perf_counter
+
+from startupprofiler import startup_profiler
+
+
+"""
+Seconds taken to import each lazily loaded tool module, by module name.
+"""
+import_costs = {}
+
+# lazy tools, by (module, name), whose module has not been imported yet
+_pending = {}
+_pending_lock = Lock()
+
+# stand-in types for annotations that are not builtins, by name
+_annotation_types = {}
+
+
+class LazyTool:
+    """
+    Stand-in for a tool function whose module has not been imported yet. It
+    carries the tool's name, docstring & signature, read from the module's
+    source without importing it, so that it can be registered with
+    `llm_tool_util.llm_tool` like the function itself.
+
+    The defining module is imported when the tool is first called (or
+    `load` is called). While it is imported, the module's `@llm_tool`
+    decorator binds the real function to this proxy instead of registering it
+    again.
+    """
+
+    def __init__(self, module:str, name:str, doc:str | None, signature:Signature) -> None:
+        """
+        Initialize proxy. See @scan_tool_module
+
+        module -- Name of defining module. ex: `tools.weather_tool`
+        name -- Name of function
+        doc -- Function docstring
+        signature -- Function signature
+        """
+        self.__module__ = module
+        self.__name__ = name
+        self.__qualname__ = name
+        self.__doc__ = doc
+        self.__signature__ = signature
+        self._func = None
+        self._lock = Lock()
+
+
+    @property
+    def is_loaded(self) -> bool:
+        """
+        True, if the defining module has been imported.
+        """
+        return self._func is not None
+
+
+    def load(self) -> callable:
+        """
+        Import the defining module, if not yet imported, and return the real
+        function.
+        """
+        if self._func is not None:
+            return self._func
+
+        with self._lock:
+            if self._func is None:
+                start = perf_counter()
+                module = importlib.import_module(self.__module__)
+                import_costs.setdefault(self.__module__, perf_counter() - start)
+
+                # module may not register the function, ex: decorator removed
+                if self._func is None:
+                    _release(self)
+                    self._func = getattr(module, self.__name__)
+
+                logging.debug(f'Loaded `{self.__name__}` from `{self.__module__}`')
+
+        return self._func
+
+
+    def _bind(self, func:callable) -> None:
+        """
+        Bind real function to proxy.
+        """
+        self._func = func
+
+
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+
+    def __repr__(self) -> str:
+        return f'<LazyTool {self.__module__}.{self.__name__}{" (loaded)" if self.is_loaded else ""}>'
+
+
+
+def claim_lazy_tool(func:callable) -> bool:
+    """
+    Bind function to its pending lazy tool, if any. Called by
+    `llm_tool_util.llm_tool` when a tool's module is imported.
+
+    func -- Function being registered
+    returns -- True, if the function was bound to a lazy tool & should not be
+    registered again
+    """
+    if isinstance(func, LazyTool):
+        return False
+
+    with _pending_lock:
+        proxy = _pending.pop((func.__module__, func.__name__), None)
+
+    if proxy is None:
+        return False
+
+    # a tool kept after its new details failed to register keeps the code it
+    # was loaded with. See @register_lazy_tool
+    if not proxy.is_loaded:
+        proxy._bind(func)
+    return True
+
+
+def _release(proxy:LazyTool) -> None:
+    """
+    Remove proxy from pending lazy tools.
+    """
+    with _pending_lock:
+        if _pending.get((proxy.__module__, proxy.__name__)) is proxy:
+            del _pending[(proxy.__module__, proxy.__name__)]
+
+
+def _annotation_type(node:ast.expr | None) -> type:
+    """
+    Resolve annotation without importing anything. Builtin types are
+    resolved, other annotations are replaced by a stand-in type with the same
+    name. ex: `datetime`
+    """
+    if node is None:
+        return Parameter.empty
+
+    name = ast.unparse(node)
+    t = getattr(builtins, name, None)
+    if isinstance(t, type):
+        return t
+
+    if name not in _annotation_types:
+        _annotation_types[name] = type(name.split('.')[-1], (), { '__module__': __name__ })
+    return _annotation_types[name]
+
+
+def _is_llm_tool_decorator(node:ast.expr) -> bool:
+    """
+    Checks whether decorator is `llm_tool`, ex: `@llm_tool_util.llm_tool`
+    """
+    return ((isinstance(node, ast.Attribute) and node.attr == 'llm_tool')
+            or (isinstance(node, ast.Name) and node.id == 'llm_tool'))
+
+
+def scan_tool_module(path:str, module:str) -> list:
+    """
+    Read the functions decorated with `llm_tool` from a module's source,
+    without importing it.
+
+    path -- Path to module source
+    module -- Name of module. ex: `tools.weather_tool`
+    returns -- List of `LazyTool`
+    """
+    with open(path) as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    tools = []
+    for node in tree.body:
+        if not isinstance(node, ast.FunctionDef):
+            continue
+        if not any(_is_llm_tool_decorator(d) for d in node.decorator_list):
+            continue
+
+        args = node.args.args
+        defaults = [Parameter.empty] * (len(args) - len(node.args.defaults)) + node.args.defaults
+
+        params = []
+        for (arg, default) in zip(args, defaults):
+            if default is not Parameter.empty:
+                try:
+                    default = ast.literal_eval(default)
+                except ValueError:
+                    default = ast.unparse(default)
+
+            params.append(Parameter(arg.arg,
+                                    Parameter.POSITIONAL_OR_KEYWORD,
+                                    default=default,
+                                    annotation=_annotation_type(arg.annotation)))
+
+        signature = Signature(params, return_annotation=_annotation_type(node.returns))
+        tools.append(LazyTool(module, node.name, ast.get_docstring(node), signature))
+
+    return tools
+
+
+def register_lazy_tools(directory:str, package:str, tool_util) -> list:
+    """
+    Register the tools in every module of a package with `tool_util`,
+    without importing the modules. Each module is imported when one of its
+    tools is first called.
+
+    directory -- Directory of package. ex: `src/tools`
+    package -- Name of package. ex: `tools`
+    tool_util -- Tool registry. ex: `llm_tool_util`
+    returns -- List of registered `LazyTool`
+    """
+    registered = []
+
+    for path in sorted(glob.glob(join(directory, '*.py'))):
+        if path.endswith('__init__.py'):
+            continue
+
+        module = f'{package}.{basename(path)[:-3]}'
+        with startup_profiler.stage(f'scan {module}'):
+            tools = scan_tool_module(path, module)
+
+        for tool in tools:
+            if register_lazy_tool(tool, tool_util):
+                registered.append(tool)
+
+    return registered
+
+
+def register_lazy_tool(tool:LazyTool, tool_util, doc:dict | None = None) -> bool:
+    """
+    Register a lazy tool with `tool_util`. The tool is bound to its function
+    when its module is next imported.
+
+    tool -- Tool read by @scan_tool_module
+    tool_util -- Tool registry. ex: `llm_tool_util`
+    doc -- Details already extracted from the tool's unchanged docstring, to
+    skip extraction & validation (default None)
+    returns -- True, if registered. Otherwise, a previous lazy tool of the
+    same module & name stays registered, with the code it was loaded with,
+    or the new code if not loaded yet
+    """
+    key = (tool.__module__, tool.__name__)
+    previous = tool_util._tool_funcs.get(tool.__name__)
+    with _pending_lock:
+        _pending[key] = tool
+
+    if doc is not None:
+        tool_util._add_tool(tool.__name__, tool, doc)
+    else:
+        tool_util.llm_tool(tool)
+
+    if tool_util._tool_funcs.get(tool.__name__) is tool:
+        return True
+
+    _release(tool)
+    if isinstance(previous, LazyTool) and (previous.__module__, previous.__name__) == key:
+        # the module may be imported again for another of its tools, so the
+        # decorator is claimed for the previous tool, instead of registering
+        # the function with extraction in the middle of a tool call
+        with _pending_lock:
+            _pending[key] = previous
+    return False
+
+
+def import_report() -> dict:
+    """
+    Import cost of each lazily loaded tool module.
+
+    returns -- Dictionary of seconds by module name
+    """
+    return dict(import_costs)
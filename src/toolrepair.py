@@ -0,0 +1,151 @@
+import logging
+from inspect import Parameter, signature
+
+from editdistance import edit_distance
+from metrics import metrics
+
+tool_call_repairs = metrics.counter('tool_call_repairs_total',
+                                    'Tool calls with a misspelled tool name, or unknown parameter, repaired locally',
+                                    ('tool', 'kind'))
+
+
+def max_edits(name:str) -> int:
+    """
+    Edits allowed to repair a name. Short names are more easily confused, so
+    allow fewer edits.
+    """
+    return 1 if len(name) <= 5 else 2
+
+
+def _normalize(name:str) -> str:
+    return name.strip().lower().replace('-', '_').replace(' ', '_')
+
+
+
+class NameIndex:
+    """
+    Names indexed by length, to find those closest to a misspelled name by
+    edit distance. Only names with a length within the allowed edits are
+    compared. Case, `-` & spaces are ignored, ex: `Get-Weather` matches
+    `get_weather` with no edits.
+    """
+
+    def __init__(self, names:list) -> None:
+        self._by_length = {}
+        for name in names:
+            normalized = _normalize(name)
+            self._by_length.setdefault(len(normalized), []).append((normalized, name))
+
+
+    def closest(self, name:str, exclude:set = frozenset()) -> list:
+        """
+        Names closest to `name`, within `max_edits(name)` edits.
+
+        name -- Misspelled name
+        exclude -- Names not to match (default none)
+        returns -- List of names at the smallest distance. Empty if no name is
+        close enough, & more than one if the match is ambiguous
+        """
+        normalized = _normalize(name)
+        max_distance = max_edits(normalized)
+        (best, matches) = (max_distance + 1, [])
+        for length in range(len(normalized) - max_distance, len(normalized) + max_distance + 1):
+            for (candidate, original) in self._by_length.get(length, []):
+                if original in exclude:
+                    continue
+                distance = edit_distance(normalized, candidate, max_distance)
+                if distance < best:
+                    (best, matches) = (distance, [original])
+                elif distance == best and distance <= max_distance:
+                    matches.append(original)
+        return matches
+
+
+
+class ToolCallRepairer:
+    """
+    Repairs near-miss tool calls of a snapshot of registered tools, so they
+    are invoked instead of costing another LLM round-trip:
+    - an unknown tool name, ex: `get_wether_forecast`, is replaced by the
+    registered name closest to it
+    - an unknown parameter is renamed to the parameter closest to it, that is
+    not already given, or dropped if no parameter is close. Tools that take
+    `**kwargs` keep all parameters
+
+    Names are repaired only when one name is the closest, within a few edits.
+    Ambiguous calls are left as they are. Every repair is logged.
+
+    Usage in code
+    ```
+    repairer = ToolCallRepairer(llm_tool_util._tool_funcs)
+    tool_json = repairer.repair({ 'name': 'get_wether_forecast', 'parameters': { 'lat': 51.5, 'lon': -0.1, 'dates': '2024-09-06' } })
+    ```
+    """
+
+    def __init__(self, funcs:dict) -> None:
+        """
+        Initialize repairer.
+
+        funcs -- Registered tool functions by name. ex: `llm_tool_util._tool_funcs`
+        """
+        self.funcs = funcs
+        self._names = NameIndex(list(funcs))
+        self._parameters = {}
+
+
+    def _tool_parameters(self, name:str) -> tuple:
+        """
+        Parameters of tool, indexed on first use.
+
+        returns -- Tuple of parameter names, their `NameIndex`, & whether the
+        tool takes any keyword argument
+        """
+        if name not in self._parameters:
+            parameters = signature(self.funcs[name]).parameters
+            names = [p.name for p in parameters.values() if p.kind in (Parameter.POSITIONAL_OR_KEYWORD, Parameter.KEYWORD_ONLY)]
+            self._parameters[name] = (set(names), NameIndex(names),
+                                      any(p.kind == Parameter.VAR_KEYWORD for p in parameters.values()))
+        return self._parameters[name]
+
+
+    def repair(self, tool_json:dict) -> dict:
+        """
+        Repair tool call.
+
+        tool_json -- Tool call with `name` & `parameters`
+        returns -- Repaired copy of tool call, or `tool_json` itself if
+        unchanged or not repairable
+        """
+        name = tool_json.get('name')
+        if not isinstance(name, str):
+            return tool_json
+
+        if name not in self.funcs:
+            matches = self._names.closest(name)
+            if len(matches) != 1:
+                return tool_json
+            logging.info(f'Repaired tool call: tool `{name}` -> `{matches[0]}`')
+            tool_call_repairs.inc(tool=matches[0], kind='tool_name')
+            tool_json = { **tool_json, 'name': matches[0] }
+            name = matches[0]
+
+        params = tool_json.get('parameters')
+        if not isinstance(params, dict):
+            return tool_json
+        (names, index, any_keyword) = self._tool_parameters(name)
+        unknown = [key for key in params if key not in names]
+        if len(unknown) == 0 or any_keyword:
+            return tool_json
+
+        repaired = dict(params)
+        for key in unknown:
+            matches = index.closest(key, exclude=set(repaired))
+            if len(matches) == 1:
+                logging.info(f'Repaired tool call: parameter `{key}` -> `{matches[0]}` of `{name}`')
+                tool_call_repairs.inc(tool=name, kind='parameter_renamed')
+                repaired[matches[0]] = repaired.pop(key)
+            elif len(matches) == 0:
+                logging.info(f'Repaired tool call: dropped unknown parameter `{key}` of `{name}`')
+                tool_call_repairs.inc(tool=name, kind='parameter_dropped')
+                del repaired[key]
+        return { **tool_json, 'parameters': repaired }
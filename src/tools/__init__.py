@@ -2,3 +2,15 @@ from os.path import dirname, basename, isfile, join
 import glob
 modules = glob.glob(join(dirname(__file__), "*.py"))
 __all__ = [ basename(f)[:-3] for f in modules if isfile(f) and not f.endswith('__init__.py')]
+
+
+def register_lazy(tool_util) -> list:
+    """
+    Register tools from every module in this package, without importing the
+    modules. See `toolloader.register_lazy_tools`
+
+    tool_util -- Tool registry. ex: `llm_tool_util`
+    returns -- List of registered `LazyTool`
+    """
+    from toolloader import register_lazy_tools
+    return register_lazy_tools(dirname(__file__), __name__, tool_util)
@@ -0,0 +1,83 @@
+import logging
+from os import getenv
+from os.path import abspath, dirname, exists, join
+from threading import Lock
+
+from countries import country_code
+from gazetteer import Gazetteer
+from llmtoolutil import llm_tool_util
+
+# built with `python gazetteer.py build cities15000.txt data/gazetteer.idx`
+index_path = getenv('GAZETTEER_INDEX', join(dirname(dirname(abspath(__file__))), 'data', 'gazetteer.idx'))
+
+_gazetteer = None
+_lock = Lock()
+
+@llm_tool_util.llm_tool
+def geocode(place:str) -> dict:
+    '''
+    Returns latitude and longitude of a city or town, to use with other tools that need coordinates
+
+    place: Name of the place, optionally followed by a comma & region or country. ex: London, GB or Springfield, IL
+
+    returns: Dictionary of matching places, with name, country, region, latitude, longitude & population
+    '''
+    gazetteer = open_gazetteer()
+    if gazetteer is None:
+        return { 'error': 'Geocoding is unavailable. Use the latitude & longitude from your training data.' }
+
+    (name, *qualifiers) = [part.strip() for part in place.split(',')]
+    places = []
+    for (country, admin1) in place_filters(qualifiers):
+        places = gazetteer.search(name, country, limit=3, admin1=admin1)
+        if len(places) > 0:
+            break
+    else:
+        # qualifier is not a known country or region code, ex: a county
+        places = gazetteer.search(name, limit=3)
+    if len(places) == 0:
+        return { 'error': f'No place named `{place}` found.' }
+
+    return {
+        'places': [
+            { 'name': p['name'], 'country': p['country'], 'region': p['admin1'],
+              'lat': p['lat'], 'lon': p['lon'], 'population': p['population'] }
+            for p in places
+        ]
+    }
+
+
+def place_filters(qualifiers:list) -> list:
+    '''
+    Country & region filters to try, most specific first, for the parts
+    of a place after its name. The last part may be a country, by ISO code
+    or name, and parts may be region (admin1) codes. ex: `IL` is Israel, or
+    Illinois
+
+    qualifiers: Parts of place after name. ex: `['IL', 'US']`
+
+    returns: List of (country, admin1) tuples, either may be None
+    '''
+    country = country_code(qualifiers[-1]) if len(qualifiers) > 0 else None
+    regions = [q.upper() for q in qualifiers if q.isalnum() and len(q) <= 3]
+
+    filters = []
+    if country is not None:
+        filters += [(country, region) for region in regions if region != country]
+        filters.append((country, None))
+    filters += [(None, region) for region in regions]
+    return filters
+
+
+def open_gazetteer() -> Gazetteer | None:
+    '''
+    Open gazetteer index once, on first use. Returns None if the index has
+    not been built.
+    '''
+    global _gazetteer
+    with _lock:
+        if _gazetteer is None and exists(index_path):
+            _gazetteer = Gazetteer(index_path)
+        elif _gazetteer is None:
+            logging.warning(f'Gazetteer index not found: {index_path}')
+    return _gazetteer
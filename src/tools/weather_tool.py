@@ -1,7 +1,10 @@
 import requests
 from datetime import datetime
 import logging
+import statistics
 
+from array import array
+from math import fsum
 from urllib.parse import urlencode
 from llmtoolutil import llm_tool_util
 
@@ -18,52 +21,67 @@ def get_weather_forecast(lat:float, lon:float, date:datetime) -> dict:
 
     returns: Dictionary of date's temperature, precipitation, & wind speed ranges
     '''
-    params = {
-        'latitude': lat,
-        'longitude': lon,
-        'start_date': date,
-        'end_date': date,
-        'hourly': 'temperature_2m,precipitation,wind_speed_10m',
-        'temperature_unit': 'fahrenheit',
-        'precipitation_unit': 'inch',
-        'wind_speed_unit': 'mph',
-    }
-
-    response = requests.get(f'{weather_url}?{urlencode(params)}')
-    res_json = response.json()
-    logging.debug(res_json)
-    hourly = res_json['hourly']
-    units = res_json['hourly_units']
+    forecast = fetch_weather([(lat, lon)], start_date=date, end_date=date, hourly=','.join(hourly_variables))[0]
+    day = next(iter(daily_aggregates(forecast).values()), None)
+    if day is None:
+        return { 'error': f'No forecast available for {date}.' }
+    units = forecast['hourly_units']
 
     return {
         'format_hint': 'Format response with temperature, precipitation, & wind speed in a single sentence.',
         'forecast': {
             'date': date,
-            'temperature': f"{min(hourly['temperature_2m'])} - {max(hourly['temperature_2m'])} {units['temperature_2m']}",
-            'precipitation': f"{min(hourly['precipitation'])} - {max(hourly['precipitation'])} {units['precipitation']}",
-            'wind_speed': f"{min(hourly['wind_speed_10m'])} - {max(hourly['wind_speed_10m'])} {units['wind_speed_10m']}",
+            'temperature': format_range(day['temperature_2m'], units['temperature_2m']),
+            'precipitation': format_range(day['precipitation'], units['precipitation']),
+            'wind_speed': format_range(day['wind_speed_10m'], units['wind_speed_10m']),
         }
     }
 
 
-def get_current_weather(lat, lon):
+@llm_tool_util.llm_tool
+def get_weather_forecasts(locations:list, start_date:datetime, end_date:datetime) -> dict:
     '''
-    Returns current temperature, precipitation, and wind speed
+    Returns daily weather and temperature forecasts for several locations over a range of dates
+
+    locations: List of [latitude, longitude] of each location. ex: [[37.7749, -122.4194], [51.5072, -0.1278]]
+    start_date: First date to forecast weather in YYYY-MM-DD format. ex: 2024-07-29
+    end_date: Last date to forecast weather in YYYY-MM-DD format. ex: 2024-08-02
+
+    returns: Dictionary of each location's list of days, with the date, & temperature, precipitation, & wind speed min, max, mean & percentiles
     '''
-    params = {
-        'latitude': lat,
-        'longitude': lon,
-        'current': 'temperature_2m,precipitation,wind_speed_10m',
-        'temperature_unit': 'fahrenheit',
-        'precipitation_unit': 'inch',
-        'wind_speed_unit': 'mph',
+    forecasts = fetch_weather(locations, start_date=start_date, end_date=end_date, hourly=','.join(hourly_variables))
+
+    return {
+        'format_hint': 'Summarize the forecast for each location, with temperature, precipitation, & wind speed ranges for each day.',
+        'forecasts': [
+            {
+                'latitude': lat,
+                'longitude': lon,
+                'units': { name: forecast['hourly_units'][variable] for (variable, name) in hourly_variables.items() },
+                # a list, so result policies can keep the first days of a long range
+                'days': [
+                    { 'date': date, **{ name: aggregates[variable] for (variable, name) in hourly_variables.items() } }
+                    for (date, aggregates) in daily_aggregates(forecast).items()
+                ],
+            }
+            for ((lat, lon), forecast) in zip(locations, forecasts)
+        ]
     }
 
-    response = requests.get(f'{weather_url}?{urlencode(params)}')
-    res_json = response.json()
-    logging.debug(res_json)
-    curr = res_json['current']
-    units = res_json['current_units']
+
+@llm_tool_util.llm_tool
+def get_current_weather(lat:float, lon:float) -> dict:
+    '''
+    Returns current temperature, precipitation, and wind speed
+
+    lat: Latitude for the location. ex: 37.7749
+    lon: Longitude for the location. ex: -122.4194
+
+    returns: Dictionary of current temperature, precipitation, & wind speed
+    '''
+    current = fetch_weather([(lat, lon)], current=','.join(hourly_variables))[0]
+    curr = current['current']
+    units = current['current_units']
 
     return {
         'weather': {
@@ -71,4 +89,122 @@ def get_current_weather(lat, lon):
             'precipitation': f"{curr['precipitation']} {units['precipitation']}",
             'wind_speed': f"{curr['wind_speed_10m']} {units['wind_speed_10m']}"
         }
-    }
\ No newline at end of file
+    }
+
+
+"""
+Open-Meteo hourly variables fetched, & their names in tool responses.
+"""
+hourly_variables = {
+    'temperature_2m': 'temperature',
+    'precipitation': 'precipitation',
+    'wind_speed_10m': 'wind_speed',
+}
+
+# variables whose daily total is meaningful
+summed_variables = { 'precipitation' }
+
+unit_params = {
+    'temperature_unit': 'fahrenheit',
+    'precipitation_unit': 'inch',
+    'wind_speed_unit': 'mph',
+}
+
+
+def fetch_weather(locations:list, **params) -> list:
+    '''
+    Fetch weather for several locations in a single Open-Meteo request.
+
+    locations: List of (latitude, longitude)
+    params: Additional request parameters. ex: `hourly`, `start_date` & `end_date`
+
+    returns: List of Open-Meteo responses, one per location, in order
+    '''
+    try:
+        coordinates = [(float(lat), float(lon)) for (lat, lon) in locations]
+    except (TypeError, ValueError):
+        raise ValueError(f'Locations must be [latitude, longitude] pairs: {locations}')
+    if len(coordinates) == 0:
+        raise ValueError('No locations')
+
+    query = {
+        'latitude': ','.join(str(lat) for (lat, _) in coordinates),
+        'longitude': ','.join(str(lon) for (_, lon) in coordinates),
+        **unit_params,
+        **params,
+    }
+
+    response = requests.get(f'{weather_url}?{urlencode(query)}')
+    res_json = response.json()
+    logging.debug(res_json)
+
+    # single location responses are an object, multiple are a list
+    if isinstance(res_json, dict):
+        if res_json.get('error'):
+            raise ValueError(res_json.get('reason'))
+        res_json = [res_json]
+    return res_json
+
+
+def daily_aggregates(forecast:dict) -> dict:
+    '''
+    Aggregate hourly forecast into days. Hourly values of each day are
+    reduced as a contiguous array of doubles.
+
+    forecast: Open-Meteo response with `hourly` values
+    returns: Dictionary of date, to dictionary of variable, to aggregates. See @aggregate
+    '''
+    hourly = forecast['hourly']
+    times = hourly['time']
+    columns = { variable: array('d', (v if v is not None else float('nan') for v in values))
+                for (variable, values) in hourly.items() if variable != 'time' }
+
+    days = {}
+    start = 0
+    for end in range(1, len(times) + 1):
+        if end == len(times) or times[end][:10] != times[start][:10]:
+            days[times[start][:10]] = { variable: aggregate(values[start:end], variable in summed_variables)
+                                        for (variable, values) in columns.items() }
+            start = end
+    return days
+
+
+def aggregate(values:array, total:bool = False) -> dict:
+    '''
+    Reduce values to min, max, mean & 10th, 50th, 90th percentiles, rounded
+    to 2 decimals. Missing (NaN) values are skipped.
+
+    values: Array of doubles
+    total: Include sum of values, ex: for precipitation (default False)
+    returns: Dictionary of aggregates, each None if no values
+    '''
+    values = array('d', sorted(v for v in values if v == v))
+    n = len(values)
+    if n == 0:
+        return dict.fromkeys(('min', 'max', 'mean', 'p10', 'p50', 'p90') + (('total',) if total else ()))
+
+    deciles = statistics.quantiles(values, n=10, method='inclusive') if n > 1 else [values[0]] * 9
+    aggregates = {
+        'min': round(values[0], 2),
+        'max': round(values[-1], 2),
+        'mean': round(fsum(values) / n, 2),
+        'p10': round(deciles[0], 2),
+        'p50': round(deciles[4], 2),
+        'p90': round(deciles[8], 2),
+    }
+    if total:
+        aggregates['total'] = round(fsum(values), 2)
+    return aggregates
+
+
+def format_range(aggregates:dict, unit:str) -> str | None:
+    '''
+    Format min - max range of aggregates, ex: `58.8 - 67.8 °F`
+
+    aggregates: Dictionary of aggregates. See @aggregate
+    unit: Unit of values
+    returns: Range, or None if no values
+    '''
+    if aggregates['min'] is None:
+        return None
+    return f"{aggregates['min']} - {aggregates['max']} {unit}"
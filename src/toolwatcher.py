@@ -0,0 +1,181 @@
+import glob
+import importlib
+import logging
+import sys
+from os import stat
+from os.path import basename, join
+from threading import Event, Thread
+
+from toolloader import register_lazy_tool, scan_tool_module
+
+
+
+class ToolWatcher:
+    """
+    Watches the modules of a tool package, ex: `src/tools`, for changes and
+    re-registers only the affected tools, without restarting the process.
+
+    Modules are polled for a new modification time. A changed module is
+    re-scanned with `toolloader.scan_tool_module`, without importing it, and
+    compared to its previous scan:
+    - tools with a new, or changed, docstring or signature are registered
+    again, so their details are extracted & their markup regenerated
+    - tools with only a changed body keep their details & markup, and are
+    bound to the new code
+    - tools no longer in the module, or of deleted modules, are unregistered
+    - tools whose new details fail to register keep their previous details,
+    and the code they were loaded with. See `toolloader.register_lazy_tool`
+
+    The module is imported again when one of its tools is next called.
+    Tool calls already in progress finish with the code they started with.
+
+    Usage in code
+    ```
+    watcher = ToolWatcher('src/tools', 'tools', llm_tool_util,
+                          on_change=lambda changes: server.reload_system_message())
+    watcher.start()
+    ```
+    """
+
+    def __init__(self,
+                 directory:str,
+                 package:str,
+                 tool_util,
+                 on_change:callable = None,
+                 interval:float = 1.0) -> None:
+        """
+        Initialize watcher, with the modules as they are now.
+
+        directory -- Directory of package. ex: `src/tools`
+        package -- Name of package. ex: `tools`
+        tool_util -- Tool registry. ex: `llm_tool_util`
+        on_change -- Called with changes, after tools are re-registered. See @poll (default None)
+        interval -- Seconds between polls, when started (default 1)
+        """
+        self.directory = directory
+        self.package = package
+        self.tool_util = tool_util
+        self.on_change = on_change
+        self.interval = interval
+
+        # modification time & scanned tools (name -> (doc, signature)), by path
+        self._mtimes = self._modification_times()
+        self._scans = { path: self._scan(path) for path in self._mtimes }
+        self._stop = Event()
+        self._thread = None
+
+
+    def _modification_times(self) -> dict:
+        mtimes = {}
+        for path in glob.glob(join(self.directory, '*.py')):
+            if path.endswith('__init__.py'):
+                continue
+            try:
+                mtimes[path] = stat(path).st_mtime_ns
+            except FileNotFoundError:
+                pass
+        return mtimes
+
+
+    def _module(self, path:str) -> str:
+        return f'{self.package}.{basename(path)[:-3]}'
+
+
+    def _scan(self, path:str) -> dict:
+        """
+        Scan module source. Modules that fail to parse, ex: saved mid-edit,
+        are skipped until changed again.
+
+        returns -- Dictionary of name to `LazyTool`, or None if invalid
+        """
+        try:
+            return { tool.__name__: tool for tool in scan_tool_module(path, self._module(path)) }
+        except (OSError, SyntaxError, ValueError) as e:
+            logging.warning(f'Unable to scan `{path}`: {e}')
+            return None
+
+
+    def poll(self) -> dict:
+        """
+        Check for changed modules & re-register their tools.
+
+        returns -- Dictionary of tool names that were `registered` (new, or
+        changed details), `rebound` (changed code only), `failed` (invalid
+        details) & `unregistered`
+        """
+        changes = { 'registered': [], 'rebound': [], 'failed': [], 'unregistered': [] }
+
+        mtimes = self._modification_times()
+        changed = [path for (path, mtime) in mtimes.items() if self._mtimes.get(path) != mtime]
+        deleted = [path for path in self._mtimes if path not in mtimes]
+        if len(changed) == 0 and len(deleted) == 0:
+            return changes
+
+        importlib.invalidate_caches()
+        for path in sorted(changed + deleted):
+            old = self._scans.get(path) or {}
+            new = self._scan(path) if path in mtimes else {}
+            if new is None:
+                # keep previous tools until module is valid again
+                self._mtimes[path] = mtimes[path]
+                continue
+
+            # module is imported again, with the new code, when next called
+            sys.modules.pop(self._module(path), None)
+
+            for (name, tool) in new.items():
+                previous = old.get(name)
+                doc = self.tool_util._tool_docs.get(name)
+                if (previous is not None and doc is not None
+                        and (previous.__doc__, previous.__signature__) == (tool.__doc__, tool.__signature__)):
+                    register_lazy_tool(tool, self.tool_util, doc)
+                    changes['rebound'].append(name)
+                elif register_lazy_tool(tool, self.tool_util):
+                    changes['registered'].append(name)
+                else:
+                    changes['failed'].append(name)
+
+            for name in old:
+                func = self.tool_util._tool_funcs.get(name)
+                if name not in new and func is not None and func.__module__ == self._module(path):
+                    self.tool_util.unregister(name)
+                    changes['unregistered'].append(name)
+
+            if path in mtimes:
+                self._mtimes[path] = mtimes[path]
+                self._scans[path] = new
+            else:
+                del self._mtimes[path]
+                del self._scans[path]
+
+        logging.info(f'Reloaded tools: {changes}')
+        if self.on_change is not None:
+            self.on_change(changes)
+        return changes
+
+
+    def start(self) -> None:
+        """
+        Poll every `interval` seconds, in a background thread.
+        """
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name='tool-watcher', daemon=True)
+        self._thread.start()
+
+
+    def stop(self) -> None:
+        """
+        Stop polling.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logging.exception(f'Unable to reload tools: {e}')
@@ -0,0 +1,170 @@
+import json
+import os
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter, time
+
+
+class Span:
+    """
+    Timed operation, with attributes, within a trace. Use as a context manager,
+    see `Tracer.span`. Exceptions raised within the span are recorded as its
+    `error`.
+    """
+
+    recording = True
+
+    def __init__(self, tracer:'Tracer', name:str, attributes:dict) -> None:
+        self._tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.trace_id = None
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = None
+        self.error = None
+        self._token = None
+
+
+    def set(self, **attributes) -> None:
+        """
+        Add attributes. ex: `span.set(prompt_tokens=120)`
+        """
+        self.attributes.update(attributes)
+
+
+    def __enter__(self) -> 'Span':
+        parent = _current_span.get()
+        if parent is not None:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+        else:
+            self.trace_id = os.urandom(16).hex()
+
+        self._token = _current_span.set(self)
+        self._time = time()
+        self._start = perf_counter()
+        return self
+
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        seconds = perf_counter() - self._start
+        _current_span.reset(self._token)
+        if exc is not None:
+            self.error = f'{exc_type.__name__}: {exc}'
+
+        self._tracer._export({
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self._time,
+            'seconds': seconds,
+            'attributes': self.attributes,
+            'error': self.error,
+        })
+
+
+
+class _DisabledSpan:
+    """
+    Span returned when tracing is disabled. Does nothing.
+    """
+
+    recording = False
+
+    def set(self, **attributes) -> None:
+        pass
+
+    def __enter__(self) -> '_DisabledSpan':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_disabled_span = _DisabledSpan()
+_current_span = ContextVar('current_span', default=None)
+
+
+
+class Tracer:
+    """
+    Records spans of assistant turns, LLM requests & tool calls, exported
+    as JSON lines to a local file. Spans started within another span, in the
+    same thread, are its children, & share its `trace_id`.
+
+    Usage in code
+    ```
+    from tracing import tracer
+
+    tracer.enable('traces.jsonl')
+
+    with tracer.span('llm.request', model='llama-3.1-70b-versatile') as span:
+        ...
+        span.set(prompt_tokens=120)
+    ```
+
+    When disabled, the default, `span` returns a shared span that does
+    nothing, so instrumented code only pays for a function call.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialize disabled tracer.
+        """
+        self.enabled = False
+        self._file = None
+        self._lock = Lock()
+
+
+    def enable(self, path:str) -> None:
+        """
+        Start exporting spans, appended to file.
+
+        path -- JSONL file to export spans to
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self._file = open(path, 'a', buffering=1)
+            self.enabled = True
+
+
+    def disable(self) -> None:
+        """
+        Stop exporting spans & close file.
+        """
+        with self._lock:
+            self.enabled = False
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+    def span(self, name:str, **attributes) -> Span | _DisabledSpan:
+        """
+        Start span. Use as a context manager.
+
+        name -- Name of span. ex: `tool.call`
+        attributes -- Span attributes. ex: `tool='get_weather_forecast'`
+        returns -- Span
+        """
+        if not self.enabled:
+            return _disabled_span
+        return Span(self, name, attributes)
+
+
+    def _export(self, span:dict) -> None:
+        """
+        Write finished span to file.
+        """
+        line = json.dumps(span, default=str) + '\n'
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line)
+
+
+"""
+Singleton instance of Tracer, disabled until enabled.
+"""
+tracer = Tracer()
@@ -1,6 +1,64 @@
 # tests/conftest.py
 import sys
 import os
+import re
+import pytest
 
 # Add the src directory to sys.path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from cassette import Cassette
+
+cassette_dir = os.path.join(os.path.dirname(__file__), 'cassettes')
+
+
+# dates change between runs, ex: tests ask for forecasts relative to today
+scrub_dates = [r'\d{4}-\d{2}-\d{2}']
+
+
+def pytest_addoption(parser):
+    parser.addoption('--cassettes', default='replay', choices=Cassette.modes,
+                     help='Replay recorded HTTP traffic (LLM & tool APIs), record it, or both (default replay)')
+    parser.addoption('--cassette-timing', action='store_true',
+                     help='Delay replayed responses by their recorded latency')
+
+
+def pytest_configure(config):
+    """
+    Record & replay HTTP traffic during collection, ex: docstring extraction
+    when tool modules are imported. Tests use their own cassettes, see `cassette`.
+    """
+    config.addinivalue_line('markers', 'live: needs LLM or tool API traffic, skipped in replay mode until recorded')
+    config._cassette = Cassette(os.path.join(cassette_dir, 'session.json'),
+                                mode=config.getoption('--cassettes'),
+                                replay_timing=config.getoption('--cassette-timing'),
+                                scrub=scrub_dates)
+    config._cassette.__enter__()
+
+
+def pytest_collection_finish(session):
+    """
+    Stop the collection cassette, so test traffic is only recorded in each
+    test's cassette.
+    """
+    session.config._cassette.__exit__(None, None, None)
+
+
+@pytest.fixture(autouse=True)
+def cassette(request):
+    """
+    Record & replay HTTP traffic of each test, in tests/cassettes/<module>/<test>.json.
+    In replay mode, tests marked `live` are skipped if nothing was recorded.
+    """
+    module = os.path.splitext(os.path.relpath(request.node.path, os.path.dirname(__file__)))[0]
+    name = re.sub(r'[^\w.-]+', '_', request.node.name)
+    path = os.path.join(cassette_dir, module, f'{name}.json')
+    mode = request.config.getoption('--cassettes')
+    if mode == 'replay' and request.node.get_closest_marker('live') and not os.path.exists(path):
+        pytest.skip(f'No recorded traffic in {os.path.relpath(path)}, record with --cassettes record')
+
+    with Cassette(path,
+                  mode=mode,
+                  replay_timing=request.config.getoption('--cassette-timing'),
+                  scrub=scrub_dates) as cassette:
+        yield cassette
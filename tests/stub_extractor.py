@@ -0,0 +1,39 @@
+import re
+from docextractor import DocExtractor
+from llmtoolutil import _LLMToolUtil
+
+# `arg -- description` or `arg: description`
+arg_regex = re.compile(r'^(\w+)\s*(?:--|:)\s*(.+)$')
+
+
+class StubDocExtractor(DocExtractor):
+    """
+    Extract details without calling the LLM, for tests of registration &
+    dispatch. The summary is the first paragraph, and arguments are
+    `arg -- description` or `arg: description` lines, skipping `Returns:` &
+    `Raises:` sections.
+    """
+    def get_func_details(self, doc:str) -> dict:
+        (summary, args, section) = ([], {}, None)
+        for line in (line.strip() for line in doc.splitlines()):
+            if line in ('Returns:', 'Raises:'):
+                section = 'skip'
+            elif line == 'Args:':
+                section = 'args'
+            elif (match := arg_regex.match(line)) and section != 'skip' and match.group(1) not in ('returns', 'return'):
+                args[match.group(1)] = match.group(2)
+            elif section is None and line and len(args) == 0:
+                summary.append(line)
+            elif not line and len(summary) > 0:
+                section = section or 'done'
+        return { 'summary': ' '.join(summary), 'args': args }
+
+
+def stub_registry(*funcs) -> _LLMToolUtil:
+    """
+    Isolated registry, with functions registered using `StubDocExtractor`.
+    """
+    registry = _LLMToolUtil(StubDocExtractor())
+    for func in funcs:
+        registry.llm_tool(func)
+    return registry
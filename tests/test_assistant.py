@@ -1,9 +1,16 @@
+import json
 import pytest
 import re
+import time
 
-from assistant import Assistant, no_func_regex
+from assistant import Assistant, final_answer_prompt, min_llm_timeout, no_func_regex, stopped_responses
+from fixture_functions import three_args_yes_type_yes_return
+from llmclient import LLMClient
 from llmtoolutil import llm_tool_util
+from sessionstore import SessionStore
+from stub_extractor import stub_registry
 
+@pytest.mark.live
 @pytest.mark.parametrize('prompt, regexs', [
     (
         'Who was the first president of the united states?',
@@ -70,3 +77,309 @@ def test_no_tool_available(response:str, expected:tuple|None):
         assert(match == expected)
     else:
         assert(match.span() == expected)
+
+
+### Test tool loop limits ###
+
+class FakeClient(LLMClient):
+    """
+    LLM client returning scripted responses.
+    """
+    def __init__(self, responses:list, messages:list, delay:float = 0) -> None:
+        super().__init__(url='', model='', system_message='')
+        self.responses = list(responses)
+        self.messages = messages
+        self.prompts = []
+        self.timeouts = []
+        self.delay = delay
+
+    def request(self, prompt:str, timeout:float = None) -> str:
+        self.prompts.append(prompt)
+        self.timeouts.append(timeout)
+        time.sleep(self.delay)
+        response = self.responses.pop(0)
+        self.messages.extend([{ 'role': 'user', 'content': prompt }, { 'role': 'assistant', 'content': response }])
+        return response
+
+
+def make_assistant(responses:list, delay:float = 0, **kwargs) -> Assistant:
+    tool_util = stub_registry(three_args_yes_type_yes_return)
+
+    assistant = Assistant(tool_util=tool_util, system_message='', **kwargs)
+    assistant._client = FakeClient(responses, assistant._client.messages, delay)
+    return assistant
+
+
+def tool_call(glue:int) -> str:
+    return json.dumps({ "name": "three_args_yes_type_yes_return", "parameters": { "some_string": "a", "some_other_string": "b", "glue": glue } })
+
+
+def test_tool_loop_answered():
+    assistant = make_assistant([tool_call(1), 'The length is 3.'])
+
+    assert(assistant.handle('How long?') == 'The length is 3.')
+    assert(assistant._client.prompts[1] == '3')
+    assert(assistant.last_turn['stop_reason'] == 'answered')
+    assert(assistant.last_turn['tool_rounds'] == 1 and assistant.last_turn['llm_calls'] == 2)
+    assert(assistant.last_tool_trace == [{ 'round': 1, 'name': 'three_args_yes_type_yes_return',
+                                           'parameters': { 'some_string': 'a', 'some_other_string': 'b', 'glue': 1 },
+                                           'response': 3 }])
+
+
+
+def test_tool_plan():
+    plan = json.dumps({ 'plan': [
+        { 'id': 'a', 'name': 'three_args_yes_type_yes_return', 'parameters': { 'some_string': 'a', 'some_other_string': 'b', 'glue': 1 } },
+        { 'id': 'b', 'name': 'three_args_yes_type_yes_return', 'parameters': { 'some_string': 'aa', 'some_other_string': 'b', 'glue': '$a' } },
+    ] })
+    assistant = make_assistant([plan, 'The lengths are 3 & 4.'])
+
+    assert(assistant.handle('How long?') == 'The lengths are 3 & 4.')
+    assert(json.loads(assistant._client.prompts[1]) == { 'a': 3, 'b': 4 })
+    assert(assistant.last_turn['tool_rounds'] == 1 and assistant.last_turn['llm_calls'] == 2)
+    assert([t['name'] for t in assistant.last_tool_trace] == ['three_args_yes_type_yes_return'] * 2)
+
+
+def test_misspelled_tool_call_is_repaired():
+    from toolrepair import tool_call_repairs
+
+    misspelled = json.dumps({ "name": "three_args_yes_type_yes_returns", "parameters": { "some_strin": "a", "some_other_string": "b" } })
+    assistant = make_assistant([misspelled, 'The length is 3.'])
+    repairs = tool_call_repairs.value(tool='three_args_yes_type_yes_return', kind='tool_name') or 0
+
+    assert(assistant.handle('How long?') == 'The length is 3.')
+    assert(assistant._client.prompts[1] == '3')
+    assert(assistant.last_turn['llm_calls'] == 2)
+    # response is parsed & repaired once
+    assert(tool_call_repairs.value(tool='three_args_yes_type_yes_return', kind='tool_name') == repairs + 1)
+
+
+def test_tool_loop_repeated_call():
+    assistant = make_assistant([tool_call(1), tool_call(1), 'Final answer.'])
+
+    assert(assistant.handle('How long?') == 'Final answer.')
+    assert(assistant._client.prompts[-1] == final_answer_prompt)
+    assert(assistant.last_turn['stop_reason'] == 'repeated_call')
+    assert(assistant.last_turn['tool_rounds'] == 1)
+
+
+def test_tool_loop_max_tool_rounds():
+    assistant = make_assistant([tool_call(i) for i in range(1, 5)] + [tool_call(5)], max_tool_rounds=3)
+
+    assert(assistant.handle('How long?') == stopped_responses['max_tool_rounds'])
+    assert(assistant.last_turn['stop_reason'] == 'max_tool_rounds')
+    assert(assistant.last_turn['tool_rounds'] == 3)
+
+
+def test_tool_loop_budget():
+    assistant = make_assistant([tool_call(1), tool_call(2), 'Final answer.'], delay=0.05)
+
+    assert(assistant.handle('How long?', budget=0.08) == 'Final answer.')
+    assert(assistant.last_turn['stop_reason'] == 'budget')
+    assert(assistant.last_turn['tool_rounds'] == 1)
+    assert(assistant.last_turn['llm_seconds'] <= assistant.last_turn['total_seconds'])
+    # final answer is still limited by the turn's budget
+    assert(assistant._client.timeouts[-1] == min_llm_timeout)
+
+
+def test_tool_result_policies():
+    from resultpolicy import ResultPolicy
+
+    policies = { 'three_args_yes_type_yes_return': ResultPolicy(max_chars=0, retain=True) }
+    assistant = make_assistant([tool_call(1), 'The length is 3.'], result_policies=policies)
+
+    assert(assistant.handle('How long?') == 'The length is 3.')
+    assert(json.loads(assistant._client.prompts[1]) == { 'truncated': '1 of 1 characters left out', 'preview': '', 'result_id': 'result_1' })
+    assert(assistant.results.get('result_1') == 3)
+
+
+### Test native tool calls ###
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, message:dict) -> None:
+        self.message = message
+        self.text = json.dumps(message)
+
+    def json(self):
+        return { 'choices': [{ 'message': self.message }] }
+
+
+class FakeHTTP:
+    """
+    HTTP session returning scripted assistant messages, & recording requests.
+    """
+    def __init__(self, messages:list) -> None:
+        self.messages = list(messages)
+        self.requests = []
+
+    def post(self, url, headers, json, timeout):
+        self.requests.append({ **json, 'messages': list(json['messages']) })
+        return FakeResponse(self.messages.pop(0))
+
+
+def native_call(call_id:str, glue:int) -> dict:
+    arguments = json.dumps({ "some_string": "a", "some_other_string": "b", "glue": glue })
+    return { 'id': call_id, 'type': 'function', 'function': { 'name': 'three_args_yes_type_yes_return', 'arguments': arguments } }
+
+
+def make_native_assistant(messages:list, **kwargs) -> tuple:
+    tool_util = stub_registry(three_args_yes_type_yes_return)
+    http = FakeHTTP(messages)
+    return (Assistant(tool_format='native', tool_util=tool_util, session=http, **kwargs), http)
+
+
+def test_native_tool_calls():
+    (assistant, http) = make_native_assistant([
+        { 'role': 'assistant', 'content': None, 'tool_calls': [native_call('call_1', 1), native_call('call_2', 10)] },
+        { 'role': 'assistant', 'content': 'The lengths are 3 & 4.' },
+    ])
+
+    assert(assistant.handle('How long?') == 'The lengths are 3 & 4.')
+    assert(assistant.last_turn['tool_rounds'] == 1)
+
+    # tools are in the request, not the system prompt
+    (first, second) = http.requests
+    assert(first['tools'][0]['function']['name'] == 'three_args_yes_type_yes_return')
+    assert('three_args_yes_type_yes_return' not in first['messages'][0]['content'])
+    assert(second['messages'][-2:] == [
+        { 'role': 'tool', 'tool_call_id': 'call_1', 'content': '3' },
+        { 'role': 'tool', 'tool_call_id': 'call_2', 'content': '4' },
+    ])
+
+
+def test_native_unknown_tool_and_repeated_call():
+    unknown = { 'id': 'call_0', 'type': 'function', 'function': { 'name': 'unknown', 'arguments': '{}' } }
+    (assistant, http) = make_native_assistant([
+        { 'role': 'assistant', 'content': '', 'tool_calls': [unknown] },
+        { 'role': 'assistant', 'content': '', 'tool_calls': [native_call('call_1', 1)] },
+        { 'role': 'assistant', 'content': '', 'tool_calls': [native_call('call_2', 1)] },
+        { 'role': 'assistant', 'content': '', 'tool_calls': [native_call('call_3', 1)] },
+        { 'role': 'assistant', 'content': 'Hello!' },
+    ])
+
+    assert(assistant.handle('How long?') == stopped_responses['repeated_call'])
+    assert(assistant.last_turn['stop_reason'] == 'repeated_call')
+    assert(http.requests[1]['messages'][-1] == { 'role': 'tool', 'tool_call_id': 'call_0', 'content': 'Use your training data to respond.' })
+    assert(http.requests[3]['messages'][-1] == { 'role': 'tool', 'tool_call_id': 'call_2', 'content': final_answer_prompt })
+
+    # unanswered tool calls are dropped before the next message
+    assert(assistant.handle('Hi') == 'Hello!')
+    assert('tool_calls' not in http.requests[4]['messages'][-2])
+
+
+def test_native_reload_tools():
+    from fixture_functions import hello_doc
+
+    (assistant, http) = make_native_assistant([{ 'role': 'assistant', 'content': 'Hello!' }])
+    assistant._tool_util.llm_tool(hello_doc)
+    assistant.reload_tools()
+
+    assistant.handle('Hi')
+    assert([t['function']['name'] for t in http.requests[0]['tools']] == ['three_args_yes_type_yes_return', 'hello_doc'])
+
+
+### Test session persistence ###
+
+def test_assistant_offload_and_restore(tmp_path):
+    store = SessionStore(str(tmp_path / 'sessions.db'))
+
+    assistant = make_assistant(['Hello!', 'George Washington.'], session_id='s1', store=store)
+    assistant.handle('Hi')
+    assistant.offload()
+    assert(len(assistant._client.messages) == 1)
+
+    assistant.restore()
+    assistant.handle('Who was the first president?')
+    assert([m['content'] for m in store.load('s1')] == ['Hi', 'Hello!', 'Who was the first president?', 'George Washington.'])
+
+    # new assistant, ex: after restart, resumes conversation
+    resumed = make_assistant([], session_id='s1', store=store)
+    assert(resumed._client.messages[1:] == store.load('s1'))
+
+
+def test_assistant_offload_and_handle(tmp_path):
+    store = SessionStore(str(tmp_path / 'sessions.db'))
+
+    assistant = make_assistant(['Hello 1', 'Hello 2'], session_id='s1', store=store)
+    assistant.handle('first')
+    assistant.offload()
+    assistant.save()
+
+    # conversation is restored before the next message, not overwritten
+    assistant.handle('second')
+    assert([m['content'] for m in assistant._client.messages[1:3]] == ['first', 'Hello 1'])
+    assert([m['content'] for m in store.load('s1')] == ['first', 'Hello 1', 'second', 'Hello 2'])
+
+    assistant.restore()
+    assert(assistant._client.messages[1:] == store.load('s1'))
+
+
+def test_native_assistant_store(tmp_path):
+    store = SessionStore(str(tmp_path / 'sessions.db'))
+    (assistant, http) = make_native_assistant([
+        { 'role': 'assistant', 'content': None, 'tool_calls': [native_call('call_1', 1)] },
+        { 'role': 'assistant', 'content': 'The length is 3.' },
+        { 'role': 'assistant', 'content': '', 'tool_calls': [native_call('call_2', 1)] },
+        { 'role': 'assistant', 'content': '', 'tool_calls': [native_call('call_3', 1)] },
+        { 'role': 'assistant', 'content': '', 'tool_calls': [native_call('call_4', 1)] },
+    ], session_id='s1', store=store)
+
+    assert(assistant.handle('How long?') == 'The length is 3.')
+    assert(store.load('s1') == assistant._client.messages[1:])
+    assert(store.load('s1')[1]['content'] is None and store.load('s1')[2]['tool_call_id'] == 'call_1')
+
+    # turn stopped with tool calls unanswered, which are dropped on restore
+    assert(assistant.handle('And again?') == stopped_responses['repeated_call'])
+    (resumed, http) = make_native_assistant([{ 'role': 'assistant', 'content': 'Hello!' }], session_id='s1', store=store)
+    assert(resumed._client.messages[1:] == store.load('s1'))
+    assert(resumed.handle('Hi') == 'Hello!')
+    resumed = make_native_assistant([], session_id='s1', store=store)[0]
+    for history in (http.requests[0]['messages'], resumed._client.messages):
+        assert(all(m['role'] == 'tool' for (previous, m) in zip(history, history[1:]) if previous.get('tool_calls')))
+
+
+### Test tracing ###
+
+def test_assistant_trace(tmp_path):
+    from tracing import tracer
+
+    path = tmp_path / 'traces.jsonl'
+    assistant = make_assistant(['No function available for this prompt.', tool_call(1), 'The length is 3.'])
+    tracer.enable(str(path))
+    try:
+        assistant.handle('How long?')
+    finally:
+        tracer.disable()
+
+    spans = [json.loads(line) for line in path.read_text().splitlines()]
+    handle = spans[-1]
+    assert(handle['name'] == 'assistant.handle' and handle['parent_id'] is None)
+    assert(handle['attributes']['tool_rounds'] == 1)
+    assert([s['attributes']['purpose'] for s in spans if s['name'] == 'assistant.request'] == ['user', 'fallback', 'tool_response'])
+    tool = next(s for s in spans if s['name'] == 'tool.call')
+    assert(tool['attributes']['tool'] == 'three_args_yes_type_yes_return')
+    assert(all(s['trace_id'] == handle['trace_id'] for s in spans))
+
+
+### Test metrics ###
+
+def test_assistant_metrics():
+    from assistant import fallback_reprompts, history_messages, parse_failures
+
+    (no_tool, unknown_tool, failures) = (fallback_reprompts.value(reason='no_tool') or 0,
+                                         fallback_reprompts.value(reason='unknown_tool') or 0,
+                                         parse_failures.value() or 0)
+    turns = (history_messages.value() or { 'count': 0 })['count']
+
+    assistant = make_assistant(['No tool available for this.', 'Answer.',
+                                '{"name": "unknown", "parameters": {}}', 'Answer.',
+                                '{"name": "three_args_yes_type_yes_return", "parameters": {,}}'])
+    for message in ('a', 'b', 'c'):
+        assistant.handle(message)
+
+    assert(fallback_reprompts.value(reason='no_tool') == no_tool + 1)
+    assert(fallback_reprompts.value(reason='unknown_tool') == unknown_tool + 1)
+    assert(parse_failures.value() == failures + 1)
+    assert(history_messages.value()['count'] == turns + 3)
@@ -0,0 +1,248 @@
+import asyncio
+import json
+import socket
+import threading
+
+from assistantserver import AssistantServer
+from sessionstore import SessionStore
+
+
+class EchoAssistant:
+    """
+    Assistant that echoes messages, without calling the LLM.
+    """
+    def __init__(self, session_id:str = None, gate:threading.Event = None) -> None:
+        self.messages = []
+        self.gate = gate
+
+    def handle(self, user_message:str) -> str:
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.messages.append(user_message)
+        return f'echo {len(self.messages)}: {user_message}'
+
+
+async def request(port:int, method:str, path:str, body:dict = None) -> tuple:
+    (reader, writer) = await asyncio.open_connection('127.0.0.1', port)
+    data = json.dumps(body).encode() if body is not None else b''
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(data)}\r\nConnection: close\r\n\r\n'.encode() + data)
+    await writer.drain()
+
+    raw = await reader.read()
+    writer.close()
+    (head, _, payload) = raw.partition(b'\r\n\r\n')
+    return (int(head.split()[1]), json.loads(payload) if b'application/json' in head else payload.decode())
+
+
+def run_with_server(test, **kwargs):
+    async def main():
+        server = AssistantServer(port=0, **kwargs)
+        await server.start()
+        try:
+            await test(server)
+        finally:
+            await server.stop()
+
+    asyncio.run(main())
+
+
+def test_session_conversation():
+    async def test(server):
+        (status, res) = await request(server.port, 'POST', '/sessions')
+        assert(status == 201)
+        session_id = res['session_id']
+
+        (status, res) = await request(server.port, 'POST', f'/sessions/{session_id}/messages', { 'message': 'hi' })
+        assert((status, res) == (200, { 'session_id': session_id, 'response': 'echo 1: hi' }))
+        (status, res) = await request(server.port, 'POST', f'/sessions/{session_id}/messages', { 'message': 'again' })
+        assert(res['response'] == 'echo 2: again')
+
+        assert((await request(server.port, 'GET', '/health')) == (200, { 'sessions': 1, 'in_flight': 0 }))
+        assert((await request(server.port, 'DELETE', f'/sessions/{session_id}'))[0] == 200)
+        assert((await request(server.port, 'POST', f'/sessions/{session_id}/messages', { 'message': 'hi' }))[0] == 404)
+
+    run_with_server(test, assistant_factory=EchoAssistant)
+
+
+def test_max_sessions():
+    async def test(server):
+        assert((await request(server.port, 'POST', '/sessions'))[0] == 201)
+        (status, res) = await request(server.port, 'POST', '/sessions')
+        assert(status == 503 and 'error' in res)
+
+    run_with_server(test, assistant_factory=EchoAssistant, max_sessions=1)
+
+
+def test_bad_requests():
+    async def test(server):
+        (_, res) = await request(server.port, 'POST', '/sessions')
+        assert((await request(server.port, 'POST', f'/sessions/{res["session_id"]}/messages', {}))[0] == 400)
+        assert((await request(server.port, 'GET', '/unknown'))[0] == 404)
+
+    run_with_server(test, assistant_factory=EchoAssistant)
+
+
+def test_backpressure_when_saturated():
+    gate = threading.Event()
+
+    async def test(server):
+        session_ids = [(await request(server.port, 'POST', '/sessions'))[1]['session_id'] for _ in range(2)]
+
+        busy = asyncio.create_task(request(server.port, 'POST', f'/sessions/{session_ids[0]}/messages', { 'message': 'slow' }))
+        await asyncio.sleep(0.1)
+
+        (status, res) = await request(server.port, 'POST', f'/sessions/{session_ids[1]}/messages', { 'message': 'rejected' })
+        assert(status == 503)
+
+        gate.set()
+        assert((await busy)[0] == 200)
+
+        (status, text) = await request(server.port, 'GET', '/metrics')
+        assert(status == 200)
+        assert('assistant_rejected_turns_total ' in text)
+        assert('assistant_sessions 2' in text)
+
+    run_with_server(test, assistant_factory=lambda session_id: EchoAssistant(gate=gate), max_concurrency=1, queue_timeout=0.1)
+
+
+def test_idle_sessions_evicted():
+    async def test(server):
+        (_, res) = await request(server.port, 'POST', '/sessions')
+        await asyncio.sleep(0.3)
+        assert(res['session_id'] not in server.sessions)
+
+    run_with_server(test, assistant_factory=EchoAssistant, idle_timeout=0.1)
+
+
+def test_evicted_sessions_restored_from_store(tmp_path):
+    store = SessionStore(str(tmp_path / 'sessions.db'))
+
+    class StoredEchoAssistant(EchoAssistant):
+        def __init__(self, session_id:str) -> None:
+            super().__init__()
+            self.session_id = session_id
+            self.messages = [m['content'] for m in store.load(session_id)]
+
+        def save(self) -> None:
+            store.append(self.session_id, 0, [{ 'role': 'user', 'content': m } for m in self.messages])
+
+    async def test(server):
+        (_, res) = await request(server.port, 'POST', '/sessions')
+        session_id = res['session_id']
+        await request(server.port, 'POST', f'/sessions/{session_id}/messages', { 'message': 'hi' })
+
+        await asyncio.sleep(0.3)
+        assert(session_id not in server.sessions)
+
+        (status, res) = await request(server.port, 'POST', f'/sessions/{session_id}/messages', { 'message': 'again' })
+        assert((status, res['response']) == (200, 'echo 2: again'))
+
+        assert((await request(server.port, 'DELETE', f'/sessions/{session_id}'))[0] == 200)
+        assert(not store.exists(session_id))
+
+    run_with_server(test, assistant_factory=StoredEchoAssistant, store=store, idle_timeout=0.1)
+
+
+def test_restored_sessions_within_max_sessions(tmp_path):
+    store = SessionStore(str(tmp_path / 'sessions.db'))
+    threads = []
+
+    class StoredEchoAssistant(EchoAssistant):
+        def __init__(self, session_id:str) -> None:
+            super().__init__()
+            threads.append(threading.current_thread())
+            self.session_id = session_id
+            self.messages = [m['content'] for m in store.load(session_id)]
+
+        def save(self) -> None:
+            threads.append(threading.current_thread())
+            store.append(self.session_id, 0, [{ 'role': 'user', 'content': m } for m in self.messages])
+
+    async def test(server):
+        session_ids = []
+        for _ in range(2):
+            session_ids.append((await request(server.port, 'POST', '/sessions'))[1]['session_id'])
+            await request(server.port, 'POST', f'/sessions/{session_ids[-1]}/messages', { 'message': 'hi' })
+
+        # least recently used session is evicted to make room, & restored when next used
+        assert(list(server.sessions) == session_ids[1:])
+        (status, res) = await request(server.port, 'POST', f'/sessions/{session_ids[0]}/messages', { 'message': 'again' })
+        assert((status, res['response']) == (200, 'echo 2: again'))
+        assert(list(server.sessions) == session_ids[:1])
+
+        assert((await request(server.port, 'DELETE', f'/sessions/{session_ids[1]}'))[0] == 200)
+        assert(not store.exists(session_ids[1]) and list(server.sessions) == session_ids[:1])
+
+        # sessions are created, saved & restored off the event loop
+        assert(len(threads) == 5 and threading.main_thread() not in threads)
+
+    run_with_server(test, assistant_factory=StoredEchoAssistant, store=store, max_sessions=1)
+
+
+def test_sessions_routed_to_owning_worker():
+    from assistantserver import session_worker
+
+    async def main():
+        socks = [socket.create_server(('127.0.0.1', 0)) for _ in range(2)]
+        peers = [s.getsockname()[:2] for s in socks]
+        servers = [AssistantServer(port=0, assistant_factory=EchoAssistant, worker=i, peers=peers) for i in range(2)]
+        for (server, sock) in zip(servers, socks):
+            await server.start(peer_sock=sock)
+        try:
+            session_ids = [(await request(servers[0].port, 'POST', '/sessions'))[1]['session_id'] for _ in range(4)]
+            assert(all(session_worker(session_id, 2) == 0 for session_id in session_ids))
+
+            # messages arriving at another worker are handled by the owner
+            for (i, server) in enumerate(servers * 2):
+                (status, res) = await request(server.port, 'POST', f'/sessions/{session_ids[0]}/messages', { 'message': 'hi' })
+                assert((status, res['response']) == (200, f'echo {i + 1}: hi'))
+            assert((len(servers[0].sessions), len(servers[1].sessions)) == (4, 0))
+
+            assert((await request(servers[1].port, 'DELETE', f'/sessions/{session_ids[0]}'))[0] == 200)
+            assert(session_ids[0] not in servers[0].sessions)
+            assert((await request(servers[1].port, 'POST', f'/sessions/{session_ids[0]}/messages', { 'message': 'hi' }))[0] == 404)
+        finally:
+            for server in servers:
+                await server.stop()
+
+    asyncio.run(main())
+
+
+class PromptAssistant(EchoAssistant):
+    """
+    Echo assistant that records the system prompt it was created with.
+    """
+    prompts = iter(['prompt 1', 'prompt 2', 'prompt 4'])
+
+    def __init__(self, system_message:str, session_id:str = None, **kwargs) -> None:
+        super().__init__(session_id)
+        self.system_message = system_message
+
+    @staticmethod
+    def build_system_message(tool_format, tool_util) -> str:
+        return next(PromptAssistant.prompts)
+
+
+def test_reload_system_message():
+    server = AssistantServer(assistant_class=PromptAssistant)
+    first = server.create_session()
+
+    server.reload_system_message()
+    second = server.create_session()
+    server.reload_system_message('prompt 3')
+
+    assert(first.assistant.system_message == 'prompt 1')
+    assert(second.assistant.system_message == 'prompt 2')
+    assert(server.create_session().assistant.system_message == 'prompt 3')
+
+
+def test_system_message_date():
+    from datetime import date, timedelta
+
+    server = AssistantServer(assistant_class=PromptAssistant, system_message='prompt 3')
+    assert(server.create_session().assistant.system_message == 'prompt 3')
+
+    # prompt is rebuilt with today's date, for sessions created the next day
+    server._system_date = date.today() - timedelta(days=1)
+    assert(server.create_session().assistant.system_message == 'prompt 4')
+    assert(server._system_date == date.today())
@@ -0,0 +1,123 @@
+import json
+import pytest
+import time
+from threading import Lock
+from batchrunner import BatchRunner, load_conversations
+
+
+class FakeConversations:
+    """
+    Conversations that echo each message after `delay` seconds, and fail on
+    messages containing `fail`.
+    """
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.sent = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = Lock()
+
+    def __call__(self):
+        def send(message):
+            with self._lock:
+                self.sent.append(message)
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                time.sleep(self.delay)
+                if 'fail' in message:
+                    raise RuntimeError(message)
+                return { 'response': message.upper(), 'llm_seconds': self.delay, 'tool_seconds': 0.0,
+                         'tool_calls': [{ 'round': 1, 'name': 'echo', 'parameters': { 'text': message }, 'response': message }] }
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+        return send
+
+
+def write_input(path, lines):
+    path.write_text(''.join(json.dumps(line) + '\n' for line in lines))
+    return load_conversations(str(path))
+
+
+def read_results(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+### Test load_conversations ###
+
+def test_load_conversations(tmp_path):
+    conversations = write_input(tmp_path / 'input.jsonl', [
+        ['a', 'b'],
+        { 'id': 'weather-1', 'messages': ['c'], 'expected': 'C' },
+    ])
+    assert(conversations == [
+        { 'id': '1', 'messages': ['a', 'b'], 'metadata': {} },
+        { 'id': 'weather-1', 'messages': ['c'], 'metadata': { 'expected': 'C' } },
+    ])
+
+    with pytest.raises(ValueError, match='Duplicate'):
+        write_input(tmp_path / 'input.jsonl', [{ 'id': 'x', 'messages': [] }, { 'id': 'x', 'messages': [] }])
+
+
+### Test BatchRunner ###
+
+def test_run(tmp_path):
+    conversations = write_input(tmp_path / 'input.jsonl',
+                                [{ 'id': f'c{i}', 'messages': [f'm{i}', 'again'], 'expected': i } for i in range(10)])
+    fake = FakeConversations()
+    summary = BatchRunner(fake, str(tmp_path / 'output.jsonl'), concurrency=3).run(conversations)
+
+    assert(fake.max_in_flight == 3)
+    assert(summary['conversations'] == 10 and summary['errors'] == 0 and summary['remaining'] == 0)
+    assert(summary['latency']['turn']['count'] == 20)
+
+    results = {r['id']: r for r in read_results(tmp_path / 'output.jsonl')}
+    assert(len(results) == 10)
+    turn = results['c4']['turns'][0]
+    assert(turn['message'] == 'm4' and turn['response'] == 'M4')
+    assert(turn['tool_calls'][0]['parameters'] == { 'text': 'm4' })
+    assert(turn['seconds'] >= turn['llm_seconds'])
+    assert(results['c4']['metadata'] == { 'expected': 4 })
+
+
+def test_resume(tmp_path):
+    conversations = write_input(tmp_path / 'input.jsonl', [['a'], ['b'], ['c'], ['d']])
+    output = tmp_path / 'output.jsonl'
+
+    # interrupted run: two results written, the third partially
+    fake = FakeConversations()
+    BatchRunner(fake, str(output)).run(conversations[:2])
+    with open(output, 'a') as f:
+        f.write('{"id": "3", "tur')
+
+    fake = FakeConversations()
+    summary = BatchRunner(fake, str(output)).run(conversations)
+    assert(sorted(fake.sent) == ['c', 'd'])
+    assert(summary['skipped'] == 2 and summary['conversations'] == 2)
+    assert([r['id'] for r in read_results(output)][:2] == ['1', '2'])
+    assert(sorted(r['id'] for r in read_results(output)) == ['1', '2', '3', '4'])
+
+    # complete run, nothing to redo
+    fake = FakeConversations()
+    assert(BatchRunner(fake, str(output)).run(conversations)['skipped'] == 4)
+    assert(fake.sent == [])
+
+
+def test_errors_and_retry(tmp_path):
+    conversations = write_input(tmp_path / 'input.jsonl', [['ok', 'fail now', 'never sent'], ['fine']])
+    output = tmp_path / 'output.jsonl'
+
+    summary = BatchRunner(FakeConversations(), str(output)).run(conversations)
+    assert(summary['errors'] == 1)
+    failed = next(r for r in read_results(output) if r['id'] == '1')
+    assert(failed['error'] == 'RuntimeError: fail now')
+    assert([t['message'] for t in failed['turns']] == ['ok'])
+
+    fake = FakeConversations()
+    BatchRunner(fake, str(output)).run(conversations)
+    assert(fake.sent == [])
+
+    BatchRunner(fake, str(output), retry_errors=True).run(conversations)
+    assert(fake.sent == ['ok', 'fail now'])
+    assert(len(read_results(output)) == 3)
@@ -0,0 +1,118 @@
+import json
+import pytest
+import requests
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from cassette import Cassette, CassetteMiss
+
+
+class CountingHandler(BaseHTTPRequestHandler):
+    """
+    Responds with JSON echo of request & number of requests served.
+    """
+    count = 0
+
+    def _respond(self):
+        CountingHandler.count += 1
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.dumps({ 'path': self.path,
+                            'body': self.rfile.read(length).decode(),
+                            'count': CountingHandler.count }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _respond
+    do_POST = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    CountingHandler.count = 0
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), CountingHandler)
+    Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{httpd.server_port}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_record_then_replay_without_server(server, tmp_path):
+    path = tmp_path / 'cassette.json'
+
+    with Cassette(path, mode='record', passthrough_hosts=()) as cassette:
+        first = requests.post(f'{server}/chat', json={ 'model': 'm', 'messages': [1] }).json()
+        second = requests.get(f'{server}/forecast?b=2&a=1').json()
+    assert cassette.recorded == 2
+    assert CountingHandler.count == 2
+
+    with Cassette(path, mode='replay', passthrough_hosts=()) as cassette:
+        # keys ignore JSON key & query parameter order
+        assert requests.post(f'{server}/chat', data='{"messages":[1], "model":"m"}').json() == first
+        assert requests.get(f'{server}/forecast?a=1&b=2').json() == second
+    assert cassette.replayed == 2
+    assert CountingHandler.count == 2
+
+
+def test_replay_miss_raises(server, tmp_path):
+    with Cassette(tmp_path / 'cassette.json', mode='replay', passthrough_hosts=()):
+        with pytest.raises(CassetteMiss):
+            requests.get(f'{server}/forecast')
+        with pytest.raises(requests.RequestException):
+            requests.get(f'{server}/forecast')
+    assert CountingHandler.count == 0
+
+
+def test_auto_records_new_requests_only(server, tmp_path):
+    path = tmp_path / 'cassette.json'
+
+    with Cassette(path, mode='auto', passthrough_hosts=()):
+        requests.get(f'{server}/a')
+    with Cassette(path, mode='auto', passthrough_hosts=()) as cassette:
+        requests.get(f'{server}/a')
+        requests.get(f'{server}/b')
+    assert (cassette.replayed, cassette.recorded) == (1, 1)
+    assert CountingHandler.count == 2
+    assert len(json.loads(path.read_text())['interactions']) == 2
+
+
+def test_repeated_requests_replay_in_order(server, tmp_path):
+    path = tmp_path / 'cassette.json'
+
+    with Cassette(path, mode='record', passthrough_hosts=()):
+        counts = [requests.get(f'{server}/a').json()['count'] for _ in range(2)]
+    with Cassette(path, mode='replay', passthrough_hosts=()):
+        assert [requests.get(f'{server}/a').json()['count'] for _ in range(3)] == counts + counts[-1:]
+
+
+def test_scrub_and_replay_timing(server, tmp_path):
+    path = tmp_path / 'cassette.json'
+
+    with Cassette(path, mode='record', scrub=[r'\d{4}-\d{2}-\d{2}'], passthrough_hosts=()):
+        requests.get(f'{server}/forecast?date=2024-07-29')
+
+    interactions = json.loads(path.read_text())['interactions']
+    interactions[0]['elapsed'] = 0.2
+    path.write_text(json.dumps({ 'interactions': interactions }))
+
+    with Cassette(path, mode='replay', scrub=[r'\d{4}-\d{2}-\d{2}'], replay_timing=True, passthrough_hosts=()):
+        start = time.perf_counter()
+        response = requests.get(f'{server}/forecast?date=2024-09-16')
+        assert time.perf_counter() - start >= 0.2
+    assert response.elapsed.total_seconds() >= 0.2
+
+
+def test_passthrough_and_unknown_mode(server, tmp_path):
+    path = tmp_path / 'cassette.json'
+
+    with Cassette(path, mode='replay'):
+        assert requests.get(f'{server}/a').json()['count'] == 1
+    assert not path.exists()
+
+    with pytest.raises(ValueError):
+        Cassette(path, mode='rewind')
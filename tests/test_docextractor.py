@@ -1,4 +1,6 @@
 import pytest
+import time
+from concurrent.futures import ThreadPoolExecutor
 from docextractor import DocExtractor
 from fixture_functions import *
 
@@ -92,6 +94,7 @@ def test_get_func_doc(func, expected_doc):
 
 ### Test docstring -> dict ###
 
+@pytest.mark.live
 @pytest.mark.parametrize('func, expected_dict', [
         (
             hello_doc,
@@ -190,3 +193,91 @@ def test_get_func_doc_details(func, expected_dict):
     doc = doc_extract.get_func_doc(func)
     assert(doc_extract.get_func_details(doc) == expected_dict)
 
+
+
+### Test invalid replies ###
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, content):
+        self.content = content
+
+    def json(self):
+        return { 'choices': [{ 'message': { 'content': self.content } }] }
+
+
+class FakeHTTP:
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.requests = []
+        self.response_formats = []
+
+    def post(self, url, headers, json, timeout):
+        self.requests.append([dict(m) for m in json['messages']])
+        self.response_formats.append(json.get('response_format'))
+        return FakeResponse(self.replies.pop(0))
+
+
+@pytest.mark.parametrize('replies, expected, requests', [
+    (
+        ['{"summary": "Say hello.", "args": {"name": "Name", "returns": "Greeting"}}'],
+        { 'summary': 'Say hello.', 'args': { 'name': 'Name' } },
+        1
+    ),
+    (
+        ['```json\n{"summary": "Say hello.", "args": {}}\n```'],
+        { 'summary': 'Say hello.', 'args': {} },
+        1
+    ),
+    (
+        ['Sure! Here are the details.', '{"summary": "Say hello.", "args": ["name"]}', '{"summary": "Say hello.", "args": {}}'],
+        { 'summary': 'Say hello.', 'args': {} },
+        3
+    ),
+    (
+        ['{"summary": "Say hello."', '{"args": {}}', '{"summary": 1, "args": {}}'],
+        None,
+        3
+    ),
+])
+def test_get_func_details_repairs(replies, expected, requests):
+    doc_extract = DocExtractor(max_repairs=2)
+    fake = FakeHTTP(replies)
+    doc_extract._client._http = fake
+
+    assert(doc_extract.get_func_details('Say hello.\n\nname -- Name') == expected)
+    assert(len(fake.requests) == requests)
+    assert(fake.response_formats[0] == { 'type': 'json_object' })
+    # repairs are sent in the same conversation
+    assert(len(fake.requests[-1]) == 2 * requests)
+
+
+def test_get_func_details_new_conversation():
+    doc_extract = DocExtractor(json_mode=False)
+    fake = FakeHTTP(['{"summary": "One.", "args": {}}', '{"summary": "Two.", "args": {}}'])
+    doc_extract._client._http = fake
+
+    doc_extract.get_func_details('One.')
+    assert(doc_extract.get_func_details('Two.') == { 'summary': 'Two.', 'args': {} })
+    assert([len(messages) for messages in fake.requests] == [2, 2])
+    assert(fake.response_formats[0] is None)
+
+
+def test_get_func_details_concurrent():
+    class SlowHTTP(FakeHTTP):
+        def post(self, url, headers, json, timeout):
+            self.requests.append([dict(m) for m in json['messages']])
+            time.sleep(0.01)
+            return FakeResponse(f'{{"summary": "{json["messages"][-1]["content"]}", "args": {{}}}}')
+
+    doc_extract = DocExtractor()
+    fake = SlowHTTP([])
+    doc_extract._client._http = fake
+
+    # registries on several threads share the default extractor
+    docs = [f'Tool {i}.' for i in range(8)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        details = list(executor.map(doc_extract.get_func_details, docs))
+    assert([d['summary'] for d in details] == docs)
+    assert([len(messages) for messages in fake.requests] == [2] * 8)
@@ -0,0 +1,8 @@
+from editdistance import edit_distance
+
+
+def test_edit_distance():
+    assert(edit_distance('london', 'lodnon', 2) == 2)
+    assert(edit_distance('paris', 'pariss', 2) == 1)
+    assert(edit_distance('paris', 'tokyo', 2) == 3)
+    assert(edit_distance('', 'ab', 2) == 2)
@@ -0,0 +1,90 @@
+import pytest
+from gazetteer import Gazetteer, build_index, normalize, read_geonames
+
+# GeoNames dump columns: geonameid, name, asciiname, alternatenames, latitude,
+# longitude, feature class, feature code, country code, cc2, admin1 code,
+# admin2 code, admin3 code, admin4 code, population, ...
+places = [
+    (2643743, 'London', 'London', 51.50853, -0.12574, 'GB', 'ENG', 8961989),
+    (6058560, 'London', 'London', 42.98339, -81.23304, 'CA', '08', 346765),
+    (5391959, 'San Francisco', 'San Francisco', 37.77493, -122.41942, 'US', 'CA', 864816),
+    (5392171, 'San Jose', 'San Jose', 37.33939, -121.89496, 'US', 'CA', 1026908),
+    (2988507, 'Paris', 'Paris', 48.85341, 2.3488, 'FR', '11', 2138551),
+    (2657896, 'Zürich', 'Zurich', 47.36667, 8.55, 'CH', 'ZH', 341730),
+    (1850147, 'Tokyo', 'Tokyo', 35.6895, 139.69171, 'JP', '40', 8336599),
+]
+
+
+@pytest.fixture
+def gazetteer(tmp_path):
+    dump = tmp_path / 'cities.txt'
+    dump.write_text(''.join(f'{id}\t{name}\t{ascii}\t\t{lat}\t{lon}\tP\tPPL\t{cc}\t\t{admin1}\t\t\t\t{pop}\t\t10\tEurope/London\t2024-01-01\n'
+                            for (id, name, ascii, lat, lon, cc, admin1, pop) in places), encoding='utf-8')
+    path = tmp_path / 'gazetteer.idx'
+    # Zürich & Zurich share a normalized key, so are indexed once
+    assert(build_index(read_geonames(str(dump)), str(path)) == len(places))
+
+    gazetteer = Gazetteer(str(path))
+    yield gazetteer
+    gazetteer.close()
+
+
+def test_normalize():
+    assert(normalize('  Zürich  ') == 'zurich')
+    assert(normalize('SAN\tFrancisco') == 'san francisco')
+
+
+def test_lookup(gazetteer):
+    london = gazetteer.lookup('london')
+    assert([p['country'] for p in london] == ['GB', 'CA'])
+    assert(london[0] == { 'geonameid': 2643743, 'name': 'London', 'country': 'GB', 'admin1': 'ENG',
+                          'lat': 51.50853, 'lon': -0.12574, 'population': 8961989 })
+    assert(gazetteer.lookup('London', country='CA')[0]['admin1'] == '08')
+    assert([p['country'] for p in gazetteer.lookup('London', admin1='08')] == ['CA'])
+    assert([p['name'] for p in gazetteer.lookup('zurich')] == ['Zürich'])
+    assert(gazetteer.lookup('Lond') == [])
+
+
+def test_prefix(gazetteer):
+    assert([p['name'] for p in gazetteer.prefix('San ')] == ['San Jose', 'San Francisco'])
+    assert([p['name'] for p in gazetteer.prefix('san f')] == ['San Francisco'])
+    assert(gazetteer.prefix('') == [])
+
+
+def test_fuzzy(gazetteer):
+    assert([p['country'] for p in gazetteer.fuzzy('Lodnon')] == ['GB', 'CA'])
+    assert([p['name'] for p in gazetteer.fuzzy('Pariss')] == ['Paris'])
+    assert(gazetteer.fuzzy('Tokio', max_distance=0) == [])
+
+    # typo in first letter
+    assert([p['country'] for p in gazetteer.fuzzy('Kondon')] == ['GB', 'CA'])
+    assert([p['name'] for p in gazetteer.fuzzy('Aris')] == ['Paris'])
+    assert([p['name'] for p in gazetteer.fuzzy('Xtokyo')] == ['Tokyo'])
+    assert([p['name'] for p in gazetteer.fuzzy('Lan Jose', admin1='CA')] == ['San Jose'])
+
+
+def test_search(gazetteer):
+    assert(gazetteer.search('paris')[0]['name'] == 'Paris')
+    assert(gazetteer.search('tok')[0]['name'] == 'Tokyo')
+    assert(gazetteer.search('Tokio')[0]['name'] == 'Tokyo')
+    assert(gazetteer.search('Atlantis') == [])
+
+
+def test_not_an_index(tmp_path):
+    path = tmp_path / 'other.idx'
+    path.write_bytes(b'NOPE' + bytes(8))
+    with pytest.raises(ValueError):
+        Gazetteer(str(path))
+
+
+def test_big_endian_host(gazetteer, tmp_path, monkeypatch):
+    import sys
+
+    # offsets are stored little-endian, & read in host byte order
+    monkeypatch.setattr(sys, 'byteorder', 'big')
+    swapped = Gazetteer(str(tmp_path / 'gazetteer.idx'))
+    try:
+        assert(list(swapped._offsets) == list(gazetteer._offsets))
+        assert(swapped.search('paris')[0]['name'] == 'Paris')
+    finally:
+        swapped.close()
@@ -1,11 +1,17 @@
+import json
 import pytest
+import time
 from fixture_functions import *
-from llmtoolutil import llm_tool_util
+from stub_extractor import stub_registry
 from tools.weather_tool import get_weather_forecast
 
 import logging
 import io
 
+# registry of these tests, extracting details without the LLM. Extraction is
+# tested in test_docextractor.py
+llm_tool_util = stub_registry()
+
 
 ### Test func -> llm_tool handling #
 
@@ -256,6 +262,14 @@ def test_get_func_details(func, expected_list):
     (
         'The first president of the United States was George Washington.',
         False
+    ),
+    (
+        '```json\n{ "name": "get_weather_forecast", "parameters": { "lat": "37.7749", "lon": "-122.4194", "date": "2024-09-06" } }\n```',
+        True
+    ),
+    (
+        'Here is the tool call: { "name": "get_weather_forecast", "parameters": { "lat": "37.7749", "lon": "-122.4194", "date": "2024-09-06" } }',
+        True
     )
 ])
 
@@ -313,3 +327,208 @@ def test_can_handle_tool_call(tools, model_response, expected):
 
 
 
+
+
+### Test llm_tool.generate_compact_tool_markup ###
+
+@pytest.mark.parametrize('func, expected', [
+    (
+        hello_doc,
+        'hello_doc() - This function returns Hello World!'
+    ),
+    (
+        one_arg_type_no_return,
+        ''
+    ),
+    (
+        three_args_yes_type_yes_return,
+        """three_args_yes_type_yes_return(some_string:string, some_other_string:string, glue?:integer) - Take two strings, join them with 1 multiplied by glue and return its length.
+ some_string: Some string
+ some_other_string: Some other string
+ glue: Added '0' as separators (default 1)"""
+    ),
+    (
+        connect_to_next_port,
+        """connect_to_next_port(minimum:integer) - Connects to the next available port.
+ minimum: A port value greater or equal to 1024"""
+    )
+])
+
+def test_generate_compact_tool_markup(func, expected):
+    llm_tool_util._clear_tools()
+    llm_tool_util.llm_tool(func)
+    assert(llm_tool_util.generate_compact_tool_markup() == expected)
+    assert(len(llm_tool_util.render_tool_markup('compact')) <= len(llm_tool_util.render_tool_markup('json')))
+    llm_tool_util._clear_tools()
+
+
+def test_render_tool_markup_unknown_format():
+    with pytest.raises(ValueError):
+        llm_tool_util.render_tool_markup('xml')
+
+
+### Test llm_tool.generate_openai_tool_markup ###
+
+def test_generate_openai_tool_markup():
+    llm_tool_util._clear_tools()
+    llm_tool_util.llm_tool(hello_doc)
+    llm_tool_util.llm_tool(just_test_types)
+    llm_tool_util.llm_tool(get_weather_forecast)
+
+    (hello, types, weather) = llm_tool_util.generate_openai_tool_markup()
+    assert(hello['function']['parameters'] == { 'type': 'object', 'properties': {}, 'required': [] })
+    assert({ key: prop['type'] for (key, prop) in types['function']['parameters']['properties'].items() } == {
+        'a': 'integer', 'b': 'string', 'c': 'object', 'd': 'array', 'e': 'boolean',
+        'f': 'string', 'g': 'string', 'h': 'string', 'i': 'number',
+    })
+    assert(weather['function']['parameters']['properties']['date']['format'] == 'date')
+    assert(weather['function']['parameters']['required'] == ['lat', 'lon', 'date'])
+    # cached markup is not modified
+    assert(llm_tool_util.generate_tool_markup()[0]['function']['parameters'] is None)
+    llm_tool_util._clear_tools()
+
+
+def test_parse_native_tool_calls():
+    tool_calls = [
+        { 'id': 'call_1', 'type': 'function', 'function': { 'name': 'hello_doc', 'arguments': '{}' } },
+        { 'id': 'call_2', 'type': 'function', 'function': { 'name': 'connect_to_next_port', 'arguments': '{"minimum": 8080}' } },
+        { 'id': 'call_3', 'type': 'function', 'function': { 'name': 'connect_to_next_port', 'arguments': '{"minimum":' } },
+    ]
+    assert(llm_tool_util.parse_native_tool_calls(tool_calls) == [
+        { 'id': 'call_1', 'name': 'hello_doc', 'parameters': {} },
+        { 'id': 'call_2', 'name': 'connect_to_next_port', 'parameters': { 'minimum': 8080 } },
+        { 'id': 'call_3', 'name': 'connect_to_next_port', 'parameters': {} },
+    ])
+
+
+### Test llm_tool.scoped registries ###
+
+def test_scoped_registry_isolation():
+    llm_tool_util._clear_tools()
+    llm_tool_util.llm_tool(hello_doc)
+
+    tenant = llm_tool_util.scoped()
+    empty = llm_tool_util.scoped(inherit=False)
+    tenant.llm_tool(connect_to_next_port)
+
+    assert(set(tenant._tool_funcs) == {'hello_doc', 'connect_to_next_port'})
+    assert(set(llm_tool_util._tool_funcs) == {'hello_doc'})
+    assert(len(empty._tool_funcs) == 0)
+    assert(tenant.can_handle_tool_call('{ "name": "connect_to_next_port", "parameters": { "minimum": "8080" } }'))
+    assert(not llm_tool_util.can_handle_tool_call('{ "name": "connect_to_next_port", "parameters": { "minimum": "8080" } }'))
+
+    assert(tenant.unregister('hello_doc'))
+    assert(not tenant.unregister('hello_doc'))
+    assert('hello_doc' in llm_tool_util._tool_funcs)
+
+    llm_tool_util._clear_tools()
+
+
+def test_registry_snapshot_is_immutable():
+    llm_tool_util._clear_tools()
+    llm_tool_util.llm_tool(hello_doc)
+
+    snapshot = llm_tool_util._tool_funcs
+    with pytest.raises(TypeError):
+        snapshot['other'] = hello_doc
+
+    llm_tool_util._clear_tools()
+    assert('hello_doc' in snapshot)
+    assert('hello_doc' not in llm_tool_util._tool_funcs)
+
+
+def test_failed_extraction_is_not_registered(monkeypatch, caplog):
+    registry = llm_tool_util.scoped(inherit=False)
+    monkeypatch.setattr(registry._doc_extraction, 'get_func_details', lambda doc: None)
+
+    with caplog.at_level(logging.CRITICAL):
+        assert(registry.llm_tool(hello_doc) is hello_doc)
+    assert('hello_doc' not in registry._tool_funcs)
+    assert('Unable to extract function details' in caplog.text)
+
+
+### Test llm_tool.parse_tool_plan & invoke_tool_plan ###
+
+def locate(place:str) -> dict:
+    """
+    Returns coordinates of a place
+
+    place -- Name of place
+    """
+    time.sleep(0.1)
+    if place == 'Atlantis':
+        raise LookupError(place)
+    return { 'places': [{ 'name': place, 'lat': len(place), 'lon': -len(place) }] }
+
+
+def distance(lat:float, lon:float) -> float:
+    """
+    Returns distance of coordinates from the origin
+
+    lat -- Latitude
+    lon -- Longitude
+    """
+    return abs(lat) + abs(lon)
+
+
+@pytest.fixture
+def plan_registry():
+    return stub_registry(locate, distance)
+
+
+def plan(*steps):
+    return json.dumps({ 'plan': list(steps) })
+
+
+def test_parse_tool_plan(plan_registry):
+    response = 'Here is the plan: ' + plan(
+        { 'id': 'london', 'name': 'locate', 'parameters': { 'place': 'London' } },
+        { 'name': 'distance', 'parameters': { 'lat': '$london.places.0.lat', 'lon': '$london.places.0.lon' } },
+        { 'name': 'distance', 'parameters': { 'lat': '$2', 'lon': '$unknown' } },
+    )
+    steps = plan_registry.parse_tool_plan(response)
+    assert([(s['id'], s['name'], s['depends_on']) for s in steps] == [
+        ('london', 'locate', []),
+        ('2', 'distance', ['london']),
+        ('3', 'distance', ['2']),
+    ])
+    assert(plan_registry.can_handle_tool_calls(steps))
+
+    assert(plan_registry.parse_tool_plan('{"name": "locate", "parameters": {"place": "Paris"}}') is None)
+    assert(plan_registry.parse_tool_plan(plan({ 'id': 'a', 'name': 'locate', 'parameters': {} },
+                                              { 'id': 'a', 'name': 'locate', 'parameters': {} })) is None)
+
+
+def test_invoke_tool_plan_in_parallel(plan_registry):
+    steps = plan_registry.parse_tool_plan(plan(
+        { 'id': 'london', 'name': 'locate', 'parameters': { 'place': 'London' } },
+        { 'id': 'paris', 'name': 'locate', 'parameters': { 'place': 'Paris' } },
+        { 'id': 'd1', 'name': 'distance', 'parameters': { 'lat': '$london.places.0.lat', 'lon': '$london.places.0.lon' } },
+        { 'id': 'd2', 'name': 'distance', 'parameters': { 'lat': '$paris.places.0.lat', 'lon': 1 } },
+    ))
+
+    start = time.perf_counter()
+    results = plan_registry.invoke_tool_plan(steps)
+    assert(time.perf_counter() - start < 0.19)
+
+    assert(results[0]['places'][0]['name'] == 'London')
+    assert(results[2:] == [12.0, 6.0])
+
+
+def test_invoke_tool_plan_failures(plan_registry):
+    steps = plan_registry.parse_tool_plan(plan(
+        { 'id': 'atlantis', 'name': 'locate', 'parameters': { 'place': 'Atlantis' } },
+        { 'id': 'd1', 'name': 'distance', 'parameters': { 'lat': '$atlantis.places.0.lat', 'lon': 0 } },
+        { 'id': 'rome', 'name': 'locate', 'parameters': { 'place': 'Rome' } },
+        { 'id': 'd2', 'name': 'distance', 'parameters': { 'lat': '$rome.places.1.lat', 'lon': 0 } },
+        { 'id': 'd3', 'name': 'distance', 'parameters': { 'lat': '$rome.places.0.lat', 'lon': '$d4' } },
+        { 'id': 'd4', 'name': 'distance', 'parameters': { 'lat': 0, 'lon': '$d3' } },
+    ))
+    results = plan_registry.invoke_tool_plan(steps)
+
+    assert(results[0] == { 'error': 'LookupError: Atlantis' })
+    assert(results[1] == { 'error': 'Not invoked. Step `atlantis` failed' })
+    assert(results[2]['places'][0]['lat'] == 4)
+    assert(results[3] == { 'error': 'Not invoked. No field `1` in response of step `rome`, for `$rome.places.1.lat`' })
+    assert(results[4] == results[5] == { 'error': 'Not invoked. Steps depend on each other in a cycle' })
+
@@ -0,0 +1,109 @@
+import pytest
+import time
+from threading import Lock
+from loadgen import LoadGenerator, percentiles
+
+
+class FakeConversations:
+    """
+    Conversations that take `delay` seconds per message, split evenly between
+    LLM & tool, and fail on messages containing `fail`.
+    """
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.started = 0
+        self._lock = Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.started += 1
+
+        def send(message):
+            with self._lock:
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                time.sleep(self.delay)
+                if 'fail' in message:
+                    raise RuntimeError(message)
+                return { 'llm_seconds': self.delay / 2, 'tool_seconds': self.delay / 2 }
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+        return send
+
+
+def test_percentiles():
+    stats = percentiles([i / 100 for i in range(1, 101)])
+    assert stats['count'] == 100
+    assert stats['p50'] == pytest.approx(0.505)
+    assert stats['p99'] == pytest.approx(0.9901)
+    assert stats['max'] == 1.0
+    assert percentiles([0.5])['p99'] == 0.5
+    assert percentiles([]) == { 'count': 0 }
+
+
+def test_concurrency():
+    conversations = FakeConversations()
+    corpus = [['a', 'b'], ['c']]
+    report = LoadGenerator(conversations, corpus=corpus, concurrency=4, conversations=20).run()
+
+    assert conversations.started == 20
+    assert conversations.max_in_flight == 4
+    assert report['messages'] == 30
+    assert report['errors'] == 0
+    assert report['latency']['total']['count'] == 30
+    assert report['latency']['llm']['p50'] == pytest.approx(0.005)
+    assert report['latency']['tool']['p50'] == pytest.approx(0.005)
+    assert report['messages_per_second'] > 0
+    assert len(report['memory']) >= 1
+
+
+def test_errors_end_conversation():
+    corpus = [['fail', 'not sent'], ['ok']]
+    report = LoadGenerator(FakeConversations(delay=0), corpus=corpus, concurrency=2).run()
+
+    assert report['messages'] == 2
+    assert report['errors'] == 1
+    assert report['error_rate'] == 0.5
+    assert report['error_types'] == { 'RuntimeError': 1 }
+
+
+def test_rate_does_not_wait_for_conversations():
+    conversations = FakeConversations(delay=0.2)
+    start = time.perf_counter()
+    report = LoadGenerator(conversations, corpus=[['a']], rate=100, conversations=10).run()
+
+    # 10 conversations arriving at 100/s overlap, rather than run one at a time
+    assert time.perf_counter() - start < 1.0
+    assert conversations.max_in_flight > 1
+    assert report['mode'] == 'rate'
+    assert report['messages'] == 10
+
+
+def test_rate_measures_from_scheduled_start():
+    # 1 worker for conversations arriving at 1000/s, each taking 0.05s
+    conversations = FakeConversations(delay=0.05)
+    report = LoadGenerator(conversations, corpus=[['a']], rate=1000, conversations=5, max_in_flight=1).run()
+
+    # later conversations queue for the worker, & their latency includes it
+    assert report['latency']['total']['max'] >= 0.15
+    assert report['latency']['queue']['max'] >= 0.1
+    assert report['latency']['llm']['max'] == pytest.approx(0.025)
+
+
+def test_timed_out_turns_are_errors():
+    def new_conversation():
+        return lambda message: { 'llm_seconds': 1.0, 'tool_seconds': 0.0, 'stop_reason': 'budget' if 'slow' in message else 'answered' }
+
+    report = LoadGenerator(new_conversation, corpus=[['slow'], ['fast']], concurrency=1).run()
+    assert report['errors'] == 1
+    assert report['error_types'] == { 'budget': 1 }
+    assert report['latency']['queue'] == { 'count': 0 }
+
+
+def test_concurrency_or_rate():
+    with pytest.raises(ValueError):
+        LoadGenerator(FakeConversations(), concurrency=2, rate=1)
@@ -0,0 +1,79 @@
+import pytest
+from metrics import MetricsRegistry
+
+
+def test_counter_and_gauge():
+    registry = MetricsRegistry()
+    errors = registry.counter('tool_call_errors_total', 'Tool calls that failed', ('tool', 'reason'))
+    errors.inc(tool='get_weather_forecast', reason='exception')
+    errors.inc(2, tool='get_weather_forecast', reason='exception')
+    registry.gauge('assistant_sessions', 'Sessions in memory').set(4)
+
+    assert(registry.counter('tool_call_errors_total', '', ('tool', 'reason')) is errors)
+    assert(errors.value(tool='get_weather_forecast', reason='exception') == 3)
+    assert(registry.to_prometheus() == '''# HELP tool_call_errors_total Tool calls that failed
+# TYPE tool_call_errors_total counter
+tool_call_errors_total{tool="get_weather_forecast",reason="exception"} 3
+# HELP assistant_sessions Sessions in memory
+# TYPE assistant_sessions gauge
+assistant_sessions 4
+''')
+
+
+def test_histogram():
+    registry = MetricsRegistry()
+    latency = registry.histogram('llm_request_seconds', 'Latency', ('model',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        latency.observe(value, model='m"1')
+
+    assert(latency.value(model='m"1') == { 'count': 4, 'sum': 2.65 })
+    assert(registry.to_prometheus().splitlines()[2:] == [
+        'llm_request_seconds_bucket{model="m\\"1",le="0.1"} 2',
+        'llm_request_seconds_bucket{model="m\\"1",le="1.0"} 3',
+        'llm_request_seconds_bucket{model="m\\"1",le="+Inf"} 4',
+        'llm_request_seconds_sum{model="m\\"1"} 2.65',
+        'llm_request_seconds_count{model="m\\"1"} 4',
+    ])
+
+
+def test_invalid_use():
+    registry = MetricsRegistry()
+    counter = registry.counter('errors_total', 'Errors', ('tool',))
+    with pytest.raises(ValueError):
+        counter.inc(model='m')
+    with pytest.raises(ValueError):
+        registry.gauge('errors_total', 'Errors')
+
+
+def test_write(tmp_path):
+    registry = MetricsRegistry()
+    registry.counter('parse_failures_total', 'Failures').inc()
+    path = tmp_path / 'metrics.prom'
+    registry.write(str(path))
+
+    assert(path.read_text().endswith('parse_failures_total 1\n'))
+    assert([p.name for p in tmp_path.iterdir()] == ['metrics.prom'])
+
+
+def test_tool_call_metrics():
+    from fixture_functions import three_args_yes_type_yes_return
+    from llmtoolutil import tool_call_errors, tool_call_seconds, unknown_tool_label
+    from stub_extractor import stub_registry
+
+    tool_util = stub_registry(three_args_yes_type_yes_return)
+    name = 'three_args_yes_type_yes_return'
+    calls = (tool_call_seconds.value(tool=name) or { 'count': 0 })['count']
+    failed = tool_call_errors.value(tool=name, reason='exception') or 0
+    unknown = tool_call_errors.value(tool=unknown_tool_label, reason='unknown_tool') or 0
+
+    tool_util.handle_tool_call(f'{{"name": "{name}", "parameters": {{"some_string": "a", "some_other_string": "b", "glue": 1}}}}')
+    with pytest.raises(TypeError):
+        tool_util.handle_tool_call(f'{{"name": "{name}", "parameters": {{"some_string": "a", "some_other_string": "b", "glue": {{}}}}}}')
+
+    assert(tool_call_seconds.value(tool=name)['count'] == calls + 2)
+    assert(tool_call_errors.value(tool=name, reason='exception') == failed + 1)
+
+    # names of tools that are not registered share one label
+    tool_util.invoke_tool_calls([{ 'name': 'get_stock_price', 'parameters': {} }])
+    assert(tool_call_errors.value(tool=unknown_tool_label, reason='unknown_tool') == unknown + 1)
+    assert(tool_call_errors.value(tool='get_stock_price', reason='unknown_tool') is None)
@@ -0,0 +1,54 @@
+import gc
+import inspect
+import logging
+import os
+import signal
+
+import pytest
+
+from fixture_functions import three_args_yes_type_yes_return
+from prefork import PreforkLauncher, memory_usage
+from stub_extractor import stub_registry
+from toolloader import LazyTool
+
+
+def test_memory_usage():
+    usage = memory_usage()
+    assert(usage['max_rss'] > 0)
+
+    if os.path.exists('/proc/self/smaps_rollup'):
+        assert(usage['rss'] > 0)
+        assert(0 < usage['pss'] <= usage['rss'])
+
+
+def test_prepare():
+    func = three_args_yes_type_yes_return
+    lazy = LazyTool(func.__module__, func.__name__, func.__doc__, inspect.signature(func))
+    tool_util = stub_registry(lazy)
+    launcher = PreforkLauncher(tool_util=tool_util)
+    try:
+        system_message = launcher.prepare()
+        assert(gc.get_freeze_count() > 0)
+    finally:
+        gc.unfreeze()
+
+    assert('three_args_yes_type_yes_return' in system_message)
+    assert(lazy.is_loaded)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+def test_failed_workers_exit(caplog):
+    # workers fail to construct their server, & must exit instead of
+    # returning into the parent's fork loop
+    launcher = PreforkLauncher(workers=2, port=0, tool_util=stub_registry(three_args_yes_type_yes_return), unknown_option=1)
+    handler = signal.getsignal(signal.SIGTERM)
+    try:
+        with caplog.at_level(logging.ERROR):
+            launcher.run()
+    finally:
+        signal.signal(signal.SIGTERM, handler)
+        gc.unfreeze()
+
+    assert(len(launcher._pids) == 2)
+    assert([r.message for r in caplog.records if 'exited with' in r.message] ==
+           [f'Worker {pid} exited with 1' for pid in launcher._pids])
@@ -0,0 +1,78 @@
+import json
+import pytest
+
+from resultpolicy import ResultPolicy, ResultStore, compact_result, load_policies
+
+# shape of a `get_weather_forecasts` response
+forecasts = {
+    'format_hint': 'Summarize the forecast for each location.',
+    'forecasts': [
+        { 'latitude': 37.77, 'longitude': -122.42, 'units': { 'temperature': '°F' },
+          'days': [{ 'date': f'2024-08-{d:02}', 'temperature': { 'min': 50 + d, 'max': 70 + d } } for d in range(1, 15)] },
+        { 'latitude': 51.51, 'longitude': -0.13, 'units': { 'temperature': '°F' },
+          'days': [{ 'date': f'2024-08-{d:02}', 'temperature': { 'min': 40 + d, 'max': 60 + d } } for d in range(1, 15)] },
+    ]
+}
+
+
+### Test ResultPolicy ###
+
+def test_no_policy():
+    assert(compact_result(forecasts, None) is forecasts)
+    assert(compact_result(forecasts, ResultPolicy(max_items=100)) is forecasts)
+
+
+def test_fields():
+    (compacted, changed) = ResultPolicy(fields=['forecasts.latitude', 'forecasts.days.temperature.max', 'missing']).apply(forecasts)
+    assert(changed)
+    assert(compacted['forecasts'][1]['latitude'] == 51.51)
+    assert(set(compacted) == { 'forecasts' })
+    assert(set(compacted['forecasts'][0]) == { 'latitude', 'days' })
+    assert(compacted['forecasts'][0]['days'][0] == { 'temperature': { 'max': 71 } })
+
+
+def test_max_items():
+    (compacted, _) = ResultPolicy(max_items=3).apply(forecasts)
+    days = compacted['forecasts'][0]['days']
+    assert(days[:3] == forecasts['forecasts'][0]['days'][:3])
+    assert(days[3] == '... 11 more items, 14 in total')
+    assert(len(compacted['forecasts']) == 2)
+
+
+def test_max_chars():
+    size = len(json.dumps(forecasts))
+    (compacted, _) = ResultPolicy(max_chars=size // 2).apply(forecasts)
+    assert(len(json.dumps(compacted)) <= size // 2)
+    assert(isinstance(compacted['forecasts'][0]['days'][-1], str))
+
+    # too large, even with a single item per list
+    (compacted, _) = ResultPolicy(max_chars=50).apply(forecasts)
+    assert(len(compacted['preview']) == 50)
+    assert(compacted['truncated'].endswith('characters left out'))
+    assert(compacted['preview'].startswith('{"format_hint"'))
+
+
+def test_retain():
+    store = ResultStore(max_results=2)
+    policy = ResultPolicy(max_items=1, retain=True)
+
+    compacted = compact_result(forecasts, policy, store)
+    assert(compacted['result_id'] == 'result_1')
+    assert(store.get('result_1') is forecasts)
+    assert(compact_result(list(range(5)), policy, store) == { 'result': [0, '... 4 more items, 5 in total'], 'result_id': 'result_2' })
+
+    # unchanged responses are not retained, & oldest are evicted
+    assert(compact_result([1], policy, store) == [1])
+    compact_result(list(range(5)), policy, store)
+    assert(len(store) == 2 and store.get('result_1') is None)
+
+
+def test_load_policies(tmp_path):
+    path = tmp_path / 'policies.json'
+    path.write_text(json.dumps({ 'get_weather_forecasts': { 'max_items': 7, 'retain': True }, '*': { 'max_chars': 8000 } }))
+
+    policies = load_policies(str(path))
+    assert(policies['get_weather_forecasts'].max_items == 7 and policies['get_weather_forecasts'].retain)
+    assert(policies['*'].max_chars == 8000)
+    with pytest.raises(TypeError):
+        ResultPolicy.from_dict({ 'max_size': 1 })
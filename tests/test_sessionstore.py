@@ -0,0 +1,72 @@
+import json
+import pytest
+from sessionstore import SessionStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SessionStore(str(tmp_path / 'sessions.db'), compress_threshold=64)
+    yield store
+    store.close()
+
+
+def test_append_and_load(store):
+    tool_response = json.dumps({ 'forecast': { 'date': '2024-09-16', 'temperature': '58.8 - 67.8 °F' } }, indent=4)
+    messages = [
+        { 'role': 'user', 'content': 'What will the temperature be in London, next Monday?' },
+        { 'role': 'assistant', 'content': '{"name": "get_weather_forecast", "parameters": {}}' },
+        { 'role': 'user', 'content': tool_response },
+        { 'role': 'assistant', 'content': 'Between 58.8°F and 67.8°F.' * 10 },
+    ]
+
+    store.append('s1', 0, messages[:2])
+    store.append('s1', 2, messages[2:])
+    loaded = store.load('s1')
+
+    assert([m['role'] for m in loaded] == [m['role'] for m in messages])
+    assert(loaded[0] == messages[0] and loaded[3] == messages[3])
+
+    # tool responses are stored compact
+    assert(json.loads(loaded[2]['content']) == json.loads(tool_response))
+    assert(len(loaded[2]['content']) < len(tool_response))
+
+
+def test_sessions_persist_across_reopen(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    store = SessionStore(path)
+    store.create('empty')
+    store.append('s1', 0, [{ 'role': 'user', 'content': 'hi' }])
+    store.close()
+
+    store = SessionStore(path)
+    assert(set(store.session_ids()) == {'empty', 's1'})
+    assert(store.exists('empty') and store.load('empty') == [])
+    assert(store.load('s1') == [{ 'role': 'user', 'content': 'hi' }])
+
+    store.delete('s1')
+    assert(not store.exists('s1') and store.load('s1') == [])
+    store.close()
+
+
+def test_native_messages(tmp_path):
+    import sqlite3
+
+    # store created before other message keys were stored
+    path = str(tmp_path / 'sessions.db')
+    db = sqlite3.connect(path)
+    db.execute('CREATE TABLE messages (session_id TEXT, seq INTEGER, role TEXT, encoding INTEGER, content BLOB, '
+               'PRIMARY KEY (session_id, seq)) WITHOUT ROWID')
+    db.execute("INSERT INTO messages VALUES ('s1', 0, 'user', 0, ?)", (b'hi',))
+    db.commit()
+    db.close()
+
+    store = SessionStore(path)
+    tool_call = { 'id': 'call_1', 'type': 'function', 'function': { 'name': 'get_weather', 'arguments': '{}' } }
+    messages = [
+        { 'role': 'assistant', 'content': None, 'tool_calls': [tool_call] },
+        { 'role': 'tool', 'tool_call_id': 'call_1', 'content': '{"temperature":58.8}' },
+    ]
+    store.append('s1', 1, messages)
+
+    assert(store.load('s1') == [{ 'role': 'user', 'content': 'hi' }] + messages)
+    store.close()
@@ -0,0 +1,134 @@
+import json
+import os
+import pytest
+import subprocess
+import sys
+import textwrap
+from llmclient import load_prompt
+from startupprofiler import StartupProfiler
+
+
+def test_stage_report():
+    profiler = StartupProfiler()
+
+    with profiler.stage('outer'):
+        with profiler.stage('inner'):
+            pass
+
+    report = profiler.report()
+    assert([s['stage'] for s in report['stages']] == ['outer', 'inner'])
+    assert([s['depth'] for s in report['stages']] == [0, 1])
+    assert(report['stages'][0]['seconds'] >= report['stages'][1]['seconds'])
+    assert(report['total_seconds'] >= report['stages'][0]['seconds'])
+
+
+def test_tool_stage_report():
+    profiler = StartupProfiler()
+
+    with profiler.tool_stage('some_tool', 'validation'):
+        pass
+    with profiler.tool_stage('some_tool', 'extraction'):
+        pass
+    with profiler.tool_stage('some_tool', 'validation'):
+        pass
+
+    tool = profiler.report()['tools']['some_tool']
+    assert(set(tool) == {'validation', 'extraction', 'total'})
+    assert(tool['total'] == pytest.approx(tool['validation'] + tool['extraction']))
+
+
+def test_stage_recorded_on_exception():
+    profiler = StartupProfiler()
+
+    with pytest.raises(RuntimeError):
+        with profiler.stage('failing'):
+            raise RuntimeError()
+
+    assert(json.loads(profiler.to_json())['stages'][0]['stage'] == 'failing')
+
+
+def test_finish_stops_recording():
+    profiler = StartupProfiler()
+    with profiler.stage('startup'):
+        pass
+    profiler.finish()
+    total = profiler.report()['total_seconds']
+
+    with profiler.stage('reload'):
+        with profiler.tool_stage('get_weather_forecast', 'extraction'):
+            pass
+    report = profiler.report()
+    assert(profiler.finished)
+    assert([s['stage'] for s in report['stages']] == ['startup'] and report['tools'] == {})
+    assert(report['total_seconds'] == total)
+
+
+### Test startup budgets ###
+
+src_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# seconds allowed, generous enough for slow CI machines
+import_budget = 0.5
+time_to_prompt_budget = 2.0
+
+def run_python(code:str, *args) -> str:
+    result = subprocess.run([sys.executable, '-c', code, *args], cwd=src_dir, capture_output=True, text=True, timeout=60,
+                            env={ **os.environ, 'PYTHONPATH': src_dir })
+    assert(result.returncode == 0), result.stderr
+    return result.stdout
+
+
+def test_import_llmtoolutil_budget():
+    output = run_python(textwrap.dedent('''
+        import json, sys
+        from time import perf_counter
+        start = perf_counter()
+        import llmtoolutil
+        seconds = perf_counter() - start
+        print(json.dumps({ 'seconds': seconds, 'modules': [m for m in ('requests', 'dotenv', 'docextractor') if m in sys.modules] }))
+    '''))
+    report = json.loads(output)
+
+    # doc extraction, & its LLM client, are set up when the first tool is registered
+    assert(report['modules'] == [])
+    assert(report['seconds'] < import_budget)
+
+
+def test_assistant_time_to_prompt_budget():
+    # extraction is stubbed, LLM latency is not part of the budget
+    output = run_python(textwrap.dedent('''
+        import json, runpy, sys
+        sys.path.append(sys.argv[1])
+        import docextractor, llmclient
+        from stub_extractor import StubDocExtractor
+        docextractor.DocExtractor.get_func_details = StubDocExtractor.get_func_details
+
+        system_messages = []
+        init = llmclient.LLMClient.__init__
+        def record_init(self, *args, **kwargs):
+            system_messages.append(kwargs.get('system_message'))
+            init(self, *args, **kwargs)
+        llmclient.LLMClient.__init__ = record_init
+
+        sys.argv = ['assistant.py', '--profile-startup']
+        try:
+            runpy.run_path('assistant.py', run_name='__main__')
+        except SystemExit:
+            pass
+        print('---')
+        print(json.dumps(system_messages[-1]))
+    '''), os.path.dirname(os.path.abspath(__file__)))
+    (profile, system_message) = output.split('\n---\n')
+    report = json.loads(profile)
+
+    stages = [s['stage'] for s in report['stages']]
+    assert('Assistant' in stages and 'load_dotenv' in stages)
+    assert(report['total_seconds'] < time_to_prompt_budget)
+    # budget is measured with the tools registered
+    for name in ('get_weather_forecast', 'get_weather_forecasts', 'get_current_weather', 'geocode'):
+        assert(f'"{name}"' in json.loads(system_message))
+
+
+def test_prompts_are_cached():
+    assert(load_prompt('assistant.md') is load_prompt('assistant.md'))
+    assert('{tools}' in load_prompt('assistant.md'))
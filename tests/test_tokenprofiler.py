@@ -0,0 +1,139 @@
+import json
+import logging
+import pytest
+from fixture_functions import hello_doc, connect_to_next_port
+from llmclient import LLMClient
+from stub_extractor import stub_registry
+from tokenprofiler import RequestProfiler, estimate_tokens, message_overhead
+
+
+class FakeResponse:
+    status_code = 200
+
+    def json(self):
+        return { 'choices': [{ 'message': { 'content': 'Hi!' } }] }
+
+
+class FakeHTTP:
+    def post(self, url, headers, json, timeout):
+        return FakeResponse()
+
+
+@pytest.fixture
+def tool_util():
+    return stub_registry(hello_doc, connect_to_next_port)
+
+
+### Test estimate_tokens ###
+
+@pytest.mark.parametrize('text, expected', [
+    ('', 0),
+    ('Hello', 1),
+    ('Hello world', 2),
+    ('What is the weather in Paris?', 7),
+    ('2024-07-29', 6),
+    ('get_weather_forecast', 6),
+    ('internationalization', 3),
+])
+def test_estimate_tokens(text, expected):
+    assert(estimate_tokens(text) == expected)
+
+
+def test_estimate_tokens_scales_with_text():
+    sentence = 'Returns the weather and temperature forecast for a specified date.'
+    assert(estimate_tokens(sentence) == 14)
+    assert(estimate_tokens(' '.join([sentence] * 10)) == 10 * 14)
+
+    # roughly 2.5-5 characters per token for English & JSON
+    markup = json.dumps({ 'name': 'get_weather_forecast', 'parameters': { 'lat': 37.7749, 'lon': -122.4194 } })
+    for text in (sentence, markup):
+        assert(2.5 <= len(text) / estimate_tokens(text) <= 5)
+
+
+def test_estimates_cache_bounded(monkeypatch):
+    import tokenprofiler
+
+    monkeypatch.setattr(tokenprofiler, 'max_estimated_chars', 100)
+    texts = [f'Message {i} of the conversation, with a few more words.' for i in range(10)]
+    assert([estimate_tokens(text) for text in texts] == [estimate_tokens(text) for text in texts])
+    assert(tokenprofiler._estimated_chars <= 100)
+    assert(texts[-1] in tokenprofiler._estimates and texts[0] not in tokenprofiler._estimates)
+
+    # text longer than the cache is not kept
+    assert(estimate_tokens(' word' * 100) == 100)
+    assert(' word' * 100 not in tokenprofiler._estimates)
+
+
+### Test RequestProfiler ###
+
+@pytest.mark.parametrize('tool_format', ['json', 'compact'])
+def test_profile_components(tool_util, tool_format):
+    markup = tool_util.render_tool_markup(tool_format)
+    messages = [
+        { 'role': 'system', 'content': f'You are a helpful assistant.\n\nTools:\n{markup}' },
+        { 'role': 'user', 'content': 'Find an open port' },
+        { 'role': 'assistant', 'content': '{"name": "connect_to_next_port", "parameters": {"minimum": 8080}}' },
+        { 'role': 'user', 'content': '8081' },
+        { 'role': 'user', 'content': json.dumps({ 'port': 8081, 'host': 'localhost' }) },
+    ]
+    profile = RequestProfiler(tool_util, tool_format).profile(messages)
+
+    assert(profile['tools'] == estimate_tokens(markup) > 0)
+    assert(profile['template'] == estimate_tokens(messages[0]['content']) - profile['tools'])
+    assert(set(profile['tool_schemas']) == { 'hello_doc', 'connect_to_next_port' })
+    assert(len(profile['tool_response_sizes']) == 2)
+    assert(profile['history'] == estimate_tokens(messages[1]['content']) + estimate_tokens(messages[2]['content']))
+    assert(profile['total'] == (profile['template'] + profile['tools'] + profile['history']
+                                + profile['tool_responses'] + message_overhead * len(messages)))
+    assert(profile['exceeded'] == [])
+
+
+def test_profile_without_tools():
+    profile = RequestProfiler().profile([{ 'role': 'system', 'content': 'Be brief.' }])
+    assert(profile['tools'] == 0)
+    assert(profile['tool_schemas'] == {})
+    assert(profile['template'] == estimate_tokens('Be brief.'))
+
+
+def test_tool_markup_rendered_per_snapshot(tool_util, monkeypatch):
+    from fixture_functions import three_args_yes_type_yes_return
+
+    renders = []
+    render_tool_markup = tool_util.render_tool_markup
+    monkeypatch.setattr(tool_util, 'render_tool_markup', lambda tool_format: renders.append(tool_format) or render_tool_markup(tool_format))
+    profiler = RequestProfiler(tool_util)
+    messages = [{ 'role': 'system', 'content': render_tool_markup() }]
+
+    assert(profiler.profile(messages) == profiler.profile(messages))
+    assert(len(renders) == 1)
+
+    # registering a tool renders markup again
+    tool_util.llm_tool(three_args_yes_type_yes_return)
+    messages = [{ 'role': 'system', 'content': render_tool_markup() }]
+    assert('three_args_yes_type_yes_return' in profiler.profile(messages)['tool_schemas'])
+    assert(len(renders) == 2)
+
+
+def test_profile_budgets(tool_util):
+    messages = [
+        { 'role': 'system', 'content': tool_util.render_tool_markup() },
+        { 'role': 'user', 'content': json.dumps({ 'ports': list(range(8000, 8100)) }) },
+    ]
+    profiler = RequestProfiler(tool_util, budgets={ 'tools': 10_000, 'total': 50, 'tool_response': 50 })
+    assert(profiler.profile(messages)['exceeded'] == ['total', 'tool_response'])
+
+
+def test_client_profiles_requests(tool_util, caplog):
+    client = LLMClient(url='http://localhost', model='test', system_message=tool_util.render_tool_markup(),
+                       session=FakeHTTP(), profiler=RequestProfiler(tool_util, budgets={ 'total': 10_000 }))
+    with caplog.at_level(logging.WARNING):
+        assert(client.request('Hello') == 'Hi!')
+    assert(client.last_profile['history'] == 1)
+    assert(client.last_profile['exceeded'] == [])
+    assert('token budget' not in caplog.text)
+
+    client.profiler.budgets = { 'tools': 1 }
+    with caplog.at_level(logging.WARNING):
+        client.request('Hello again')
+    assert(client.last_profile['exceeded'] == ['tools'])
+    assert('exceeds token budget of tools' in caplog.text)
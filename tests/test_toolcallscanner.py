@@ -0,0 +1,84 @@
+import pytest
+from toolcallscanner import count_invalid_json, ToolCallScanner, find_json_objects, find_tool_calls
+
+weather_call = { "name": "get_weather_forecast", "parameters": { "lat": "51.5072", "lon": "-0.1278", "date": "2024-09-16" } }
+
+### Test find_tool_calls ###
+
+@pytest.mark.parametrize('response, expected', [
+    (
+        '{ "name": "get_weather_forecast", "parameters": { "lat": "51.5072", "lon": "-0.1278", "date": "2024-09-16" } }',
+        [weather_call]
+    ),
+    (
+        '```json\n{ "name": "get_weather_forecast", "parameters": { "lat": "51.5072", "lon": "-0.1278", "date": "2024-09-16" } }\n```',
+        [weather_call]
+    ),
+    (
+        'Let me check the forecast for you. { "name": "get_weather_forecast", "parameters": { "lat": "51.5072", "lon": "-0.1278", "date": "2024-09-16" } } I will get back shortly.',
+        [weather_call]
+    ),
+    (
+        'Use {braces} and { to write sets. {"name": "get_weather_forecast", "parameters": {"lat": "51.5072", "lon": "-0.1278", "date": "2024-09-16"}}',
+        [weather_call]
+    ),
+    (
+        '{"name": "a", "parameters": {"text": "a } brace \\" and quote {"}}\n{"name": "b", "parameters": {}}',
+        [{"name": "a", "parameters": {"text": "a } brace \" and quote {"}}, {"name": "b", "parameters": {}}]
+    ),
+    (
+        '{ "name": "get_top_gold_medal_winning_countries" }',
+        []
+    ),
+    (
+        'The first president of the United States was George Washington.',
+        []
+    ),
+    (
+        '{"name": "unterminated", "parameters": {',
+        []
+    )
+])
+
+def test_find_tool_calls(response:str, expected:list):
+    assert(find_tool_calls(response) == expected)
+
+
+def test_find_json_objects():
+    assert(find_json_objects('a {"x": 1} b {"y": [1, {"z": 2}]} c') == [{"x": 1}, {"y": [1, {"z": 2}]}])
+
+
+### Test incremental scanning ###
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 1000])
+
+def test_scanner_feed_chunks(chunk_size:int):
+    response = 'Sure!\n```json\n{"name": "a", "parameters": {"text": "esc \\\\ \\" }"}}\n```\n{"name": "b", "parameters": {}}'
+    scanner = ToolCallScanner()
+
+    found = []
+    for i in range(0, len(response), chunk_size):
+        found.extend(scanner.feed(response[i:i + chunk_size]))
+
+    assert(found == [{"name": "a", "parameters": {"text": "esc \\ \" }"}}, {"name": "b", "parameters": {}}])
+    assert(scanner.tool_calls == found)
+
+
+def test_count_invalid_json():
+    assert(count_invalid_json('{"name": "a", "parameters": {"x": 1,}}') == 1)
+    assert(count_invalid_json('{"name": "a", "parameters": {}} {not json}') == 0)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 5, 1000])
+
+def test_unterminated_string(chunk_size:int):
+    # `{"` in prose leaves a string open until the end of its line
+    response = 'Use {"name then:\n{"name": "a", "parameters": {}}\n'
+    scanner = ToolCallScanner()
+
+    found = []
+    for i in range(0, len(response), chunk_size):
+        found.extend(scanner.feed(response[i:i + chunk_size]))
+
+    assert(found == [{"name": "a", "parameters": {}}])
+    assert(scanner.invalid == 1)
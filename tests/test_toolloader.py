@@ -0,0 +1,78 @@
+import pytest
+import sys
+
+from docextractor import DocExtractor
+from llmtoolutil import _LLMToolUtil
+import toolloader
+
+tool_source = '''
+from datetime import datetime
+from llmtoolutil import llm_tool_util
+
+@llm_tool_util.llm_tool
+def add_days(day:datetime, days:int = 1) -> dict:
+    """
+    Add days to a date
+
+    day -- Date in YYYY-MM-DD format
+    days -- Number of days to add (default 1)
+    """
+    return { 'day': str(day), 'days': days + 1 }
+
+
+def not_a_tool(x:int) -> int:
+    return x
+'''
+
+
+class StubDocExtractor(DocExtractor):
+    """
+    Extract details without calling the LLM.
+    """
+    def get_func_details(self, doc:str) -> dict:
+        return {
+            'summary': 'Add days to a date',
+            'args': { 'day': 'Date in YYYY-MM-DD format', 'days': 'Number of days to add (default 1)' }
+        }
+
+
+@pytest.fixture
+def tool_package(tmp_path, monkeypatch):
+    package = tmp_path / 'lazy_tools_pkg'
+    package.mkdir()
+    (package / '__init__.py').write_text('')
+    (package / 'date_tool.py').write_text(tool_source)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield package
+    sys.modules.pop('lazy_tools_pkg.date_tool', None)
+    sys.modules.pop('lazy_tools_pkg', None)
+
+
+def test_scan_tool_module(tool_package):
+    tools = toolloader.scan_tool_module(str(tool_package / 'date_tool.py'), 'lazy_tools_pkg.date_tool')
+
+    assert([t.__name__ for t in tools] == ['add_days'])
+    sig = tools[0].__signature__
+    assert(list(sig.parameters) == ['day', 'days'])
+    assert(sig.parameters['days'].annotation is int and sig.parameters['days'].default == 1)
+    assert(sig.parameters['day'].annotation.__name__ == 'datetime')
+    assert(sig.return_annotation is dict)
+    assert(tools[0].__doc__.startswith('Add days to a date'))
+
+
+def test_register_lazy_tools(tool_package):
+    registry = _LLMToolUtil(StubDocExtractor())
+    tools = toolloader.register_lazy_tools(str(tool_package), 'lazy_tools_pkg', registry)
+
+    # registered from metadata, without importing module
+    assert([t.__name__ for t in tools] == ['add_days'])
+    assert('lazy_tools_pkg.date_tool' not in sys.modules)
+    assert(registry.generate_tool_markup()[0]['function']['parameters']['required'] == ['day'])
+
+    # module imported on first call & function bound, not registered again
+    response = registry.handle_tool_call('{"name": "add_days", "parameters": {"day": "2024-09-16", "days": "2"}}')
+    assert(response == { 'day': '2024-09-16', 'days': 3 })
+    assert('lazy_tools_pkg.date_tool' in sys.modules)
+    assert(tools[0].is_loaded)
+    assert(registry._tool_funcs['add_days'] is tools[0])
+    assert('lazy_tools_pkg.date_tool' in toolloader.import_report())
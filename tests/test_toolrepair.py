@@ -0,0 +1,110 @@
+import logging
+import pytest
+from fixture_functions import three_args_yes_type_yes_return
+from stub_extractor import stub_registry
+from toolrepair import NameIndex, ToolCallRepairer
+
+
+def get_weather_forecast(lat:float, lon:float, date:str) -> dict:
+    return { 'lat': lat, 'lon': lon, 'date': date }
+
+
+def get_weather_forecasts(locations:list, start_date:str, end_date:str) -> dict:
+    return { 'locations': locations }
+
+
+def get_current_weather(lat:float, lon:float, **options) -> dict:
+    return { 'lat': lat, 'lon': lon, **options }
+
+
+funcs = {
+    'get_weather_forecast': get_weather_forecast,
+    'get_weather_forecasts': get_weather_forecasts,
+    'get_current_weather': get_current_weather,
+}
+
+
+### Test NameIndex ###
+
+@pytest.mark.parametrize('name, expected', [
+    ('get_weather_forecast', ['get_weather_forecast']),
+    ('get_wether_forecast', ['get_weather_forecast']),
+    ('Get-Weather-Forecasts', ['get_weather_forecasts']),
+    ('get_weather_forecastz', ['get_weather_forecast', 'get_weather_forecasts']),
+    ('get_current_temperature', []),
+])
+def test_closest(name, expected):
+    assert(NameIndex(list(funcs)).closest(name) == expected)
+
+
+def test_closest_short_names():
+    index = NameIndex(['lat', 'lon', 'date'])
+    assert(index.closest('lng') == [])
+    assert(index.closest('dte') == ['date'])
+    assert(index.closest('late') == ['lat', 'date'])
+    assert(index.closest('data', exclude={ 'date' }) == [])
+
+
+### Test ToolCallRepairer ###
+
+@pytest.mark.parametrize('call, expected', [
+    (
+        { 'name': 'get_wether_forecast', 'parameters': { 'lat': 1, 'lon': 2, 'date': '2024-09-06' } },
+        { 'name': 'get_weather_forecast', 'parameters': { 'lat': 1, 'lon': 2, 'date': '2024-09-06' } },
+    ),
+    (
+        { 'name': 'get_weather_forecasts', 'parameters': { 'locations': [], 'start_dat': 'a', 'endDate': 'b' } },
+        { 'name': 'get_weather_forecasts', 'parameters': { 'locations': [], 'start_date': 'a', 'end_date': 'b' } },
+    ),
+    (
+        # unknown parameter is dropped
+        { 'name': 'get_weather_forecast', 'parameters': { 'lat': 1, 'lon': 2, 'date': 'a', 'units': 'metric' } },
+        { 'name': 'get_weather_forecast', 'parameters': { 'lat': 1, 'lon': 2, 'date': 'a' } },
+    ),
+    (
+        # ambiguous tool name is kept
+        { 'name': 'get_weather_forecastz', 'parameters': { 'lat': 1 } },
+        { 'name': 'get_weather_forecastz', 'parameters': { 'lat': 1 } },
+    ),
+    (
+        # ambiguous parameter is kept, & parameters of tools with **kwargs
+        { 'name': 'get_weather_forecast', 'parameters': { 'late': 1, 'lon': 2 } },
+        { 'name': 'get_weather_forecast', 'parameters': { 'late': 1, 'lon': 2 } },
+    ),
+    (
+        { 'name': 'get_current_weather', 'parameters': { 'lat': 1, 'lon': 2, 'units': 'metric' } },
+        { 'name': 'get_current_weather', 'parameters': { 'lat': 1, 'lon': 2, 'units': 'metric' } },
+    ),
+])
+def test_repair(call, expected):
+    assert(ToolCallRepairer(funcs).repair(call) == expected)
+
+
+def test_repair_is_logged(caplog):
+    call = { 'id': 'call_1', 'name': 'get_wether_forecast', 'parameters': { 'lat': 1, 'lng': 2, 'lon': 2, 'dates': 'a' } }
+    with caplog.at_level(logging.INFO):
+        repaired = ToolCallRepairer(funcs).repair(call)
+
+    assert(repaired == { 'id': 'call_1', 'name': 'get_weather_forecast', 'parameters': { 'lat': 1, 'lon': 2, 'date': 'a' } })
+    assert(call['name'] == 'get_wether_forecast')
+    assert(caplog.messages == [
+        'Repaired tool call: tool `get_wether_forecast` -> `get_weather_forecast`',
+        'Repaired tool call: dropped unknown parameter `lng` of `get_weather_forecast`',
+        'Repaired tool call: parameter `dates` -> `date` of `get_weather_forecast`',
+    ])
+
+
+### Test repair in registry ###
+
+def test_registry_repairs_calls():
+    registry = stub_registry(three_args_yes_type_yes_return)
+
+    call = '{ "name": "three_args_yes_type_yes_returns", "parameters": { "some_strin": "a", "some_other_string": "b", "glu": 2 } }'
+    assert(registry.can_handle_tool_call(call))
+    assert(registry.handle_tool_call(call) == 3)
+
+    # invalid, not repairable, arguments are rejected instead of raising
+    assert(registry.handle_tool_call('{ "name": "three_args_yes_type_yes_return", "parameters": { "some_string": "a" } }') is None)
+    assert(registry._invoke_tool({ 'name': 'unknown_tool', 'parameters': {} }) is None)
+    assert(registry._invoke_tool({ 'name': 'three_args_yes_type_yes_return',
+                                   'parameters': { 'some_string': 'a', 'some_other_string': 'b', 'extra': 1 } }) is None)
@@ -0,0 +1,162 @@
+import json
+import os
+import pytest
+import sys
+
+from docextractor import DocExtractor
+from llmtoolutil import _LLMToolUtil
+from toolloader import register_lazy_tools
+from toolwatcher import ToolWatcher
+
+tool_source = '''
+from llmtoolutil import llm_tool_util
+
+@llm_tool_util.llm_tool
+def add(a:int, b:int) -> int:
+    """
+    Add two numbers
+
+    a -- First number
+    b -- Second number
+    """
+    return a + b
+
+
+@llm_tool_util.llm_tool
+def negate(a:int) -> int:
+    """
+    Negate a number
+
+    a -- Number
+    """
+    return -a
+'''
+
+
+class CountingDocExtractor(DocExtractor):
+    """
+    Extract details without calling the LLM, counting extractions.
+    """
+    def __init__(self):
+        super().__init__()
+        self.extracted = []
+
+    def get_func_details(self, doc:str) -> dict:
+        self.extracted.append(doc.splitlines()[0])
+        lines = [line.split(' -- ') for line in doc.splitlines()[1:] if ' -- ' in line]
+        return { 'summary': doc.splitlines()[0], 'args': dict(lines) }
+
+
+def write(path, source):
+    # bump modification time, even if rewritten within the same clock tick
+    mtime = os.stat(path).st_mtime_ns + 1_000_000_000 if path.exists() else None
+    path.write_text(source)
+    if mtime is not None:
+        os.utime(path, ns=(mtime, mtime))
+
+
+@pytest.fixture
+def watched(tmp_path, monkeypatch):
+    package = tmp_path / 'watched_tools_pkg'
+    package.mkdir()
+    (package / '__init__.py').write_text('')
+    write(package / 'math_tool.py', tool_source)
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    extractor = CountingDocExtractor()
+    registry = _LLMToolUtil(extractor)
+    register_lazy_tools(str(package), 'watched_tools_pkg', registry)
+    changes = []
+    watcher = ToolWatcher(str(package), 'watched_tools_pkg', registry, on_change=changes.append)
+    extractor.extracted.clear()
+
+    yield (package, registry, extractor, watcher, changes)
+    sys.modules.pop('watched_tools_pkg.math_tool', None)
+    sys.modules.pop('watched_tools_pkg.other_tool', None)
+    sys.modules.pop('watched_tools_pkg', None)
+
+
+def call(registry, name, **params):
+    return registry.handle_tool_call(json.dumps({ 'name': name, 'parameters': params }))
+
+
+def test_unchanged(watched):
+    (package, registry, extractor, watcher, changes) = watched
+    assert(watcher.poll() == { 'registered': [], 'rebound': [], 'failed': [], 'unregistered': [] })
+    assert(changes == [])
+
+
+def test_changed_body_is_rebound(watched):
+    (package, registry, extractor, watcher, changes) = watched
+    assert(call(registry, 'add', a=1, b=2) == 3)
+    markup = registry.generate_tool_markup()
+
+    write(package / 'math_tool.py', tool_source.replace('return a + b', 'return a + b + 100'))
+    assert(watcher.poll()['rebound'] == ['add', 'negate'])
+
+    # details are not extracted again, & new code is imported on next call
+    assert(extractor.extracted == [])
+    assert(registry.generate_tool_markup() == markup)
+    assert(call(registry, 'add', a=1, b=2) == 103)
+    assert(call(registry, 'negate', a=1) == -1)
+    assert(len(changes) == 1)
+
+
+def test_changed_doc_is_registered(watched):
+    (package, registry, extractor, watcher, changes) = watched
+    write(package / 'math_tool.py', tool_source.replace('Negate a number', 'Flip the sign of a number'))
+
+    assert(watcher.poll() == { 'registered': ['negate'], 'rebound': ['add'], 'failed': [], 'unregistered': [] })
+    assert(extractor.extracted == ['Flip the sign of a number'])
+    descriptions = [tool['function']['description'] for tool in registry.generate_tool_markup()]
+    assert(descriptions == ['Add two numbers', 'Flip the sign of a number'])
+
+
+def test_added_and_removed_tools(watched):
+    (package, registry, extractor, watcher, changes) = watched
+    write(package / 'math_tool.py', tool_source[:tool_source.index('@llm_tool_util.llm_tool\ndef negate')])
+    write(package / 'other_tool.py', tool_source.replace('def add(', 'def add_more('))
+
+    result = watcher.poll()
+    assert(result['unregistered'] == ['negate'])
+    assert(sorted(result['registered']) == ['add_more', 'negate'])
+    assert(set(registry._tool_funcs) == { 'add', 'add_more', 'negate' })
+    assert(registry._tool_funcs['negate'].__module__ == 'watched_tools_pkg.other_tool')
+
+    (package / 'other_tool.py').unlink()
+    assert(sorted(watcher.poll()['unregistered']) == ['add_more', 'negate'])
+    assert(set(registry._tool_funcs) == { 'add' })
+
+
+def test_invalid_source_keeps_tools(watched):
+    (package, registry, extractor, watcher, changes) = watched
+    write(package / 'math_tool.py', tool_source + '\ndef broken(:\n')
+
+    assert(watcher.poll()['unregistered'] == [])
+    assert(set(registry._tool_funcs) == { 'add', 'negate' })
+
+    write(package / 'math_tool.py', tool_source)
+    assert(watcher.poll()['rebound'] == ['add', 'negate'])
+
+
+def test_failed_registration_keeps_tool(watched, monkeypatch):
+    from llmtoolutil import llm_tool_util
+
+    (package, registry, extractor, watcher, changes) = watched
+    # tool modules register with the shared registry when not claimed
+    monkeypatch.setattr(llm_tool_util, '_doc_extractor', extractor)
+    assert(call(registry, 'negate', a=1) == -1)
+    previous = registry._tool_funcs['negate']
+
+    # new details of `negate` are invalid, missing its argument
+    write(package / 'math_tool.py', tool_source.replace('    a -- Number\n', '').replace('return -a', 'return -a * 10'))
+    assert(watcher.poll()['failed'] == ['negate'])
+    assert(registry._tool_funcs['negate'] is previous)
+
+    # importing the module for `add` does not register `negate` again, which
+    # keeps the code it was loaded with
+    extractor.extracted.clear()
+    assert(call(registry, 'add', a=1, b=2) == 3)
+    assert(extractor.extracted == [])
+    assert(registry._tool_funcs['negate'] is previous)
+    assert(call(registry, 'negate', a=1) == -1)
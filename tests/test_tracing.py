@@ -0,0 +1,80 @@
+import json
+import pytest
+from llmclient import LLMClient
+from tracing import Tracer
+
+
+class FakeResponse:
+    status_code = 200
+
+    def json(self):
+        return { 'choices': [{ 'message': { 'content': 'Hi!' } }],
+                 'usage': { 'prompt_tokens': 12, 'completion_tokens': 3 } }
+
+
+class FakeHTTP:
+    def post(self, url, headers, json, timeout):
+        return FakeResponse()
+
+
+def read_spans(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer()
+    with tracer.span('a', key='value') as span:
+        span.set(more=1)
+    assert(span.recording == False)
+    assert(tracer.span('b') is span)
+
+
+def test_nested_spans(tmp_path):
+    path = tmp_path / 'traces.jsonl'
+    tracer = Tracer()
+    tracer.enable(str(path))
+
+    with tracer.span('parent', session_id='s1') as parent:
+        with tracer.span('child') as child:
+            child.set(tool='get_weather_forecast')
+    with tracer.span('other'):
+        pass
+    tracer.disable()
+
+    (child, parent, other) = read_spans(path)
+    assert(child['parent_id'] == parent['span_id'])
+    assert(child['trace_id'] == parent['trace_id'] != other['trace_id'])
+    assert(parent['parent_id'] is None)
+    assert(child['attributes'] == { 'tool': 'get_weather_forecast' })
+    assert(parent['seconds'] >= child['seconds'])
+
+
+def test_span_records_error(tmp_path):
+    path = tmp_path / 'traces.jsonl'
+    tracer = Tracer()
+    tracer.enable(str(path))
+
+    with pytest.raises(KeyError):
+        with tracer.span('failing'):
+            raise KeyError('glue')
+    tracer.disable()
+
+    assert(read_spans(path)[0]['error'] == "KeyError: 'glue'")
+
+
+def test_llm_request_span(tmp_path, monkeypatch):
+    import llmclient
+
+    path = tmp_path / 'traces.jsonl'
+    tracer = Tracer()
+    monkeypatch.setattr(llmclient, 'tracer', tracer)
+    tracer.enable(str(path))
+
+    client = LLMClient(url='', model='llama-3.1-70b-versatile', system_message='', session=FakeHTTP())
+    assert(client.request('Hello') == 'Hi!')
+    tracer.disable()
+
+    span = read_spans(path)[0]
+    assert(span['name'] == 'llm.request')
+    assert(span['attributes'] == { 'model': 'llama-3.1-70b-versatile', 'messages': 2, 'status': 200,
+                                   'prompt_tokens': 12, 'completion_tokens': 3 })
@@ -0,0 +1,51 @@
+import pytest
+from gazetteer import build_index
+from tools import geocode_tool
+from tools.geocode_tool import geocode
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    path = tmp_path / 'gazetteer.idx'
+    build_index([
+        { 'geonameid': 2643743, 'name': 'London', 'names': { 'London' }, 'country': 'GB', 'admin1': 'ENG',
+          'lat': 51.50853, 'lon': -0.12574, 'population': 8961989 },
+        { 'geonameid': 6058560, 'name': 'London', 'names': { 'London' }, 'country': 'CA', 'admin1': '08',
+          'lat': 42.98339, 'lon': -81.23304, 'population': 346765 },
+        { 'geonameid': 2988507, 'name': 'Paris', 'names': { 'Paris' }, 'country': 'FR', 'admin1': '11',
+          'lat': 48.85341, 'lon': 2.3488, 'population': 2138551 },
+        { 'geonameid': 4717560, 'name': 'Paris', 'names': { 'Paris' }, 'country': 'US', 'admin1': 'TX',
+          'lat': 33.66094, 'lon': -95.55551, 'population': 24782 },
+        { 'geonameid': 4409896, 'name': 'Springfield', 'names': { 'Springfield' }, 'country': 'US', 'admin1': 'MO',
+          'lat': 37.21533, 'lon': -93.29824, 'population': 169176 },
+        { 'geonameid': 4250542, 'name': 'Springfield', 'names': { 'Springfield' }, 'country': 'US', 'admin1': 'IL',
+          'lat': 39.80172, 'lon': -89.64371, 'population': 114394 },
+    ], str(path))
+    monkeypatch.setattr(geocode_tool, 'index_path', str(path))
+    monkeypatch.setattr(geocode_tool, '_gazetteer', None)
+    yield path
+    geocode_tool._gazetteer.close()
+
+
+def test_geocode(index):
+    res = geocode('London')
+    assert([(p['country'], p['lat'], p['lon']) for p in res['places']] == [('GB', 51.50853, -0.12574), ('CA', 42.98339, -81.23304)])
+    assert([p['region'] for p in geocode('london, ca')['places']] == ['08'])
+    assert(geocode('Lodnon')['places'][0]['country'] == 'GB')
+    assert('error' in geocode('Atlantis'))
+
+
+def test_geocode_qualifiers(index):
+    # country by name, & region codes, ex: `IL` is Illinois, not Israel
+    assert([p['country'] for p in geocode('Paris, France')['places']] == ['FR'])
+    assert([p['region'] for p in geocode('Paris, TX')['places']] == ['TX'])
+    assert([p['region'] for p in geocode('Springfield, IL')['places']] == ['IL'])
+    assert([p['region'] for p in geocode('Springfield, IL, USA')['places']] == ['IL'])
+    assert([p['region'] for p in geocode('Springfield, Greene County')['places']] == ['MO', 'IL'])
+    assert(geocode('Kondon, UK')['places'][0]['country'] == 'GB')
+
+
+def test_geocode_without_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(geocode_tool, 'index_path', str(tmp_path / 'missing.idx'))
+    monkeypatch.setattr(geocode_tool, '_gazetteer', None)
+    assert('error' in geocode('London'))
@@ -1,7 +1,10 @@
 import pytest
 import datetime
-from tools.weather_tool import get_weather_forecast
+import json
+from tools import weather_tool
+from tools.weather_tool import get_current_weather, get_weather_forecast, get_weather_forecasts
 
+@pytest.mark.live
 @pytest.mark.parametrize('args, expected_date', [
     (
         (37.7749, -122.4194, 1), # SF
@@ -36,3 +39,110 @@ def test_weather_forecast(args, expected_date):
     forecast = res.get('forecast')
     assert('date' in forecast and 'temperature' in forecast and 'precipitation' in forecast and 'wind_speed' in forecast)
     assert(forecast.get('date') == expected_date)
+
+
+@pytest.mark.live
+def test_current_weather():
+    res = get_current_weather(37.7749, -122.4194)
+    assert('temperature' in res['weather'] and 'precipitation' in res['weather'] and 'wind_speed' in res['weather'])
+
+
+@pytest.mark.live
+def test_weather_forecasts():
+    start = datetime.datetime.today()
+    end = start + datetime.timedelta(days=2)
+    dates = [(start + datetime.timedelta(days=i)).strftime('%Y-%m-%d') for i in range(3)]
+
+    res = get_weather_forecasts([[37.7749, -122.4194], [51.5072, -0.1278]], dates[0], dates[-1])
+    assert(len(res['forecasts']) == 2)
+    for forecast in res['forecasts']:
+        assert([day['date'] for day in forecast['days']] == dates)
+        day = forecast['days'][0]
+        assert(day['temperature']['min'] <= day['temperature']['p50'] <= day['temperature']['max'])
+        assert('total' in day['precipitation'])
+
+
+### Test batching & aggregation, without Open-Meteo ###
+
+class FakeResponse:
+    def __init__(self, res_json):
+        self.res_json = res_json
+
+    def json(self):
+        return self.res_json
+
+
+def hourly_forecast(temperatures:list) -> dict:
+    times = [f'2024-07-{29 + i // 24}T{i % 24:02}:00' for i in range(len(temperatures))]
+    return {
+        'hourly_units': { 'temperature_2m': '°F', 'precipitation': 'inch', 'wind_speed_10m': 'mp/h' },
+        'hourly': {
+            'time': times,
+            'temperature_2m': temperatures,
+            'precipitation': [0.1] * len(temperatures),
+            'wind_speed_10m': [5.0] * len(temperatures),
+        }
+    }
+
+
+def test_forecasts_single_request(monkeypatch):
+    urls = []
+    def get(url):
+        urls.append(url)
+        return FakeResponse([hourly_forecast([50.0] * 48), hourly_forecast([60.0] * 48)])
+    monkeypatch.setattr(weather_tool.requests, 'get', get)
+
+    res = get_weather_forecasts([[37.7749, -122.4194], [51.5072, -0.1278]], '2024-07-29', '2024-07-30')
+    assert(len(urls) == 1)
+    assert('latitude=37.7749%2C51.5072' in urls[0] and 'longitude=-122.4194%2C-0.1278' in urls[0])
+    assert(res['forecasts'][0]['days'][1]['date'] == '2024-07-30')
+    assert([f['days'][1]['temperature']['mean'] for f in res['forecasts']] == [50.0, 60.0])
+    assert(res['forecasts'][1]['units']['wind_speed'] == 'mp/h')
+
+
+def test_forecasts_result_policy(monkeypatch):
+    from resultpolicy import ResultPolicy
+
+    # 16 days, the longest forecast range
+    monkeypatch.setattr(weather_tool.requests, 'get', lambda url: FakeResponse(hourly_forecast([50.0] * 24 * 16)))
+    res = get_weather_forecasts([[37.7749, -122.4194]], '2024-07-29', '2024-08-13')
+    assert(len(res['forecasts'][0]['days']) == 16)
+
+    (compacted, _) = ResultPolicy(max_items=7).apply(res)
+    days = compacted['forecasts'][0]['days']
+    assert(days[:7] == res['forecasts'][0]['days'][:7])
+    assert(days[7] == '... 9 more items, 16 in total')
+
+    (compacted, _) = ResultPolicy(max_chars=len(json.dumps(res)) // 2).apply(res)
+    assert('preview' not in compacted and len(compacted['forecasts'][0]['days']) < 16)
+
+
+def test_daily_aggregates():
+    temperatures = [float(i) for i in range(24)] + [None] * 23 + [70.0]
+    days = weather_tool.daily_aggregates(hourly_forecast(temperatures))
+
+    assert(list(days) == ['2024-07-29', '2024-07-30'])
+    assert(days['2024-07-29']['temperature_2m'] == { 'min': 0.0, 'max': 23.0, 'mean': 11.5, 'p10': 2.3, 'p50': 11.5, 'p90': 20.7 })
+    assert(days['2024-07-30']['temperature_2m']['p50'] == 70.0)
+    assert(days['2024-07-29']['precipitation']['total'] == 2.4)
+
+
+
+def test_missing_values(monkeypatch):
+    forecast = hourly_forecast([None] * 24)
+    monkeypatch.setattr(weather_tool.requests, 'get', lambda url: FakeResponse(forecast))
+
+    res = get_weather_forecast(37.7749, -122.4194, '2024-07-29')
+    assert(res['forecast']['temperature'] is None)
+    assert(res['forecast']['precipitation'] == '0.1 - 0.1 inch')
+    assert(weather_tool.daily_aggregates(forecast)['2024-07-29']['temperature_2m'] ==
+           { 'min': None, 'max': None, 'mean': None, 'p10': None, 'p50': None, 'p90': None })
+
+    # no hours, ex: date out of forecast range
+    monkeypatch.setattr(weather_tool.requests, 'get', lambda url: FakeResponse(hourly_forecast([])))
+    assert('error' in get_weather_forecast(37.7749, -122.4194, '2024-07-29'))
+
+
+def test_invalid_locations():
+    with pytest.raises(ValueError):
+        weather_tool.fetch_weather([37.7749, -122.4194])